@@ -12,24 +12,72 @@ IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
 or implied. 
 """
 
+# Annotations aren't evaluated at import time, as dnacentersdk is imported on first use
+from __future__ import annotations
+
 # Import Section
+import contextvars
+import csv
+import hashlib
+import io
+import json
+import logging
 import os
+import pickle
+import queue
+import random
 import re
 import secrets
+import socket
+import sqlite3
 import string
 import sys
-from datetime import datetime
-from time import sleep
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from itertools import count
+from math import ceil
+from time import monotonic, sleep, time
+
+# App startup is timed from here, & reported once ready
+BOOT_START = time()
 
 import yaml
-from dnacentersdk import api
-from dnacentersdk.exceptions import ApiError
 from dotenv import load_dotenv
-from flask import Flask, redirect, render_template, request, session
+from flask import Flask, Response, g, redirect, render_template, request, session
+from flask.logging import default_handler
 from jinja2 import Environment, FileSystemLoader
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
 
 from flask_session import Session
 
+
+class SDKNotLoaded(Exception):
+    """
+    Stands in for dnacentersdk exceptions until the SDK is imported by loadSDK()
+    """
+
+
+# dnacentersdk takes longer to import than the rest of the app together, so it's only
+# imported when the first DNAC client is created.
+# Its exceptions can't be raised before then
+api = None
+ApiError = RateLimitError = dnacentersdkException = SDKNotLoaded
+# Seconds taken by each phase of startup, reported at /metrics & /cache-stats
+boot_timings = {"imports": time() - BOOT_START}
+
 # Load environment variables
 load_dotenv()
 CUSTOMER_NAME = os.getenv("CUSTOMER_NAME", "Cisco Catalyst Center")
@@ -37,10 +85,10 @@ CUSTOMER_NAME = os.getenv("CUSTOMER_NAME", "Cisco Catalyst Center")
 # SINGLEAUTH mode means that the credentials used to log into the web app are also used to push templates to DNA Center.
 # MULTIAUTH mode allows users with DNAC read-only API access to use this app by providing a separate API write credential
 APP_MODE = os.getenv("APP_MODE", "SINGLEAUTH")
+DNAC_USER = os.getenv("DNAC_USER")
+DNAC_PASS = os.getenv("DNAC_PASS")
 if APP_MODE == "MULTIAUTH":
     print("INFO: App running in multi-auth mode")
-    DNAC_USER = os.getenv("DNAC_USER")
-    DNAC_PASS = os.getenv("DNAC_PASS")
     if not DNAC_USER or not DNAC_PASS:
         print(
             "ERROR: If multiple authentication is enabled, "
@@ -51,27 +99,652 @@ if APP_MODE == "MULTIAUTH":
 else:
     print("INFO: App running in single-auth mode")
 
+# The JSON API under /api/v1 is enabled by API_TOKENS, a comma separated list of
+# <client name>:<token>. Clients send "Authorization: Bearer <token>", and API jobs
+# are provisioned using DNAC_USER & DNAC_PASS, with up to API_JOB_CONCURRENCY at once
+API_TOKENS = {}
+for api_token in os.getenv("API_TOKENS", "").split(","):
+    api_client, _, api_token = api_token.strip().partition(":")
+    if api_client and api_token:
+        API_TOKENS[api_token] = api_client
+API_JOB_CONCURRENCY = int(os.getenv("API_JOB_CONCURRENCY", "2"))
+if API_TOKENS and (not DNAC_USER or not DNAC_PASS):
+    print(
+        "ERROR: If the API is enabled, then DNA center credentials must be "
+        + "provided via DNAC_USER and DNAC_PASS environment variables."
+    )
+    sys.exit(1)
+
+# With WARMUP enabled & DNAC_USER / DNAC_PASS set, the app authenticates to each server,
+# looks up template project IDs & loads switch inventory in the background at startup
+WARMUP = os.getenv("WARMUP", "true").lower() == "true"
+
+# Device detail lookups (location, etc) are issued concurrently during device search.
+# DETAIL_CONCURRENCY caps how many lookups run at once, and DETAIL_TIMEOUT is the
+# number of seconds a single lookup may take before its result is skipped.
+DETAIL_CONCURRENCY = int(os.getenv("DETAIL_CONCURRENCY", "10"))
+DETAIL_TIMEOUT = float(os.getenv("DETAIL_TIMEOUT", "15"))
+
+# Catalyst Center access tokens are valid for 60 minutes by default.
+# Shared API clients refresh their token TOKEN_REFRESH_MARGIN seconds before expiry.
+TOKEN_LIFETIME = int(os.getenv("TOKEN_LIFETIME", "3600"))
+TOKEN_REFRESH_MARGIN = int(os.getenv("TOKEN_REFRESH_MARGIN", "300"))
+
+# Catalyst Center API calls are limited to DNAC_RATE_LIMIT requests per second
+# (with bursts of up to DNAC_RATE_BURST) for each server & username, per web app
+# process. Set DNAC_RATE_LIMIT to 0 to disable.
+# Rate limited (429) calls are retried after Retry-After. Server errors & connection
+# failures are retried with backoff starting at DNAC_RETRY_BACKOFF seconds, except for
+# deployments. Calls are retried up to DNAC_MAX_RETRIES times
+DNAC_RATE_LIMIT = float(os.getenv("DNAC_RATE_LIMIT", "20"))
+DNAC_RATE_BURST = int(os.getenv("DNAC_RATE_BURST", "20"))
+DNAC_MAX_RETRIES = int(os.getenv("DNAC_MAX_RETRIES", "4"))
+DNAC_RETRY_BACKOFF = float(os.getenv("DNAC_RETRY_BACKOFF", "0.5"))
+
+# With COALESCE_READS enabled, identical DNAC GET requests made at the same time
+# (same server, endpoint & parameters) share a single request & its response
+COALESCE_READS = os.getenv("COALESCE_READS", "true").lower() == "true"
+
+# DNAC tasks (template create / update / commit) are polled until complete.
+# Polling starts every TASK_POLL_INTERVAL seconds, backing off to at most 2 seconds,
+# and gives up after TASK_TIMEOUT seconds.
+TASK_POLL_INTERVAL = float(os.getenv("TASK_POLL_INTERVAL", "0.25"))
+TASK_TIMEOUT = float(os.getenv("TASK_TIMEOUT", "60"))
+
+# In-flight template deployments are tracked by a single background thread.
+# Every TRACKER_INTERVAL seconds, it checks up to TRACKER_BATCH deployments,
+# with at most TRACKER_CONCURRENCY status requests to DNAC at once.
+# Deployments still in progress after TRACKER_TIMEOUT seconds are marked as failed.
+TRACKER_INTERVAL = float(os.getenv("TRACKER_INTERVAL", "3"))
+TRACKER_BATCH = int(os.getenv("TRACKER_BATCH", "100"))
+TRACKER_CONCURRENCY = int(os.getenv("TRACKER_CONCURRENCY", "5"))
+TRACKER_TIMEOUT = int(os.getenv("TRACKER_TIMEOUT", "3600"))
+
+# The status page & API clients long-poll for deployment status changes. Each poll
+# waits up to LONG_POLL_TIMEOUT seconds for a change, so it only holds a web thread
+# for a few seconds, however long the deployment takes
+LONG_POLL_TIMEOUT = float(os.getenv("LONG_POLL_TIMEOUT", "5"))
+
+# By default, templates are deleted from DNAC once successfully deployed.
+# With KEEP_TEMPLATES enabled they are kept, so that deploying the same
+# configuration again can skip straight to deployment.
+KEEP_TEMPLATES = os.getenv("KEEP_TEMPLATES", "false").lower() == "true"
+
+# With PORT_RANGES enabled, contiguous ports assigned to the same VLAN are configured
+# together using "interface range", rather than one interface at a time.
+# Note: port.jinja2 is rendered with interface_name set to "range <ports>"
+PORT_RANGES = os.getenv("PORT_RANGES", "false").lower() == "true"
+
+# Templates created for each author are deleted in the background by the template
+# reaper, once unused for TEMPLATE_RETENTION seconds & not part of a deployment in
+# progress. The reaper runs every TEMPLATE_REAP_INTERVAL seconds, deleting up to
+# TEMPLATE_REAP_BATCH templates per server. KEEP_TEMPLATES disables deletion
+TEMPLATE_RETENTION = int(os.getenv("TEMPLATE_RETENTION", "300"))
+TEMPLATE_REAP_INTERVAL = int(os.getenv("TEMPLATE_REAP_INTERVAL", "300"))
+TEMPLATE_REAP_BATCH = int(os.getenv("TEMPLATE_REAP_BATCH", "50"))
+
+# With PARAMETERIZED_TEMPLATES enabled, one template per device series is committed
+# once, with VLANs & ports as Velocity variables rendered from config_templates/.
+# Deployments then only set the variables for each device, rather than uploading
+# a new template.
+# A new template version is committed whenever config_templates/ changes
+PARAMETERIZED_TEMPLATES = (
+    os.getenv("PARAMETERIZED_TEMPLATES", "false").lower() == "true"
+)
+
+# With DIFF_CONFIG enabled, each device's running config is checked before deploying,
+# & only VLANs / ports which need to change are deployed. Devices with nothing to change
+# are skipped. Running config is cached until the device changes in DNAC
+DIFF_CONFIG = os.getenv("DIFF_CONFIG", "true").lower() == "true"
+
+# Device inventory & interface data is shared by all sessions. By default this is kept
+# in memory, or STATE_DB may point to a SQLite database to share it between processes
+STATE_DB = os.getenv("STATE_DB")
+
+# Deployments & API jobs are recorded in the SQLite database at JOB_DB, so they can be
+# resumed after a restart & reviewed on the history page. Deployments left in progress
+# by a stopped process are taken over by another process after JOB_ORPHAN_TIMEOUT
+# seconds
+JOB_DB = os.getenv("JOB_DB", "deployments.db")
+JOB_ORPHAN_TIMEOUT = int(os.getenv("JOB_ORPHAN_TIMEOUT", "60"))
+
+# Device interfaces are looked up in the background as soon as devices are selected,
+# as well as for the first PREFETCH_LIMIT devices in each search result
+PREFETCH_LIMIT = int(os.getenv("PREFETCH_LIMIT", "10"))
+
+# Device search results are shown SEARCH_PAGE_SIZE devices at a time
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "100"))
+
+# With FEDERATED_SEARCH enabled, users may search all servers in dna-servers.yaml
+# at once, using the same credentials on each server. Servers which can't be searched
+# within FEDERATED_TIMEOUT seconds are left out of the results
+FEDERATED_SEARCH = os.getenv("FEDERATED_SEARCH", "false").lower() == "true"
+FEDERATED_TIMEOUT = float(os.getenv("FEDERATED_TIMEOUT", "10"))
+
+# App log level, and log format - either plain text or json.
+# JSON logs include a trace ID, which is shared by all log lines of a provisioning run
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
 
 # Load target DNAC Servers from config YAML
-with open("./dna-servers.yaml") as config:
+DNA_SERVERS_FILE = os.getenv("DNA_SERVERS_FILE", "./dna-servers.yaml")
+with open(DNA_SERVERS_FILE) as config:
     try:
         dnac_config = yaml.safe_load(config)
     except yaml.YAMLError as e:
         print(f"Error loading dna-servers.yaml: {e}")
         sys.exit(1)
 
+# Interfaces offered for provisioning are selected by port name pattern.
+# Patterns may be set for each device platform in dna-servers.yaml. Otherwise, all
+# Ethernet ports numbered member/module/port are offered, on every stack member &
+# network module - which skips the management interface, and AppGig interface
+interface_config = dnac_config.get("interfaces") or {}
+default_port_pattern = re.compile(
+    interface_config.get("default", r"^(?!App)[A-Za-z]*(Ethernet|GigE)\d+/\d+/\d+$")
+)
+platform_port_patterns = [
+    (re.compile(platform["platform"]), re.compile(platform["ports"]))
+    for platform in interface_config.get("platforms") or []
+]
+
 # Load Jinja config templates
-conf_templates = Environment(loader=FileSystemLoader("config_templates/"))
+# Templates are compiled once & cached, so changes require an app restart
+conf_templates = Environment(
+    loader=FileSystemLoader("config_templates/"), auto_reload=False
+)
+# Full template payload is VLAN config first, followed by port config
+# including exclamation point between sections - to mimic IOS config
+payload_template = conf_templates.from_string(
+    '{% for vlan_id, vlan_name in vlans %}{% include "vlan.jinja2" %}'
+    "{% if ports or not loop.last %}{{ separator }}{% endif %}{% endfor %}"
+    '{% for interface_name, vlan_id in ports %}{% include "port.jinja2" %}'
+    "{% if not loop.last %}{{ separator }}{% endif %}{% endfor %}"
+)
+# Parameterized version of the same payload, as a Velocity template. VLANs are passed
+# as "<VLAN ID>:<name>;..." & ports as "<interface>:<VLAN ID>;...", which config
+# templates see as Velocity variables
+velocity_payload = conf_templates.from_string(
+    '#foreach( $vlan in $vlans.split(";") )\n#if( $vlan != "" )\n'
+    '#set( $field = $vlan.split(":") )\n'
+    "#set( $vlan_id = $field[0] )\n#set( $vlan_name = $field[1] )\n"
+    '{% include "vlan.jinja2" %}\n!\n#end\n#end\n'
+    '#foreach( $port in $ports.split(";") )\n#if( $port != "" )\n'
+    '#set( $field = $port.split(":") )\n'
+    "#set( $interface_name = $field[0] )\n#set( $vlan_id = $field[1] )\n"
+    '{% include "port.jinja2" %}\n!\n#end\n#end'
+).render(
+    vlan_id="${vlan_id}", vlan_name="${vlan_name}", interface_name="${interface_name}"
+)
 
 # Set up Flask App & Session handling
 app = Flask(__name__)
-app.secret_key = "".join(
-    (secrets.choice(string.ascii_letters + string.digits) for i in range(16))
-)
+# When running multiple worker processes, all must share the same secret key
+# in order to accept each other's session cookies
+SECRET_KEY = os.getenv("SECRET_KEY")
+if not SECRET_KEY:
+    print(
+        "WARNING: SECRET_KEY is not set, so a random key will be generated. "
+        + "Sessions will not be valid across app restarts or worker processes."
+    )
+    SECRET_KEY = "".join(
+        (secrets.choice(string.ascii_letters + string.digits) for i in range(16))
+    )
+app.secret_key = SECRET_KEY
 app.config["PERMANENT_SESSION_LIFETIME"] = 3540
 app.config["SESSION_TYPE"] = "filesystem"
 Session(app)
 
+# Trace ID of the provisioning run being handled
+trace_id = contextvars.ContextVar("trace_id", default=None)
+
+
+class JSONLogFormatter(logging.Formatter):
+    """
+    Format log records as a single line of JSON
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "thread": record.threadName,
+            "trace_id": trace_id.get(),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+app.logger.setLevel(LOG_LEVEL)
+if LOG_FORMAT == "json":
+    default_handler.setFormatter(JSONLogFormatter())
+
+
+class TimedSessionInterface:
+    """
+    Wraps Flask-Session interface to measure session load / save time & size
+    """
+
+    def __init__(self, interface):
+        self.interface = interface
+
+    def __getattr__(self, name):
+        return getattr(self.interface, name)
+
+    def open_session(self, app, request):
+        start = time()
+        try:
+            return self.interface.open_session(app, request)
+        finally:
+            recordLatency("session_open", time() - start)
+
+    def save_session(self, app, session, response):
+        # Measuring size pickles the session again, so only a sample is measured
+        if next(session_saves) % SESSION_SIZE_SAMPLE == 0:
+            session_bytes.append(len(pickle.dumps(dict(session))))
+        start = time()
+        try:
+            return self.interface.save_session(app, session, response)
+        finally:
+            recordLatency("session_save", time() - start)
+
+
+# Size of recently saved sessions in bytes. One in SESSION_SIZE_SAMPLE saves is measured
+SESSION_SIZE_SAMPLE = 50
+session_saves = count()
+session_bytes = deque(maxlen=500)
+app.session_interface = TimedSessionInterface(app.session_interface)
+
+
+@dataclass(slots=True)
+class Device:
+    """
+    Switch details from DNAC inventory
+    """
+
+    id: str
+    name: str
+    platform: str
+    version: str
+    reachability: str
+    family: str
+    series: str
+    lastUpdateTime: int
+    lastupdate: str
+    location: str = "Unknown"
+
+
+class SharedStore:
+    """
+    Key / value store for data shared between sessions
+
+    Values are kept in memory, unless a SQLite database path is provided.
+    In that case values are stored as JSON, and may be shared between processes.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.memory = {}
+        self.local = threading.local()
+        if path:
+            self.db().execute(
+                "CREATE TABLE IF NOT EXISTS store "
+                "(namespace TEXT, key TEXT, value TEXT, updated REAL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+
+    @property
+    def shared(self) -> bool:
+        # Only values stored in SQLite are visible to other processes
+        return bool(self.path)
+
+    def db(self) -> sqlite3.Connection:
+        # SQLite connections can't be shared between threads
+        if not hasattr(self.local, "db"):
+            self.local.db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self.local.db.execute("PRAGMA journal_mode=WAL")
+        return self.local.db
+
+    def get(self, namespace: str, key: str, default=None):
+        if not self.path:
+            return self.memory.get((namespace, key), default)
+        row = (
+            self.db()
+            .execute(
+                "SELECT value FROM store WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            )
+            .fetchone()
+        )
+        return json.loads(row[0]) if row else default
+
+    def set(self, namespace: str, key: str, value) -> None:
+        if not self.path:
+            self.memory[(namespace, key)] = value
+            return
+        self.db().execute(
+            "INSERT OR REPLACE INTO store VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value), time()),
+        )
+
+    def delete(self, namespace: str, key: str) -> None:
+        if not self.path:
+            self.memory.pop((namespace, key), None)
+            return
+        self.db().execute(
+            "DELETE FROM store WHERE namespace = ? AND key = ?", (namespace, key)
+        )
+
+
+shared_store = SharedStore(STATE_DB)
+
+
+JOB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS deployments (
+    deploy_id TEXT PRIMARY KEY, server_url TEXT, username TEXT, author TEXT,
+    template_id TEXT, payload TEXT, status TEXT, error TEXT, started REAL,
+    updated REAL, version INTEGER, trace_id TEXT, owner TEXT
+);
+CREATE INDEX IF NOT EXISTS deployments_started ON deployments (started);
+CREATE INDEX IF NOT EXISTS deployments_author ON deployments (author, started);
+CREATE INDEX IF NOT EXISTS deployments_status ON deployments (status, owner);
+CREATE TABLE IF NOT EXISTS deployment_devices (
+    deploy_id TEXT, device_id TEXT, name TEXT, ip TEXT, status TEXT, error TEXT,
+    PRIMARY KEY (deploy_id, device_id)
+);
+CREATE INDEX IF NOT EXISTS deployment_devices_name ON deployment_devices (name);
+CREATE INDEX IF NOT EXISTS deployment_devices_ip ON deployment_devices (ip);
+CREATE TABLE IF NOT EXISTS deployment_events (
+    deploy_id TEXT, time REAL, status TEXT, error TEXT
+);
+CREATE INDEX IF NOT EXISTS deployment_events_id ON deployment_events (deploy_id);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY, client TEXT, status TEXT, created REAL, owner TEXT,
+    job TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, owner);
+CREATE TABLE IF NOT EXISTS owners (owner TEXT PRIMARY KEY, heartbeat REAL);
+CREATE TABLE IF NOT EXISTS templates (
+    server_url TEXT, template_id TEXT, name TEXT, shared INTEGER, used REAL,
+    attempts INTEGER, error TEXT, username TEXT,
+    PRIMARY KEY (server_url, template_id)
+);
+"""
+
+
+class JobStore:
+    """
+    SQLite record of deployments, their devices & status changes, and API jobs
+
+    Each process owns the deployments & jobs it is working on, and records a heartbeat.
+    If a process stops, another process (or the same app after a restart) claims them
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+        self.pid = None
+
+    @property
+    def owner(self) -> str:
+        # Worker processes forked after import need their own owner ID
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.owner_id = f"{socket.gethostname()}-{self.pid}-{secrets.token_hex(4)}"
+        return self.owner_id
+
+    def db(self) -> sqlite3.Connection:
+        # SQLite connections can't be shared between threads
+        if not hasattr(self.local, "db"):
+            self.local.db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self.local.db.execute("PRAGMA journal_mode=WAL")
+            # The database is only created once it's used, not when the app is imported
+            self.local.db.executescript(JOB_SCHEMA)
+            # Templates recorded before uploads were tracked by username have none
+            columns = self.local.db.execute("PRAGMA table_info(templates)").fetchall()
+            if "username" not in [column[1] for column in columns]:
+                self.local.db.execute("ALTER TABLE templates ADD COLUMN username TEXT")
+        return self.local.db
+
+    def saveDeployment(self, deploy_id: str, deployment: dict) -> None:
+        """
+        Save deployment & device status, recording an event when the status changes
+        """
+        db = self.db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            previous = db.execute(
+                "SELECT status FROM deployments WHERE deploy_id = ?", (deploy_id,)
+            ).fetchone()
+            db.execute(
+                "INSERT OR REPLACE INTO deployments VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    deploy_id,
+                    deployment["server_url"],
+                    deployment["username"],
+                    deployment["author"],
+                    deployment["template_id"],
+                    deployment["payload"],
+                    deployment["status"],
+                    deployment["error"],
+                    deployment["started"],
+                    time(),
+                    deployment["version"],
+                    deployment["trace_id"],
+                    self.owner,
+                ),
+            )
+            db.executemany(
+                "INSERT OR REPLACE INTO deployment_devices VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (deploy_id, device_id, device["name"], device["ip"])
+                    + (device["status"], device["error"])
+                    for device_id, device in deployment["devices"].items()
+                ],
+            )
+            if not previous or previous[0] != deployment["status"]:
+                db.execute(
+                    "INSERT INTO deployment_events VALUES (?, ?, ?, ?)",
+                    (deploy_id, time(), deployment["status"], deployment["error"]),
+                )
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def getDeployment(self, deploy_id: str) -> dict:
+        """
+        Return a saved deployment, in the same form as tracked deployments, or None
+        """
+        db = self.db()
+        row = db.execute(
+            "SELECT server_url, username, author, template_id, payload, status, error, "
+            "started, version, trace_id FROM deployments WHERE deploy_id = ?",
+            (deploy_id,),
+        ).fetchone()
+        if not row:
+            return None
+        keys = ["server_url", "username", "author", "template_id", "payload"]
+        keys += ["status", "error", "started", "version", "trace_id"]
+        deployment = dict(zip(keys, row))
+        deployment["devices"] = {
+            device_id: {"name": name, "ip": ip, "status": status, "error": error}
+            for device_id, name, ip, status, error in db.execute(
+                "SELECT device_id, name, ip, status, error FROM deployment_devices "
+                "WHERE deploy_id = ?",
+                (deploy_id,),
+            )
+        }
+        return deployment
+
+    def getEvents(self, deploy_id: str) -> list:
+        """
+        Status changes of a deployment, oldest first
+        """
+        return [
+            {"time": event_time, "status": status, "error": error}
+            for event_time, status, error in self.db().execute(
+                "SELECT time, status, error FROM deployment_events "
+                "WHERE deploy_id = ? ORDER BY time",
+                (deploy_id,),
+            )
+        ]
+
+    def getHistory(
+        self,
+        device: str = None,
+        author: str = None,
+        since: float = None,
+        until: float = None,
+        limit: int = 200,
+    ) -> list:
+        """
+        Deployed devices, most recent first, optionally filtered by device name
+        or management IP, author & time range
+        """
+        query = (
+            "SELECT d.deploy_id, d.server_url, d.author, d.template_id, d.started, "
+            "d.updated, d.status, v.name, v.ip, v.status, v.error "
+            "FROM deployments d JOIN deployment_devices v USING (deploy_id) WHERE 1 = 1"
+        )
+        params = []
+        if device:
+            query += " AND (v.name = ? OR v.ip = ?)"
+            params += [device, device]
+        if author:
+            query += " AND d.author = ?"
+            params.append(author)
+        if since:
+            query += " AND d.started >= ?"
+            params.append(since)
+        if until:
+            query += " AND d.started < ?"
+            params.append(until)
+        query += " ORDER BY d.started DESC LIMIT ?"
+        params.append(limit)
+        keys = ["deploy_id", "server_url", "author", "template_id", "started"]
+        keys += ["updated", "deployment_status", "name", "ip", "status", "error"]
+        return [dict(zip(keys, row)) for row in self.db().execute(query, params)]
+
+    def saveJob(self, job: dict) -> None:
+        self.db().execute(
+            "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                job["id"],
+                job["client"],
+                job["status"],
+                job["created"],
+                self.owner,
+                json.dumps(job),
+            ),
+        )
+
+    def getJob(self, job_id: str) -> dict:
+        row = (
+            self.db()
+            .execute("SELECT job FROM jobs WHERE job_id = ?", (job_id,))
+            .fetchone()
+        )
+        return json.loads(row[0]) if row else None
+
+    def heartbeat(self) -> None:
+        """
+        Record that this process is still working on the deployments & jobs it owns
+        """
+        self.db().execute(
+            "INSERT OR REPLACE INTO owners VALUES (?, ?)", (self.owner, time())
+        )
+
+    def claimOrphans(self, table: str, statuses: tuple) -> list:
+        """
+        Take ownership of unfinished deployments or jobs whose owner has stopped
+
+        Returns IDs of all unfinished deployments or jobs owned by this process
+        """
+        id_column = {"deployments": "deploy_id", "jobs": "job_id"}[table]
+        placeholders = ", ".join("?" for _ in statuses)
+        db = self.db()
+        db.execute(
+            f"UPDATE {table} SET owner = ? WHERE status IN ({placeholders}) "
+            "AND owner NOT IN (SELECT owner FROM owners WHERE heartbeat > ?)",
+            (self.owner, *statuses, time() - JOB_ORPHAN_TIMEOUT),
+        )
+        return [
+            row[0]
+            for row in db.execute(
+                f"SELECT {id_column} FROM {table} "
+                f"WHERE status IN ({placeholders}) AND owner = ?",
+                (*statuses, self.owner),
+            )
+        ]
+
+    def useTemplate(
+        self,
+        server_url: str,
+        template_id: str,
+        name: str,
+        shared: bool = False,
+        username: str = None,
+    ) -> None:
+        """
+        Record that an app-owned template was just uploaded or deployed,
+        with the username of the DNAC client that uploaded it
+        """
+        self.db().execute(
+            "INSERT OR REPLACE INTO templates VALUES (?, ?, ?, ?, ?, 0, NULL, ?)",
+            (server_url, template_id, name, int(shared), time(), username),
+        )
+
+    def getTemplateIDs(self, server_url: str) -> set:
+        return {
+            row[0]
+            for row in self.db().execute(
+                "SELECT template_id FROM templates WHERE server_url = ?", (server_url,)
+            )
+        }
+
+    def getExpiredTemplates(self, server_url: str, before: float, limit: int) -> list:
+        """
+        Templates owned by one author, unused since before & not part of
+        a deployment in progress. Returns list of (template ID, name, username)
+        """
+        return (
+            self.db()
+            .execute(
+                "SELECT template_id, name, username FROM templates "
+                "WHERE server_url = ? AND shared = 0 AND used < ? "
+                "AND template_id NOT IN (SELECT template_id FROM deployments "
+                "WHERE server_url = ? AND status = 'inprogress' "
+                "AND template_id IS NOT NULL) "
+                "ORDER BY attempts, used LIMIT ?",
+                (server_url, before, server_url, limit),
+            )
+            .fetchall()
+        )
+
+    def forgetTemplate(self, server_url: str, template_id: str) -> None:
+        self.db().execute(
+            "DELETE FROM templates WHERE server_url = ? AND template_id = ?",
+            (server_url, template_id),
+        )
+
+    def failTemplate(self, server_url: str, template_id: str, error: str) -> None:
+        """
+        Record a failed delete, so the template is retried after others
+        """
+        self.db().execute(
+            "UPDATE templates SET attempts = attempts + 1, error = ? "
+            "WHERE server_url = ? AND template_id = ?",
+            (error, server_url, template_id),
+        )
+
+
+job_store = JobStore(JOB_DB)
+
 
 @app.route("/", methods=["GET"])
 def index():
@@ -95,10 +768,8 @@ def login():
     Collect user credentials & check ability to log into DNAC.
     """
     # Set up session data
-    session["deploymentError"] = None
-    session["deploymentStatus"] = None
-    session["template_payload"] = None
-    session["target_device"] = None
+    session["deploy_ids"] = None
+    session["target_devices"] = None
 
     # On GET, render login page:
     if request.method == "GET":
@@ -121,8 +792,7 @@ def login():
         session["author"] = request.form.get("username")
 
         # Generate DNAC server URL
-        server_address = dnac_config["servers"][session["server"]]["address"]
-        session["dnac_url"] = f"https://{server_address}/"
+        session["dnac_url"] = getServerURL(session["server"])
 
         # Attempt DNAC Login
         try:
@@ -130,9 +800,12 @@ def login():
             if APP_MODE == "SINGLEAUTH":
                 dnac = getDNACSession()
             # Multi auth mode, user's login credentials only used for initial auth
-            # Subsequent calls use admin-provided credentials
+            # Subsequent calls use admin-provided credentials, so the client used to
+            # check the user's login isn't shared or kept
             elif APP_MODE == "MULTIAUTH":
-                dnac = getDNACSession()
+                dnac = createDNACClient(
+                    session["dnac_url"], session["username"], session["password"]
+                )
                 session["username"] = DNAC_USER
                 session["password"] = DNAC_PASS
         except Exception as e:
@@ -169,6 +842,12 @@ def logout():
 
     Clear all session data & send user back to login page.
     """
+    # Clients for the user's own credentials are no longer needed. In MULTIAUTH
+    # mode, sessions use the shared service account client, which is kept
+    if APP_MODE == "SINGLEAUTH" and session.get("auth"):
+        forgetDNACClient(
+            session.get("dnac_url"), session.get("username"), session.get("password")
+        )
     for key in session:
         session[key] = None
     return redirect("/login")
@@ -185,28 +864,94 @@ def select_device():
     if not session.get("auth"):
         return redirect("/login")
 
-    # On first load, reset devices
-    if not session.get("dnac_devices"):
-        session["dnac_devices"] = {}
-
     if request.method == "POST":
-        # On submit of device searching form, look up devices based on
-        # provided filter string
+        # On submit of device searching form, save filter string.
+        # Only the filter is kept in session data, devices are looked up on page load
         if request.form.get("device-filter"):
-            getDNACDevices(request.form.get("device-filter"))
+            session["device_filter"] = request.form.get("device-filter")
+            session["federated"] = FEDERATED_SEARCH and bool(
+                request.form.get("all-servers")
+            )
 
-        # On submit of device selection, save selected device &
+        # On submit of device selection, save selected device(s) &
         # redirect to vlan provisioning page
-        if request.form.get("target-device"):
-            session["target_device"] = request.form.get("target-device")
+        if request.form.getlist("target-device"):
+            session["target_devices"] = request.form.getlist("target-device")
+            prefetchDeviceInterfaces(getSessionDevices(session["target_devices"]))
             return redirect("/vlan-provision")
 
+    # Render first page of search results, later pages are loaded as the user scrolls
+    device_list, total, unavailable = {}, 0, []
+    if session.get("device_filter"):
+        device_list, total, unavailable = getDNACDevices(session["device_filter"])
+    if request.form.get("device-filter"):
+        # Start looking up interfaces of the first few reachable devices
+        reachable = [
+            key
+            for key, device in device_list.items()
+            if device.reachability == "Reachable"
+        ]
+        prefetchDeviceInterfaces(
+            {key: device_list[key] for key in reachable[:PREFETCH_LIMIT]}
+        )
+
     return render_template(
         "select-device.html",
-        device_list=session.get("dnac_devices"),
+        device_list=device_list,
+        total=total,
+        dnac=dnac_config,
+        federated_search=FEDERATED_SEARCH and len(dnac_config["servers"]) > 1,
+        federated=session.get("federated"),
+        unavailable=unavailable,
+        inventory_age=getInventoryAge(session.get("server")),
+        inventory_loading=isSearchLoading(),
     )
 
 
+@app.route("/select-device/results", methods=["GET"])
+def device_results():
+    """
+    Device Results
+
+    Return a page of device search results, starting at offset, as table rows
+    """
+    # If not authenticated, return no results
+    if not session.get("auth"):
+        return Response(status=401)
+
+    offset = request.args.get("offset", 0, type=int)
+    device_list, total = {}, 0
+    if session.get("device_filter"):
+        device_list, total, _ = getDNACDevices(session["device_filter"], offset)
+    return {
+        "rows": render_template(
+            "device-rows.html",
+            device_list=device_list,
+            dnac=dnac_config,
+            federated=session.get("federated"),
+        ),
+        "offset": offset + len(device_list),
+        "total": total,
+        "loading": isSearchLoading(),
+    }
+
+
+@app.route("/prefetch-interfaces", methods=["POST"])
+def prefetch_interfaces():
+    """
+    Prefetch Interfaces
+
+    Start looking up interfaces of a device as soon as it is checked,
+    so the provisioning page is ready once device selection is submitted
+    """
+    # If not authenticated, nothing to look up
+    if not session.get("auth"):
+        return Response(status=401)
+
+    prefetchDeviceInterfaces(getSessionDevices(request.form.getlist("target-device")))
+    return Response(status=202)
+
+
 @app.route("/vlan-provision", methods=["GET", "POST"])
 def vlan_provision():
     """
@@ -219,33 +964,102 @@ def vlan_provision():
     if not session.get("auth"):
         return redirect("/login")
 
-    # Get all stored devices
-    devices = session.get("dnac_devices")
+    # Get selected target devices
+    targets = getSessionDevices(session.get("target_devices") or [])
+    if not targets:
+        return redirect("/select-device")
 
     # If form submitted, generate template & upload to DNAC
     # then push for provisioning
     if request.method == "POST":
-        # Generate / Upload / Deploy template via DNAC
-        generateTemplatePayload(request.json)
-        uploadTemplate(
-            session["template_payload"], devices[session.get("target_device")]
+        # Generate / Upload / Deploy template via DNAC.
+        # All logs for this provisioning run share a trace ID
+        g.trace_token = trace_id.set(secrets.token_hex(8))
+        app.logger.info(
+            f"Provisioning run started by {session['author']} "
+            f"for {len(targets)} devices"
         )
-        session["deploymentStatus"] = None
-        deployTemplate(devices[session.get("target_device")])
+        # Devices on each DNAC server are provisioned through that server,
+        # with only the changes each device needs
+        # Port ranges are expanded for every device before anything is deployed
+        server_configs = {}
+        errors = []
+        for server, server_targets in groupDevicesByServer(targets).items():
+            dnac = getServerSession(server)
+            configs, server_errors = getFormVLANConfigs(
+                dnac, server_targets, request.json
+            )
+            server_configs[server] = (dnac, server_targets, configs)
+            errors.extend(server_errors)
+        if errors:
+            return {"errors": errors}, 400
+        deploy_ids = []
+        for dnac, server_targets, configs in server_configs.values():
+            payloads = getDevicePayloads(dnac, server_targets, configs)
+            deploy_ids.extend(provisionPayloads(dnac, session["author"], payloads))
+        session["deploy_ids"] = deploy_ids
         # Return status page after deployment is started
         return redirect("/status")
 
-    # On first page load, query device interfaces to populate drag & drop
-    if "interfaces" not in devices[session.get("target_device")].keys():
-        getDeviceInterfaces(session.get("target_device"))
+    # Look up device interfaces to populate drag & drop.
+    # These are normally already cached, or prefetched while devices were being selected
+    interfaces = {}
+    for server, server_targets in groupDevicesByServer(targets).items():
+        for ip, device_interfaces in getInterfaces(
+            getServerSession(server), server_targets
+        ).items():
+            interfaces[getDeviceKey(server, ip)] = device_interfaces
+
+    # When provisioning multiple devices, only offer interfaces present on all of them.
+    # Interfaces are grouped by stack member & module, so large stacks stay manageable
+    target_interfaces = [interfaces.get(key, {}) for key in targets]
+    common_interfaces = {
+        name: interface
+        for name, interface in target_interfaces[0].items()
+        if all(name in other for other in target_interfaces[1:])
+    }
 
     return render_template(
         "vlan-provision.html",
-        device=devices[session.get("target_device")],
-        device_ip=session.get("target_device"),
+        targets=targets,
+        dnac=dnac_config,
+        interface_groups=groupInterfaces(common_interfaces),
     )
 
 
+@app.route("/vlan-provision/preview", methods=["POST"])
+def vlan_provision_preview():
+    """
+    VLAN Provisioning Preview
+
+    Compare the VLAN config being created against each target device's
+    running config, & return the changes which would be deployed
+    """
+    # If not authenticated, return no changes
+    if not session.get("auth"):
+        return Response(status=401)
+
+    targets = getSessionDevices(session.get("target_devices") or [])
+    preview = []
+    for server, server_targets in groupDevicesByServer(targets).items():
+        dnac = getServerSession(server)
+        configs, errors = getFormVLANConfigs(dnac, server_targets, request.json)
+        if errors:
+            return {"errors": errors}, 400
+        device_changes = getConfigChanges(dnac, server_targets, configs)
+        for ip, (config, changes) in device_changes.items():
+            preview.append(
+                {
+                    "name": server_targets[ip].name,
+                    "ip": ip,
+                    "server": dnac_config["servers"][server]["alias"],
+                    "changes": changes,
+                    "payload": generateTemplatePayload(config) if config else "",
+                }
+            )
+    return {"devices": preview}
+
+
 @app.route("/status", methods=["GET", "POST"])
 def status():
     """
@@ -257,23 +1071,75 @@ def status():
     if not session.get("auth"):
         return redirect("/login")
 
-    # If refresh button clicked, query DNAC for status
-    if request.method == "POST":
-        if session["templateID"]:
-            # Check template deployment status...
-            getTemplateDeployStatus()
-            # If template was deployed successfully, delete it to keep DNAC template list clean
-            if session["deploymentStatus"] == "success" and session["templateID"]:
-                deleteTemplate()
+    # Deployment status is kept up to date by the background tracker,
+    # so a refresh only needs to re-render the page
+    summary = summarizeDeployments(session.get("deploy_ids"))
 
     return render_template(
         "status.html",
-        error=session["deploymentError"],
-        status=session["deploymentStatus"],
-        deployed_config=session["template_payload"],
+        error=summary["error"],
+        status=summary["status"],
+        devices=summary["devices"],
+        deployed_config=summary["payload"],
     )
 
 
+@app.route("/status/updates", methods=["GET"])
+def status_updates():
+    """
+    Task Status Updates
+
+    Long-poll for deployment status changes from the status page. Returns once the
+    status differs from the version given, or after LONG_POLL_TIMEOUT seconds
+    """
+    # If not authenticated, return no updates
+    if not session.get("auth"):
+        return Response(status=401)
+
+    deploy_ids = session.get("deploy_ids")
+
+    def getSummary() -> dict:
+        summary = summarizeDeployments(deploy_ids)
+        summary["version"] = "-".join(str(version) for version in summary["version"])
+        return summary
+
+    summary = waitForChange(getSummary, request.args.get("version"))
+    return {
+        "version": summary["version"],
+        "status": summary["status"],
+        "error": summary["error"],
+        "devices": summary["devices"],
+    }
+
+
+def waitForChange(getUpdate, version: str) -> dict:
+    """
+    Long-poll: wait until the "version" of getUpdate() differs from version,
+    for at most LONG_POLL_TIMEOUT seconds. Returns the latest update
+
+    Deployments tracked by another worker process can't notify us,
+    so these are checked every TRACKER_INTERVAL seconds
+    """
+    deadline = monotonic() + LONG_POLL_TIMEOUT
+    with deployments_changed:
+        notified = deployments_notified
+    # Updates may read the job store, so they're read outside the condition.
+    # Changes notified while reading are picked up by the notification count
+    update = getUpdate()
+    while update["version"] == version:
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            break
+        with deployments_changed:
+            deployments_changed.wait_for(
+                lambda: deployments_notified != notified,
+                timeout=min(remaining, TRACKER_INTERVAL),
+            )
+            notified = deployments_notified
+        update = getUpdate()
+    return update
+
+
 @app.route("/reset", methods=["GET"])
 def reset():
     """
@@ -281,351 +1147,3214 @@ def reset():
 
     When starting over, reset all stored session info about previous deployment
     """
-    session["deploymentError"] = None
-    session["deploymentStatus"] = None
-    session["template_payload"] = None
-    session["target_device"] = None
-    session["dnac_devices"] = {}
+    session["deploy_ids"] = None
+    session["target_devices"] = None
+    session["device_filter"] = None
     return redirect("/select-device")
 
 
-def getDNACDevices(filter: str) -> None:
+@app.route("/history", methods=["GET"])
+def history():
     """
-    Query DNAC for device lists.
+    Deployment History
 
-    Used to retrieve both WLCs & APs, with or without a filter
+    List previously deployed devices, filtered by device, author & date range
     """
-    # Start DNAC session
-    dnac = getDNACSession()
+    # If not authenticated, redirect to login
+    if not session.get("auth"):
+        return redirect("/login")
 
-    # Query Devices / Filter by device family
-    # Note: Filtering is case sensitive
-    devices = dnac.devices.get_device_list(
-        family="Switches and Hubs", hostname=f".*{filter}.*"
+    filters, since, until = getHistoryFilters(request.args)
+    rows = job_store.getHistory(filters["device"], filters["author"], since, until)
+    return render_template(
+        "history.html",
+        dnac=dnac_config,
+        filters=filters,
+        rows=rows,
+        servers=getServerAliases(),
     )
 
-    # Collect device info that we need to keep
-    device_list = {}
-    for device in devices["response"]:
-        mgtIP = device["managementIpAddress"]
-        device_list[mgtIP] = {}
-        device_list[mgtIP]["id"] = device["instanceUuid"]
-        device_list[mgtIP]["name"] = device["hostname"]
-        device_list[mgtIP]["platform"] = device["platformId"]
-        device_list[mgtIP]["version"] = device["softwareVersion"]
-        device_list[mgtIP]["reachability"] = device["reachabilityStatus"]
-        device_list[mgtIP]["family"] = device["family"]
-        device_list[mgtIP]["series"] = device["series"]
-        timestamp = datetime.fromtimestamp(device["lastUpdateTime"] / 1000)
-        device_list[mgtIP]["lastupdate"] = timestamp.strftime("%b %d %Y, %I:%M%p")
 
-    # Query device location
-    for device in device_list:
-        detailed_info = dnac.devices.get_device_detail(
-            identifier="uuid", search_by=device_list[device]["id"]
-        )
-        device_list[device]["location"] = detailed_info["response"]["location"]
+@app.route("/history/<deploy_id>", methods=["GET"])
+def history_detail(deploy_id):
+    """
+    Deployment History Detail
+
+    Show a previous deployment's configuration, devices & status changes
+    """
+    # If not authenticated, redirect to login
+    if not session.get("auth"):
+        return redirect("/login")
 
-    # Store devices in session data
-    session["dnac_devices"] = device_list
+    deployment = job_store.getDeployment(deploy_id)
+    if not deployment:
+        return redirect("/history")
+    return render_template(
+        "history.html",
+        dnac=dnac_config,
+        filters=getHistoryFilters(request.args)[0],
+        deployment_id=deploy_id,
+        deployment=deployment,
+        events=job_store.getEvents(deploy_id),
+        servers=getServerAliases(),
+    )
 
 
-def getDeviceInterfaces(device_ip: str) -> None:
+@app.route("/metrics", methods=["GET"])
+def metrics():
     """
-    Query DNAC for all interfaces based on device UUID
+    Metrics
+
+    Return API call, request & stage latency metrics in Prometheus format
     """
-    # Start DNAC session
-    dnac = getDNACSession()
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Collect metrics from all worker processes
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
 
-    device_id = session["dnac_devices"][device_ip]["id"]
 
-    interfaces = dnac.devices.get_interface_info_by_id(device_id)
+@app.route("/cache-stats", methods=["GET"])
+def cache_stats():
+    """
+    Cache Stats
 
-    session["dnac_devices"][device_ip]["interfaces"] = {}
+    Return size, age & hit/miss counters for shared caches
+    """
+    stats = {"inventory": {}}
+    for server, entry in inventory.items():
+        stats["inventory"][server] = {
+            "devices": len(entry["devices"]),
+            "age": getInventoryAge(server),
+            "hits": entry["hits"],
+            "misses": entry["misses"],
+        }
+    session_p50, session_p95 = getPercentiles(session_bytes)
+    save_p50, save_p95 = getPercentiles(stage_latency.get("session_save", []))
+    stats["session"] = {
+        "bytes_p50": session_p50,
+        "bytes_p95": session_p95,
+        "save_seconds_p50": save_p50,
+        "save_seconds_p95": save_p95,
+    }
+    stats["boot"] = boot_timings
+    stats["dnac_reads"] = {
+        "calls": dnac_reads.stats["calls"],
+        "coalesced": dnac_reads.stats["coalesced"],
+    }
+    stats["templates"] = {
+        "servers": len(template_ids),
+        "get_projects_calls": template_ids_stats["get_projects"],
+        "get_projects_avoided": template_ids_stats["avoided"],
+    }
+    return stats
 
-    for interface in interfaces["response"]:
-        # Only select GigabitEthernet interfaces on the first module.
-        # Should skip management interface, NIM slots, and AppGig interface
-        if re.match("^GigabitEthernet\d\/0\/\d", interface["portName"]):
-            # Store interface name to UUID mapping
-            session["dnac_devices"][device_ip]["interfaces"][
-                interface["portName"]
-            ] = interface["id"]
 
+@app.route("/api/v1/deployments", methods=["POST"])
+def api_create_deployment():
+    """
+    API: Create Deployment
 
-def getDNACSession(user=None, passwd=None) -> api.DNACenterAPI:
+    Validate a VLAN plan for one or more devices, sent as JSON or CSV,
+    & queue it for provisioning. Returns the job ID
     """
-    General function for creating session to DNAC
+    client = getAPIClient()
+    if not client:
+        return {"error": "Missing or invalid API token"}, 401
 
-    Default will use server side session credentials,
-    unless specific user/password are provided
+    try:
+        rows = parseVLANPlan(request)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    try:
+        plan, errors = validateVLANPlan(rows)
+    except InventoryLoading as e:
+        return {"error": str(e)}, 503, {"Retry-After": str(ceil(FEDERATED_TIMEOUT))}
+    if errors:
+        return {"error": "Invalid VLAN plan", "devices": errors}, 422
+
+    job_id = queueJob(client, plan)
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "devices": sum(len(devices) for devices in plan.values()),
+        "url": f"/api/v1/deployments/{job_id}",
+    }, 202
+
+
+@app.route("/api/v1/deployments/<job_id>", methods=["GET"])
+def api_get_deployment(job_id):
     """
-    if user and passwd:
-        return api.DNACenterAPI(
-            username=user,
-            password=passwd,
-            base_url=session.get("dnac_url"),
-            verify=False,
-        )
-    else:
-        return api.DNACenterAPI(
-            username=session.get("username"),
-            password=session.get("password"),
-            base_url=session.get("dnac_url"),
-            verify=False,
-        )
+    API: Get Deployment
+
+    Return status of an API job & each of its devices
+    """
+    client = getAPIClient()
+    if not client:
+        return {"error": "Missing or invalid API token"}, 401
+    job = job_store.getJob(job_id)
+    if not job or job["client"] != client:
+        return {"error": "Job not found"}, 404
+    return getJobResults(job)
 
 
-def getTaskStatus() -> None:
+@app.route("/api/v1/deployments/<job_id>/results", methods=["GET"])
+def api_deployment_results(job_id):
     """
-    Query DNAC for task status
+    API: Deployment Results
+
+    Long-poll for changes to an API job. Returns the job status & each of its
+    devices once they differ from the version given, or after LONG_POLL_TIMEOUT
+    seconds
     """
-    # Connect to DNAC
-    dnac = getDNACSession()
+    client = getAPIClient()
+    if not client:
+        return {"error": "Missing or invalid API token"}, 401
+    job = job_store.getJob(job_id)
+    if not job or job["client"] != client:
+        return {"error": "Job not found"}, 404
 
-    # Query status of task ID
-    task = dnac.task.get_task_by_id(session.get("taskID"))
+    def getResults() -> dict:
+        results = getJobResults(job_store.getJob(job_id))
+        content = json.dumps(results, sort_keys=True).encode()
+        results["version"] = hashlib.sha256(content).hexdigest()[:16]
+        return results
 
-    # Save task response data
-    session["taskStatus"] = task["response"]
+    return waitForChange(getResults, request.args.get("version"))
 
 
-def getProjectID() -> None:
+def getDNACDevices(
+    filter: str, offset: int = 0, limit: int = SEARCH_PAGE_SIZE
+) -> tuple:
     """
-    General function to locate DNA Center project identifier, which will be required to
-    add/remove templates.
+    Search DNAC switch inventory for devices.
+
+    Devices are matched against hostname, site or platform (case insensitive),
+    using the shared inventory cache for the current DNAC server - or for all
+    servers, if the session is searching all servers.
+    Returns (dict of device key to Device for one page of matches, total matches,
+    list of servers which could not be searched)
     """
-    # Connect to DNAC
-    dnac = getDNACSession()
-    # Query projects by name
-    project = dnac.configuration_templates.get_projects(
-        name=dnac_config["templates"]["project"]
-    )
-    # If name matches, there should only be 1 result
-    project_id = project[0]["id"]
-    app.logger.info(f"Found Project ID: {project_id}")
-    # Store project ID
-    session["projectID"] = project_id
+    servers = getSearchServers()
+    if len(servers) == 1:
+        inventories = {servers[0]: getInventory(servers[0], getDNACSession())}
+    else:
+        inventories = getServerInventories(servers)
+
+    search = filter.lower()
+    search_results = []
+    for server in servers:
+        if server not in inventories:
+            continue
+        server_inventory = inventories[server]
+        with server_inventory["lock"]:
+            devices = server_inventory["devices"]
+            search_results.extend(
+                (server, mgtIP, devices)
+                for mgtIP, search_text in server_inventory["index"].items()
+                if search in search_text
+            )
+    page = {
+        getDeviceKey(server, ip): devices[ip]
+        for server, ip, devices in search_results[offset : offset + limit]
+    }
+    unavailable = [server for server in servers if server not in inventories]
+    return page, len(search_results), unavailable
 
 
-def getTemplateID() -> None:
+def getSearchServers() -> list:
     """
-    Looks up template ID by name
+    Names of the DNAC servers searched by the current session
+    """
+    if session.get("federated"):
+        return list(dnac_config["servers"])
+    return [session["server"]]
+
+
+def getServerInventories(servers: list) -> dict:
+    """
+    Return inventory cache entries for several DNAC servers, loading them concurrently
+
+    Servers which fail, or do not respond within FEDERATED_TIMEOUT, are left out -
+    unless their inventory is still loading, in which case the devices loaded
+    so far are included, and more are listed as they are loaded
     """
-    # Connect to DNAC
-    dnac = getDNACSession()
+    username, password = session.get("username"), session.get("password")
 
-    # Query template by name
-    project = dnac.configuration_templates.get_projects(
-        name=dnac_config["templates"]["project"]
+    def loadServerInventory(server: str) -> dict:
+        dnac = getDNACClient(getServerURL(server), username, password)
+        return getInventory(server, dnac)
+
+    inventories = runConcurrently(
+        loadServerInventory, servers, len(servers), FEDERATED_TIMEOUT
     )
-    template_id = None
-    for template in project[0]["templates"]:
-        if template["name"] == (
-            dnac_config["templates"]["template"] + "-" + session["author"]
-        ):
-            template_id = template["id"]
-            app.logger.info(f"Found Template ID: {template_id}")
-            break
-        else:
-            app.logger.info("No template ID found")
-    # Store template ID
-    session["templateID"] = template_id
+    for server in servers:
+        if server not in inventories and isInventoryLoading(server):
+            inventories[server] = inventory[server]
+    return inventories
 
 
-def generateTemplatePayload(new_config: dict) -> None:
+def isSearchLoading() -> bool:
     """
-    Create DNA Center template with desired configuration changes
+    True while inventory of any server searched by the current session is still loading
     """
-    template_payload = []
-    vlan_config = []
-    port_config = []
-    vlan_template = conf_templates.get_template("vlan.jinja2")
-    port_template = conf_templates.get_template("port.jinja2")
+    return any(isInventoryLoading(server) for server in getSearchServers())
 
-    app.logger.info("Generating template...")
-    # For each new VLAN to create...
-    for entry in new_config:
-        # Render the vlan.jinja2 template & append to vlan_config list
-        vlan_config.append(
-            vlan_template.render(
-                vlan_id=new_config[entry]["vlan_id"],
-                vlan_name=new_config[entry]["vlan_name"],
-            )
-        )
-        # Render port.jinja2 template & append to port_config list
-        port_list = new_config[entry]["ports"].split("\n")
-        for port in port_list:
-            port_config.append(
-                port_template.render(
-                    interface_name=port, vlan_id=new_config[entry]["vlan_id"]
-                )
-            )
 
-    # Full payload is VLAN config first, followed by port config
-    # including exclamation point between lines - to mimic IOS config
-    template_payload = vlan_config + port_config
-    template_payload = "\n!\n".join(template_payload)
-    # Store full template payload in session data for now
-    session["template_payload"] = template_payload
-    app.logger.info("Template Generated!")
+def getDeviceKey(server: str, ip: str) -> str:
+    """
+    Key identifying a device across DNAC servers
+
+    Devices on the session's own server are keyed by management IP,
+    and devices on other servers by "<server>/<management IP>"
+    """
+    if server == session["server"]:
+        return ip
+    return f"{server}/{ip}"
 
 
-def uploadTemplate(template_payload: str, device_info: dict) -> str:
+def groupDevicesByServer(devices: dict) -> dict:
     """
-    Create / Update DNA Center template
+    Group devices keyed by device key into dict of server to {management IP: Device}
     """
-    # Connect to DNAC
-    dnac = getDNACSession()
+    groups = {}
+    for key, device in devices.items():
+        server, _, ip = key.rpartition("/")
+        groups.setdefault(server or session["server"], {})[ip] = device
+    return groups
 
-    # Query project & template IDs
-    getProjectID()
-    getTemplateID()
+
+def getSessionDevices(device_keys: list) -> dict:
+    """
+    Look up devices by device key, in inventory of the DNAC server they belong to
+
+    Returns dict of device key to Device, skipping any no longer in inventory
+    """
+    if not device_keys:
+        return {}
+    devices = {}
+    servers = getSearchServers()
+    for server, ips in groupDevicesByServer(dict.fromkeys(device_keys)).items():
+        # Only devices on servers the session is searching may be selected
+        if server not in servers:
+            continue
+        # Use inventory already loaded by a search, rather than connecting to the server
+        server_inventory = inventory.get(server)
+        if not server_inventory or not server_inventory["devices"]:
+            try:
+                server_inventory = getInventory(server, getServerSession(server))
+            except Exception as e:
+                app.logger.warning(f"Failed to look up devices on {server}: {e}")
+                continue
+        inventory_devices = server_inventory["devices"]
+        for ip in ips:
+            if ip in inventory_devices:
+                devices[getDeviceKey(server, ip)] = inventory_devices[ip]
+    return devices
+
+
+def prefetchDeviceInterfaces(devices: dict) -> None:
+    """
+    Start background interface lookups for devices keyed by device key, on any server
+    """
+    for server, server_devices in groupDevicesByServer(devices).items():
+        prefetchInterfaces(getServerSession(server), list(server_devices.values()))
+
+
+# Interface lookups in progress, keyed by device UUID. Lookups run in the background,
+# so they can be started before the provisioning page is loaded
+interface_lookups = {}
+interface_lookups_lock = threading.Lock()
+interface_executor = ThreadPoolExecutor(
+    max_workers=DETAIL_CONCURRENCY, thread_name_prefix="interfaces"
+)
+
+
+def getCachedInterfaces(device: Device) -> dict:
+    """
+    Return device interfaces from shared store, or None if not cached
+    or if the device has changed since interfaces were cached
+    """
+    cached = shared_store.get("device_interfaces", device.id)
+    if cached and cached["lastUpdateTime"] == device.lastUpdateTime:
+        return cached["interfaces"]
+    return None
+
+
+def prefetchInterfaces(dnac: api.DNACenterAPI, devices: list) -> dict:
+    """
+    Start background interface lookups for devices which are not cached
+
+    Returns dict of device UUID to lookup Future, for devices not cached
+    """
+    lookups = {}
+    for device in devices:
+        if getCachedInterfaces(device) is not None:
+            continue
+        with interface_lookups_lock:
+            # Don't look up the same device twice at once
+            lookup = interface_lookups.get(device.id)
+            if not lookup:
+                lookup = interface_executor.submit(
+                    runInBackground, refreshInterfaces, dnac, device
+                )
+                interface_lookups[device.id] = lookup
+        lookups[device.id] = lookup
+    return lookups
+
+
+def refreshInterfaces(dnac: api.DNACenterAPI, device: Device) -> dict:
+    """
+    Query DNAC for device interfaces & save them to shared store
+    """
+    try:
+        interfaces = getDeviceInterfaces(dnac, device.id)
+        shared_store.set(
+            "device_interfaces",
+            device.id,
+            {"lastUpdateTime": device.lastUpdateTime, "interfaces": interfaces},
+        )
+        return interfaces
+    finally:
+        with interface_lookups_lock:
+            interface_lookups.pop(device.id, None)
+
+
+def getInterfaces(dnac: api.DNACenterAPI, devices: dict) -> dict:
+    """
+    Return interfaces which may be provisioned on each device, keyed by management IP
+
+    Interfaces are served from cache where possible, otherwise this waits
+    for lookups already in progress. Devices whose lookup fails or does not
+    complete in time have no interfaces listed.
+    """
+    lookups = prefetchInterfaces(dnac, list(devices.values()))
+    if lookups:
+        deadline = ceil(len(lookups) / max(1, DETAIL_CONCURRENCY)) * DETAIL_TIMEOUT
+        wait(lookups.values(), timeout=deadline)
+    interfaces = {}
+    for ip, device in devices.items():
+        lookup = lookups.get(device.id)
+        if not lookup:
+            device_interfaces = getCachedInterfaces(device) or {}
+        elif not lookup.done():
+            app.logger.warning(f"Interface lookup timed out for {ip}")
+            device_interfaces = {}
+        elif lookup.exception():
+            app.logger.warning(
+                f"Interface lookup failed for {ip}: {lookup.exception()}"
+            )
+            device_interfaces = {}
+        else:
+            device_interfaces = lookup.result()
+        interfaces[ip] = filterInterfaces(device, device_interfaces)
+    return interfaces
+
+
+def filterInterfaces(device: Device, interfaces: dict) -> dict:
+    """
+    Select interfaces which may be provisioned, using port name pattern for the
+    device platform
+    """
+    pattern = default_port_pattern
+    for platform_pattern, port_pattern in platform_port_patterns:
+        if platform_pattern.search(device.platform):
+            pattern = port_pattern
+            break
+    return {
+        name: interface
+        for name, interface in interfaces.items()
+        if pattern.search(name)
+    }
+
+
+# Interface names are split into type & numbers, such as TenGigabitEthernet, 3, 1, 4
+# for TenGigabitEthernet3/1/4 - stack member 3, module 1, port 4.
+# Port ranges use the same numbering, with an optional interface type prefix
+# & ranges of members or ports, such as 3/0/1-48, Te1-8/1/1-4 or GigabitEthernet1/0/5
+INTERFACE_NAME_PATTERN = re.compile(r"^([A-Za-z-]+)(\d+(?:/\d+)*)/(\d+)$")
+PORT_RANGE_PATTERN = re.compile(
+    r"^([A-Za-z-]*)(\d+)(?:-(\d+))?((?:/\d+)*)/(\d+)(?:-(\d+))?$"
+)
+
+
+def indexInterfaces(interfaces: dict) -> dict:
+    """
+    Index interfaces by slot (stack member & module, such as "3/0") & port number
+
+    Returns {slot: {port: [interface names]}}. Several interfaces may share
+    a slot & port, such as Gi1/1/1 & Te1/1/1 on a network module.
+    Interfaces not numbered by slot & port are left out
+    """
+    index = {}
+    for name in interfaces:
+        match = INTERFACE_NAME_PATTERN.match(name)
+        if match:
+            _, slot, port = match.groups()
+            index.setdefault(slot, {}).setdefault(int(port), []).append(name)
+    return index
+
+
+def expandPorts(ports: list, interfaces: dict, index: dict = None) -> list:
+    """
+    Expand list of interface names & port ranges into interface names
+
+    Ranges such as 3/0/1-48 or Te1-8/1/1-4 select every port in the range,
+    and must only include interfaces in the given interfaces. Without a type,
+    a range may only include ports with a single interface on each slot & port.
+    Raises ValueError if a port or range is not valid
+    """
+    if index is None:
+        index = indexInterfaces(interfaces)
+    expanded = []
+    unknown = []
+    for entry in ports:
+        if entry in interfaces:
+            expanded.append(entry)
+            continue
+        match = PORT_RANGE_PATTERN.match(entry)
+        if not match:
+            unknown.append(entry)
+            continue
+        type_prefix, first_member, last_member, modules, first_port, last_port = (
+            match.groups()
+        )
+        members = range(int(first_member), int(last_member or first_member) + 1)
+        port_numbers = range(int(first_port), int(last_port or first_port) + 1)
+        if not members or not port_numbers:
+            raise ValueError(f"Port range {entry} ends before it starts")
+        if len(members) * len(port_numbers) > len(interfaces):
+            unknown.append(entry)
+            continue
+        missing = []
+        for member in members:
+            slot = f"{member}{modules}"
+            for port in port_numbers:
+                names = [
+                    name
+                    for name in index.get(slot, {}).get(port, [])
+                    if name.lower().startswith(type_prefix.lower())
+                ]
+                if not names:
+                    missing.append(f"{type_prefix}{slot}/{port}")
+                elif len(names) > 1:
+                    raise ValueError(
+                        f"Port {type_prefix}{slot}/{port} may be any of "
+                        f"{', '.join(names)}. "
+                        f"Add the interface type to the range, such as {names[0]}"
+                    )
+                else:
+                    expanded.append(names[0])
+        if len(missing) == 1 and "-" not in entry:
+            unknown.append(missing[0])
+        elif missing:
+            unknown.append(f"{entry} ({len(missing)} missing, such as {missing[0]})")
+    if unknown:
+        raise ValueError(f"Unknown or unavailable ports: {', '.join(unknown)}")
+    return expanded
+
+
+def groupInterfaces(interfaces: dict) -> list:
+    """
+    Group interfaces by slot for the provisioning page
+
+    Returns list of groups, each with a label, the port ranges covering the group,
+    and (name, interface) of each interface in port order. Interfaces not numbered
+    by slot & port are listed in a final group
+    """
+    groups = []
+    grouped = set()
+    for slot, ports in sorted(
+        indexInterfaces(interfaces).items(),
+        key=lambda item: [int(number) for number in item[0].split("/")],
+    ):
+        members = slot.split("/")
+        label = (
+            f"Member {members[0]}, module {members[1]}"
+            if len(members) == 2
+            else f"Slot {slot}"
+        )
+        names = [name for port in sorted(ports) for name in ports[port]]
+        grouped.update(names)
+        groups.append(
+            {
+                "label": label,
+                "ranges": getPortRanges(slot, names),
+                "interfaces": [(name, interfaces[name]) for name in names],
+            }
+        )
+    other = [name for name in interfaces if name not in grouped]
+    if other:
+        groups.append(
+            {
+                "label": "Other",
+                "ranges": [],
+                "interfaces": [(name, interfaces[name]) for name in other],
+            }
+        )
+    return groups
+
+
+def getPortRanges(slot: str, names: list) -> list:
+    """
+    Describe interfaces on one slot as port ranges, such as Gi3/0/1-48
+
+    Interface types are abbreviated to the shortest prefix that is unique on the slot
+    """
+    types = {}
+    for name in names:
+        interface_type, _, port = INTERFACE_NAME_PATTERN.match(name).groups()
+        types.setdefault(interface_type, []).append(int(port))
+    ranges = []
+    for interface_type, ports in types.items():
+        length = 2
+        while length < len(interface_type) and any(
+            other != interface_type and other.startswith(interface_type[:length])
+            for other in types
+        ):
+            length += 1
+        abbreviation = interface_type[:length]
+        start = previous = ports[0]
+        for port in ports[1:] + [None]:
+            if port == previous + 1:
+                previous = port
+                continue
+            span = str(start) if start == previous else f"{start}-{previous}"
+            ranges.append(f"{abbreviation}{slot}/{span}")
+            start = previous = port
+    return ranges
+
+
+# Shared switch inventory for each DNAC server, keyed by server name from
+# dna-servers.yaml. Loaded on first search, then refreshed in the background every
+# INVENTORY_REFRESH seconds.
+# Devices are retrieved from DNAC in pages of INVENTORY_PAGE_SIZE. A page shorter than
+# requested ends the inventory, so the size is capped at the API maximum of 500
+INVENTORY_REFRESH = int(os.getenv("INVENTORY_REFRESH", "300"))
+INVENTORY_PAGE_SIZE = min(500, max(1, int(os.getenv("INVENTORY_PAGE_SIZE", "500"))))
+inventory = {}
+inventory_lock = threading.Lock()
+
+
+def getInventory(server: str, dnac: api.DNACenterAPI) -> dict:
+    """
+    Return inventory cache entry for a DNAC server, loading it on first use
+    """
+    with inventory_lock:
+        if server not in inventory:
+            inventory[server] = {
+                "lock": threading.Lock(),
+                "load_lock": threading.Lock(),
+                "username": None,
+                "devices": {},
+                "index": {},
+                "retry": set(),
+                "loaded": 0,
+                "loading": None,
+                "load_done": None,
+                "error": None,
+                "hits": 0,
+                "misses": 0,
+            }
+        entry = inventory[server]
+
+    # Background refreshes use the service account, or the most recent user's client
+    # while they're still logged in. The client itself isn't kept
+    entry["username"] = getClientUsername(dnac) or entry["username"]
+    if entry["loaded"] or entry["loading"]:
+        entry["hits"] += 1
+        return entry
+
+    # Only one request starts loading the inventory, any others wait for the first page
+    with entry["load_lock"]:
+        if entry["loaded"] or entry["loading"]:
+            entry["hits"] += 1
+        else:
+            entry["misses"] += 1
+            # Use inventory saved by another process, if it's still fresh
+            if not loadInventorySnapshot(server):
+                # Otherwise load inventory in the background, one page at a time.
+                # Searches use the devices loaded so far, once the first page is ready
+                # The load thread clears entry["loading"] when done, so wait on a local
+                loading = entry["loading"] = threading.Event()
+                entry["load_done"] = threading.Event()
+                entry["error"] = None
+                startBackgroundThread(
+                    f"inventory-load-{server}", lambda: loadInventory(server)
+                )
+                loading.wait()
+                if entry["error"] and not entry["devices"]:
+                    raise entry["error"]
+            startBackgroundThread("inventory-refresh", inventoryRefreshLoop)
+    return entry
+
+
+def loadInventory(server: str) -> None:
+    """
+    Background thread to load inventory for a DNAC server for the first time
+    """
+    entry = inventory[server]
+    # Searches are waiting for the first page, which is loaded as an interactive call
+    dnac_priority.set(INTERACTIVE)
+    try:
+        refreshInventory(server, stream=True)
+    except Exception as e:
+        app.logger.error(f"Failed to load inventory for {server}: {e}")
+        entry["error"] = e
+    finally:
+        loading = entry["loading"]
+        entry["loading"] = None
+        # Release any requests still waiting on the first page or the whole inventory
+        loading.set()
+        entry["load_done"].set()
+
+
+def isInventoryLoading(server: str) -> bool:
+    """
+    True while inventory for a server is still being loaded for the first time
+    """
+    entry = inventory.get(server)
+    return bool(entry and entry["loading"])
+
+
+def waitForInventory(server: str, timeout: float = None) -> bool:
+    """
+    Wait until inventory for a server has been loaded for the first time,
+    or until timeout. Returns False if still loading
+    """
+    entry = inventory.get(server)
+    if entry and entry["loading"]:
+        return entry["load_done"].wait(timeout)
+    return True
+
+
+def getInventoryAge(server: str) -> int:
+    """
+    Seconds since inventory for a server was last refreshed, or None if never loaded
+    """
+    entry = inventory.get(server)
+    if not entry or not entry["loaded"]:
+        return None
+    return int(time() - entry["loaded"])
+
+
+def getDeviceList(dnac: api.DNACenterAPI):
+    """
+    Query DNAC for all switches, one page at a time
+
+    Yields a list of devices for each page
+    """
+    offset = 1
+    while True:
+        # Query Devices / Filter by device family
+        response = dnac.devices.get_device_list(
+            family="Switches and Hubs", offset=offset, limit=INVENTORY_PAGE_SIZE
+        )
+        yield response["response"]
+        # A partial page means there are no more devices
+        if len(response["response"]) < INVENTORY_PAGE_SIZE:
+            return
+        offset += INVENTORY_PAGE_SIZE
+
+
+def refreshInventory(server: str, stream: bool = False) -> None:
+    """
+    Query DNAC for all switches & update the inventory cache
+
+    Device details (location) are only looked up for devices that are new,
+    have changed since the last refresh (per lastUpdateTime), or failed last time.
+    If stream is set, devices are added to the inventory cache as each page is loaded.
+    """
+    entry = inventory[server]
+    dnac = getTrackerClient(getServerURL(server), entry["username"])
+    if not dnac:
+        raise RuntimeError("No DNAC client available, waiting for a user to log in")
+    app.logger.info(f"Refreshing device inventory for {server}...")
+
+    devices = {}
+    retry = set()
+    updated = 0
+    for page in getDeviceList(dnac):
+        # Collect device info that we need to keep
+        lookups = []
+        for device in page:
+            mgtIP = device["managementIpAddress"]
+            cached = entry["devices"].get(mgtIP)
+            if (
+                cached
+                and cached.id == device["instanceUuid"]
+                and cached.lastUpdateTime == device["lastUpdateTime"]
+                and mgtIP not in entry["retry"]
+            ):
+                devices[mgtIP] = cached
+                continue
+            timestamp = datetime.fromtimestamp(device["lastUpdateTime"] / 1000)
+            devices[mgtIP] = Device(
+                id=device["instanceUuid"],
+                name=device["hostname"],
+                platform=device["platformId"],
+                version=device["softwareVersion"],
+                reachability=device["reachabilityStatus"],
+                family=device["family"],
+                series=device["series"],
+                lastUpdateTime=device["lastUpdateTime"],
+                lastupdate=timestamp.strftime("%b %d %Y, %I:%M%p"),
+            )
+            lookups.append(mgtIP)
+
+        # Query device location for new / changed devices concurrently.
+        # Any lookup that fails or times out is left as unknown & retried next refresh
+        def getLocation(device: str) -> str:
+            detailed_info = dnac.devices.get_device_detail(
+                identifier="uuid", search_by=devices[device].id
+            )
+            return detailed_info["response"]["location"]
+
+        locations = runConcurrently(
+            getLocation, lookups, DETAIL_CONCURRENCY, DETAIL_TIMEOUT
+        )
+        for device in lookups:
+            devices[device].location = locations.get(device) or "Unknown"
+        retry.update(set(lookups) - set(locations))
+        updated += len(lookups)
+
+        if stream:
+            # Make devices loaded so far available to searches
+            updateInventory(server, dict(devices), set(retry), 0)
+            entry["loading"].set()
+            dnac_priority.set(BACKGROUND)
+
+    updateInventory(server, devices, retry, time())
+    # Save snapshot so that other processes can skip their initial load
+    shared_store.set(
+        "inventory",
+        server,
+        {
+            "loaded": entry["loaded"],
+            "retry": list(entry["retry"]),
+            "devices": {ip: asdict(device) for ip, device in devices.items()},
+        },
+    )
+    app.logger.info(
+        f"Inventory for {server}: {len(devices)} devices, {updated} updated."
+    )
+
+
+def updateInventory(server: str, devices: dict, retry: set, loaded: float) -> None:
+    """
+    Replace devices in inventory cache & rebuild search index of hostname,
+    site & platform
+    """
+    entry = inventory[server]
+    index = {}
+    for mgtIP, device in devices.items():
+        index[mgtIP] = " ".join(
+            [device.name, device.location, device.platform or ""]
+        ).lower()
+
+    with entry["lock"]:
+        entry["devices"] = devices
+        entry["index"] = index
+        entry["retry"] = retry
+        entry["loaded"] = loaded
+
+
+def loadInventorySnapshot(server: str) -> bool:
+    """
+    Load inventory from shared store, if saved within the last INVENTORY_REFRESH seconds
+
+    Returns True if inventory was loaded
+    """
+    snapshot = shared_store.get("inventory", server)
+    if not snapshot or time() - snapshot["loaded"] > INVENTORY_REFRESH:
+        return False
+    devices = {ip: Device(**device) for ip, device in snapshot["devices"].items()}
+    updateInventory(server, devices, set(snapshot["retry"]), snapshot["loaded"])
+    app.logger.info(f"Loaded inventory for {server} from shared store.")
+    return True
+
+
+def inventoryRefreshLoop() -> None:
+    """
+    Background thread to periodically refresh all loaded inventories
+    """
+    while True:
+        sleep(INVENTORY_REFRESH)
+        for server in list(inventory):
+            if inventory[server]["loading"]:
+                # Still loading for the first time
+                continue
+            try:
+                with inventory[server]["load_lock"]:
+                    refreshInventory(server)
+            except Exception as e:
+                # Keep serving the previous inventory until the next refresh
+                app.logger.error(f"Failed to refresh inventory for {server}: {e}")
+
+
+# Background threads by name, so each is only started once per process
+background_threads = {}
+background_threads_lock = threading.Lock()
+
+
+def startBackgroundThread(name: str, target) -> None:
+    """
+    Start a daemon thread running target, unless it's already running
+
+    DNAC API calls made by the thread are background calls
+    """
+    with background_threads_lock:
+        thread = background_threads.get(name)
+        if thread and thread.is_alive():
+            return
+        thread = threading.Thread(
+            target=runInBackground, args=(target,), name=name, daemon=True
+        )
+        background_threads[name] = thread
+        thread.start()
+
+
+def runInBackground(func, *args):
+    """
+    Run func with background priority for DNAC API calls
+    """
+    with backgroundPriority():
+        return func(*args)
+
+
+def runConcurrently(func, items: list, concurrency: int, timeout: float) -> dict:
+    """
+    Run func against each item, with at most `concurrency` calls at once
+
+    Returns a dict of item -> result. Items that raise an exception or whose call
+    takes longer than `timeout` seconds are omitted, so callers receive partial results.
+    A call that times out is abandoned & no longer counts towards `concurrency`, so a
+    slow call can't hold up the others: the overall time is at most about
+    ceil(items / concurrency) * timeout. With no timeout, every call is waited for
+    """
+    results = {}
+    if not items:
+        return results
+    pending = deque(items)
+    running = {}
+    # Abandoned calls keep running on their thread, so the pool may need one per item
+    executor = ThreadPoolExecutor(max_workers=len(items))
+    try:
+        while pending or running:
+            while pending and len(running) < max(1, concurrency):
+                item = pending.popleft()
+                # Each call runs in a copy of the caller's context, for the trace ID
+                future = executor.submit(contextvars.copy_context().run, func, item)
+                running[future] = (item, monotonic())
+            wait_time = None
+            if timeout is not None:
+                first_start = min(started for _, started in running.values())
+                wait_time = max(0, first_start + timeout - monotonic())
+            done, _ = wait(running, timeout=wait_time, return_when=FIRST_COMPLETED)
+            for future in done:
+                item, _ = running.pop(future)
+                try:
+                    results[item] = future.result()
+                except Exception as e:
+                    app.logger.warning(f"Lookup failed for {item}: {e}")
+            now = monotonic()
+            for future, (item, started) in list(running.items()):
+                if timeout is not None and now - started >= timeout:
+                    app.logger.warning(f"Lookup timed out for {item}")
+                    del running[future]
+    finally:
+        # Don't wait on calls which timed out
+        executor.shutdown(wait=False)
+    return results
+
+
+def getDeviceInterfaces(dnac: api.DNACenterAPI, device_id: str) -> dict:
+    """
+    Query DNAC for all interfaces based on device UUID
+
+    Returns mapping of interface name to interface UUID, speed (in kbps)
+    & current access VLAN, for all interfaces
+    """
+    interfaces = dnac.devices.get_interface_info_by_id(device_id)
+
+    device_interfaces = {}
+    for interface in interfaces["response"]:
+        speed = str(interface.get("speed") or "")
+        device_interfaces[interface["portName"]] = {
+            "id": interface["id"],
+            "speed": int(speed) if speed.isdigit() else None,
+            "vlan": str(interface.get("vlanId") or ""),
+        }
+    return device_interfaces
+
+
+def getDNACSession(user=None, passwd=None) -> api.DNACenterAPI:
+    """
+    General function for creating session to DNAC
+
+    Default will use server side session credentials,
+    unless specific user/password are provided
+    """
+    if user and passwd:
+        return getDNACClient(session.get("dnac_url"), user, passwd)
+    else:
+        return getDNACClient(
+            session.get("dnac_url"), session.get("username"), session.get("password")
+        )
+
+
+# Rate limiters for each DNAC server & username, keyed by (server URL, username).
+# Clients for the same user share a limiter, so in MULTIAUTH mode all sessions share one
+rate_limiters = {}
+rate_limiters_lock = threading.Lock()
+
+# Priority of DNAC API calls made in the current context. Calls made for a user
+# are interactive, while calls made by background threads wait for interactive calls
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+dnac_priority = contextvars.ContextVar("dnac_priority", default=INTERACTIVE)
+
+
+class RateLimiter:
+    """
+    Token bucket limiting the rate of DNAC API calls
+
+    Waiting interactive calls are always served before background calls.
+    After a rate limited (429) response, all calls are held until Retry-After
+    has passed.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = self.burst
+        self.updated = time()
+        self.paused_until = 0
+        self.waiting = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.condition = threading.Condition()
+
+    def acquire(self, priority: str) -> float:
+        """
+        Wait until a call may be made, returning seconds waited
+        """
+        start = time()
+        with self.condition:
+            self.waiting[priority] += 1
+            try:
+                while True:
+                    now = time()
+                    self.tokens = min(
+                        self.burst, self.tokens + (now - self.updated) * self.rate
+                    )
+                    self.updated = now
+                    ready = self.tokens >= 1 and now >= self.paused_until
+                    if not ready:
+                        self.condition.wait(
+                            max(self.paused_until - now, (1 - self.tokens) / self.rate)
+                        )
+                    elif priority == INTERACTIVE or not self.waiting[INTERACTIVE]:
+                        self.tokens -= 1
+                        return now - start
+                    else:
+                        self.condition.wait()
+            finally:
+                self.waiting[priority] -= 1
+                # Let background calls proceed once no interactive calls are waiting
+                self.condition.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """
+        Hold all calls for the given number of seconds, then resume one at a time
+        """
+        with self.condition:
+            self.paused_until = max(self.paused_until, time() + seconds)
+            self.tokens = min(self.tokens, 1)
+
+
+def getRateLimiter(base_url: str, username: str) -> RateLimiter:
+    """
+    Return the shared rate limiter for a DNAC server & username, or None if disabled
+    """
+    if DNAC_RATE_LIMIT <= 0:
+        return None
+    with rate_limiters_lock:
+        key = (base_url, username)
+        if key not in rate_limiters:
+            rate_limiters[key] = RateLimiter(DNAC_RATE_LIMIT, DNAC_RATE_BURST)
+        return rate_limiters[key]
+
+
+class SingleFlight:
+    """
+    Share one in-flight call between concurrent callers with the same key
+
+    The first caller makes the call, while later callers wait for its result
+    (or exception). Nothing is kept once the call completes, so any caching
+    is left to callers.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    def do(self, key, func) -> tuple:
+        """
+        Call func(), or wait for a call already in flight for key
+
+        Returns (result, True if the result came from a call already in flight)
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Future()
+                self.stats["calls"] += 1
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            return call.result(), True
+        try:
+            result = func()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result, False
+        finally:
+            with self.lock:
+                self.calls.pop(key, None)
+
+
+# Identical DNAC reads in flight, keyed by (server URL, endpoint, parameters).
+# Reads are shared by all users of a server, as the device inventory already is
+dnac_reads = SingleFlight()
+
+
+@contextmanager
+def backgroundPriority():
+    """
+    Make DNAC API calls within a block as background calls
+    """
+    token = dnac_priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        dnac_priority.reset(token)
+
+
+def getServerURL(server: str) -> str:
+    """
+    Base URL of a DNAC server in dna-servers.yaml
+    """
+    server_address = dnac_config["servers"][server]["address"]
+    # Addresses are normally host names / IPs, but may include a scheme (for testing)
+    if "://" not in server_address:
+        server_address = f"https://{server_address}"
+    return f"{server_address}/"
+
+
+def getServerSession(server: str) -> api.DNACenterAPI:
+    """
+    DNAC client for any server in dna-servers.yaml, using the session's credentials
+    """
+    return getDNACClient(
+        getServerURL(server), session.get("username"), session.get("password")
+    )
+
+
+sdk_lock = threading.Lock()
+
+
+def loadSDK() -> None:
+    """
+    Import dnacentersdk on first use, replacing the api & exception placeholders
+    """
+    global api, ApiError, RateLimitError, dnacentersdkException
+    with sdk_lock:
+        if api is not None:
+            return
+        start = time()
+        from dnacentersdk import api as sdk_api
+        from dnacentersdk import exceptions
+
+        ApiError = exceptions.ApiError
+        RateLimitError = exceptions.RateLimitError
+        dnacentersdkException = exceptions.dnacentersdkException
+        api = sdk_api
+        recordBootTiming("sdk_import", time() - start)
+
+
+# Registry of authenticated DNAC API clients, shared by all sessions & threads.
+# Keyed by (server URL, username, password hash). Clients unused for TOKEN_LIFETIME
+# are removed, since their token has expired anyway, as are a user's clients on logout
+dnac_clients = {}
+dnac_clients_lock = threading.Lock()
+
+
+def getClientKey(base_url: str, username: str, password: str) -> tuple:
+    password_hash = hashlib.sha256(str(password).encode()).hexdigest()
+    return (base_url, username, password_hash)
+
+
+def createDNACClient(base_url: str, username: str, password: str) -> api.DNACenterAPI:
+    """
+    Authenticate a new DNAC API client, with metrics & rate limiting
+    """
+    loadSDK()
+    dnac = api.DNACenterAPI(
+        username=username,
+        password=password,
+        base_url=base_url,
+        verify=False,
+        # Rate limited calls are retried by instrumentClient instead
+        wait_on_rate_limit=False,
+    )
+    instrumentClient(dnac, getRateLimiter(base_url, username))
+    return dnac
+
+
+def getDNACClient(base_url: str, username: str, password: str) -> api.DNACenterAPI:
+    """
+    Return a shared, authenticated DNAC API client for the given server & credentials
+
+    Clients are created once and then reused, so that requests don't need to
+    re-authenticate or open a new HTTPS connection. Tokens are refreshed shortly
+    before they expire. If DNAC still rejects a token (401), the SDK will
+    re-authenticate once & retry the call.
+    """
+    key = getClientKey(base_url, username, password)
+    with dnac_clients_lock:
+        for idle_key, idle_entry in list(dnac_clients.items()):
+            if time() - idle_entry["used"] > TOKEN_LIFETIME:
+                del dnac_clients[idle_key]
+        if key not in dnac_clients:
+            dnac_clients[key] = {"lock": threading.Lock(), "client": None, "auth": 0}
+        entry = dnac_clients[key]
+        entry["used"] = time()
+
+    # Lock per client, so that only one thread authenticates / refreshes at a time
+    with entry["lock"]:
+        if entry["client"] is None:
+            try:
+                entry["client"] = createDNACClient(base_url, username, password)
+            except Exception:
+                # Don't keep entries for credentials that failed to authenticate
+                with dnac_clients_lock:
+                    dnac_clients.pop(key, None)
+                raise
+            entry["auth"] = time()
+        elif time() - entry["auth"] > TOKEN_LIFETIME - TOKEN_REFRESH_MARGIN:
+            app.logger.info(f"Refreshing DNAC access token for {username}")
+            entry["client"].session.refresh_token()
+            entry["auth"] = time()
+    return entry["client"]
+
+
+def forgetDNACClient(base_url: str, username: str, password: str) -> None:
+    """
+    Remove a shared DNAC client, so its credentials aren't kept after the user leaves
+    """
+    with dnac_clients_lock:
+        dnac_clients.pop(getClientKey(base_url, username, password), None)
+
+
+class TaskError(Exception):
+    """
+    Raised when a DNAC task fails or does not complete in time
+    """
+
+
+def getTaskStatus(dnac: api.DNACenterAPI, task_id: str) -> dict:
+    """
+    Query DNAC for task status
+    """
+    # Query status of task ID
+    task = dnac.task.get_task_by_id(task_id)
+    return task["response"]
+
+
+def waitForTask(dnac: api.DNACenterAPI, task_id: str) -> dict:
+    """
+    Wait for a DNAC task to complete, polling with backoff
+
+    Raises TaskError if the task fails, or is still running after TASK_TIMEOUT
+    """
+    deadline = time() + TASK_TIMEOUT
+    interval = TASK_POLL_INTERVAL
+    while True:
+        task = getTaskStatus(dnac, task_id)
+        if task.get("isError"):
+            reason = task.get("failureReason") or task.get("progress")
+            raise TaskError(f"Task {task_id} failed: {reason}")
+        if task.get("endTime"):
+            return task
+        if time() + interval > deadline:
+            raise TaskError(f"Task {task_id} did not complete within {TASK_TIMEOUT}s")
+        sleep(interval)
+        interval = min(interval * 2, 2)
+
+
+# Recent latency samples for each stage of a deployment, used to report p50 / p95
+stage_latency = {}
+
+
+def recordLatency(stage: str, seconds: float) -> None:
+    """
+    Record latency sample for a stage
+    """
+    stage_latency.setdefault(stage, deque(maxlen=500)).append(seconds)
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def getPercentiles(samples) -> tuple:
+    """
+    Return (p50, p95) of a list of samples
+    """
+    ordered = sorted(samples)
+    if not ordered:
+        return None, None
+    p50 = ordered[int(0.5 * (len(ordered) - 1))]
+    p95 = ordered[int(0.95 * (len(ordered) - 1))]
+    return p50, p95
+
+
+@contextmanager
+def timeStage(stage: str):
+    """
+    Record how long a block takes & log it, along with the stage p50 / p95
+    """
+    start = time()
+    try:
+        yield
+    finally:
+        recordLatency(stage, time() - start)
+        p50, p95 = getPercentiles(stage_latency[stage])
+        app.logger.info(
+            f"Stage {stage} took {stage_latency[stage][-1]:.2f}s "
+            f"(p50 {p50:.2f}s, p95 {p95:.2f}s)"
+        )
+
+
+# Prometheus metrics, exported at /metrics. When running multiple gunicorn workers,
+# PROMETHEUS_MULTIPROC_DIR is set by gunicorn.conf.py so that metrics cover all workers
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+DNAC_REQUEST_SECONDS = Histogram(
+    "dnac_request_seconds",
+    "Catalyst Center API call latency, including any retries",
+    ["operation", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+DNAC_THROTTLE_SECONDS = Histogram(
+    "dnac_throttle_seconds",
+    "Time Catalyst Center API calls waited for the rate limiter",
+    ["priority"],
+    buckets=LATENCY_BUCKETS,
+)
+DNAC_RETRIES = Counter(
+    "dnac_request_retries_total",
+    "Catalyst Center API requests retried after a rate limit, expired token "
+    "or connection error",
+    ["operation"],
+)
+BOOT_SECONDS = Gauge(
+    "app_boot_seconds",
+    "Seconds taken by startup phases: imports, startup & sdk_import. warmup "
+    "& first_response are seconds from the start of startup until complete",
+    ["phase"],
+    multiprocess_mode="max",
+)
+DNAC_COALESCED = Counter(
+    "dnac_coalesced_requests_total",
+    "Catalyst Center API reads served by an identical read already in flight",
+    ["operation"],
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds",
+    "Web app request latency",
+    ["route", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+PROJECT_TEMPLATES = Gauge(
+    "dnac_project_templates",
+    "Templates in the Catalyst Center project, as of the last template reaper run",
+    ["server"],
+    multiprocess_mode="mostrecent",
+)
+TEMPLATES_DELETED = Counter(
+    "dnac_templates_deleted_total",
+    "Templates deleted by the template reaper",
+    ["server", "result"],
+)
+STAGE_SECONDS = Histogram(
+    "stage_seconds",
+    "Latency of provisioning & session handling stages",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+
+# DNAC API operations by request method & path, named after the SDK functions used.
+# Any other requests are reported by method & path, with IDs removed
+DNAC_OPERATIONS = [
+    ("GET", re.compile(r"/network-device$"), "get_device_list"),
+    ("GET", re.compile(r"/device-detail$"), "get_device_detail"),
+    (
+        "GET",
+        re.compile(r"/interface/network-device/[^/]+$"),
+        "get_interface_info_by_id",
+    ),
+    ("GET", re.compile(r"/template-programmer/project$"), "get_projects"),
+    (
+        "POST",
+        re.compile(r"/template-programmer/project/[^/]+/template$"),
+        "create_template",
+    ),
+    ("PUT", re.compile(r"/template-programmer/template$"), "update_template"),
+    ("POST", re.compile(r"/template-programmer/template/version$"), "version_template"),
+    ("POST", re.compile(r"/template-programmer/template/deploy$"), "deploy_template"),
+    (
+        "GET",
+        re.compile(r"/template-programmer/template/deploy/status/[^/]+$"),
+        "get_template_deployment_status",
+    ),
+    (
+        "DELETE",
+        re.compile(r"/template-programmer/template/[^/]+$"),
+        "deletes_the_template",
+    ),
+    ("GET", re.compile(r"/task/[^/]+$"), "get_task_by_id"),
+]
+UUID_PATTERN = re.compile(r"[0-9a-fA-F]{8}(-[0-9a-fA-F]{4}){3}-[0-9a-fA-F]{12}")
+
+# DNAC API call in progress on the current thread, used to count HTTP attempts per call
+dnac_call = threading.local()
+
+# Server errors & connection failures are only retried for calls which are safe to
+# repeat. Creating a template twice fails with a task error, handled by uploadTemplate
+RETRY_STATUS_CODES = {500, 502, 503, 504}
+RETRY_METHODS = {"GET", "PUT", "DELETE"}
+RETRY_OPERATIONS = {"create_template", "version_template"}
+MAX_RETRY_BACKOFF = 30
+
+
+def getOperationName(method: str, url: str) -> str:
+    """
+    Name of the DNAC API operation for a request
+    """
+    path = url.split("?")[0]
+    for operation_method, pattern, name in DNAC_OPERATIONS:
+        if method == operation_method and pattern.search(path):
+            return name
+    return f"{method} {UUID_PATTERN.sub('{id}', path)}"
+
+
+def getRetryDelay(method: str, operation: str, error: Exception, attempt: int) -> float:
+    """
+    Seconds to wait before retrying a failed DNAC API call, or None if it
+    should not be retried
+
+    Rate limited calls wait for Retry-After. Other errors back off exponentially
+    from DNAC_RETRY_BACKOFF, with full jitter so that retries are spread out
+    """
+    if attempt >= DNAC_MAX_RETRIES:
+        return None
+    if isinstance(error, RateLimitError):
+        return error.retry_after + random.uniform(0, 1)
+    if method not in RETRY_METHODS and operation not in RETRY_OPERATIONS:
+        return None
+    if isinstance(error, ApiError) and error.status_code not in RETRY_STATUS_CODES:
+        return None
+    return random.uniform(0, min(MAX_RETRY_BACKOFF, DNAC_RETRY_BACKOFF * 2**attempt))
+
+
+def instrumentClient(dnac: api.DNACenterAPI, limiter: RateLimiter = None) -> None:
+    """
+    Rate limit & retry every API call made by a DNAC client,
+    and record latency, outcome & retries of each call
+    """
+    rest_session = dnac.session
+    request = rest_session.request
+
+    def limitedRequest(method, url, erc, custom_refresh, **kwargs):
+        attempt = 0
+        while True:
+            if limiter:
+                priority = dnac_priority.get()
+                DNAC_THROTTLE_SECONDS.labels(priority).observe(
+                    limiter.acquire(priority)
+                )
+            try:
+                return request(method, url, erc, custom_refresh, **kwargs)
+            except dnacentersdkException as e:
+                delay = getRetryDelay(method, dnac_call.operation, e, attempt)
+                if delay is None:
+                    raise
+                if isinstance(e, RateLimitError) and limiter:
+                    # Hold all calls sharing this limiter, not just this one
+                    limiter.pause(delay)
+                else:
+                    sleep(delay)
+                attempt += 1
+                app.logger.info(
+                    f"Retrying DNAC {dnac_call.operation} in {delay:.1f}s "
+                    f"(attempt {attempt + 1}): {e}"
+                )
+
+    def timedRequest(method, url, erc, custom_refresh, **kwargs):
+        # The SDK calls itself again after refreshing an expired token,
+        # which is counted as part of the original call
+        if getattr(dnac_call, "operation", None):
+            return request(method, url, erc, custom_refresh, **kwargs)
+        dnac_call.operation = getOperationName(method, url)
+        dnac_call.attempts = 0
+        status = "error"
+        start = time()
+        try:
+            response = limitedRequest(method, url, erc, custom_refresh, **kwargs)
+            status = str(response.status_code)
+            return response
+        except ApiError as e:
+            status = str(e.status_code)
+            raise
+        finally:
+            seconds = time() - start
+            operation = dnac_call.operation
+            DNAC_REQUEST_SECONDS.labels(operation, status).observe(seconds)
+            if dnac_call.attempts > 1:
+                DNAC_RETRIES.labels(operation).inc(dnac_call.attempts - 1)
+            dnac_call.operation = None
+            app.logger.debug(
+                f"DNAC {operation} returned {status} in {seconds:.3f}s "
+                f"({dnac_call.attempts} attempts)"
+            )
+
+    def coalescedRequest(method, url, erc, custom_refresh, **kwargs):
+        # Only plain reads are shared. Calls made while refreshing a token
+        # are part of a call already in progress
+        if (
+            not COALESCE_READS
+            or method != "GET"
+            or kwargs.get("stream")
+            or getattr(dnac_call, "operation", None)
+        ):
+            return timedRequest(method, url, erc, custom_refresh, **kwargs)
+        params = json.dumps(kwargs.get("params"), sort_keys=True, default=str)
+        key = (dnac.base_url, url, params)
+
+        def read():
+            response = timedRequest(method, url, erc, custom_refresh, **kwargs)
+            # Load the body now, so waiting callers can each parse it
+            response.content
+            return response
+
+        response, coalesced = dnac_reads.do(key, read)
+        if coalesced:
+            DNAC_COALESCED.labels(getOperationName(method, url)).inc()
+        return response
+
+    def countAttempt(response, *args, **kwargs):
+        if getattr(dnac_call, "operation", None):
+            dnac_call.attempts += 1
+
+    rest_session.request = coalescedRequest
+    # The SDK also retries after connection errors & expired tokens, so count each
+    # HTTP response. There's no public accessor for the SDK's requests session
+    rest_session._req_session.hooks["response"].append(countAttempt)
+
+
+@app.before_request
+def startRequestTimer():
+    g.request_start = time()
+
+
+@app.teardown_request
+def resetTraceID(exception=None):
+    # Request threads are reused, so a provisioning run's trace ID is cleared after it
+    token = g.pop("trace_token", None)
+    if token:
+        trace_id.reset(token)
+
+
+@app.after_request
+def recordRequestLatency(response):
+    if request.url_rule and "request_start" in g:
+        HTTP_REQUEST_SECONDS.labels(
+            request.url_rule.rule, request.method, str(response.status_code)
+        ).observe(time() - g.request_start)
+        # Time from startup until the app first serves a page or API response
+        if (
+            "first_response" not in boot_timings
+            and response.status_code < 400
+            and request.endpoint not in ("metrics", "cache_stats", "static")
+        ):
+            recordBootTiming("first_response", time() - BOOT_START)
+    return response
+
+
+def recordBootTiming(phase: str, seconds: float) -> None:
+    """
+    Record & log how long a phase of startup took
+    """
+    boot_timings[phase] = seconds
+    BOOT_SECONDS.labels(phase).set(seconds)
+    app.logger.info(f"Startup phase {phase} took {seconds:.2f}s")
+
+
+# Project & template IDs for each DNAC server, keyed by server URL.
+# Populated from a single get_projects listing, and shared by all sessions
+template_ids = {}
+template_ids_lock = threading.Lock()
+template_ids_stats = {"get_projects": 0, "avoided": 0}
+
+
+def getTemplateIDs(dnac: api.DNACenterAPI) -> dict:
+    """
+    Return cached project & template IDs for a DNAC server, querying DNAC if not cached
+    """
+    with template_ids_lock:
+        cached = template_ids.get(dnac.base_url)
+        if cached:
+            template_ids_stats["avoided"] += 1
+            return cached
+        # Query project by name, which also lists all templates in the project
+        template_ids_stats["get_projects"] += 1
+        project = dnac.configuration_templates.get_projects(
+            name=dnac_config["templates"]["project"]
+        )
+        # If name matches, there should only be 1 result
+        cached = {
+            "project": project[0]["id"],
+            "templates": {
+                template["name"]: template["id"] for template in project[0]["templates"]
+            },
+        }
+        template_ids[dnac.base_url] = cached
+        return cached
+
+
+def invalidateTemplateIDs(dnac: api.DNACenterAPI) -> None:
+    """
+    Discard cached project & template IDs for a DNAC server
+    """
+    with template_ids_lock:
+        template_ids.pop(dnac.base_url, None)
+
+
+def getProjectID(dnac: api.DNACenterAPI) -> str:
+    """
+    General function to locate DNA Center project identifier, which will be required to
+    add/remove templates.
+    """
+    project_id = getTemplateIDs(dnac)["project"]
+    app.logger.info(f"Found Project ID: {project_id}")
+    return project_id
+
+
+def getTemplateID(dnac: api.DNACenterAPI, template_name: str) -> str:
+    """
+    Looks up template ID by name
+    """
+    template_id = getTemplateIDs(dnac)["templates"].get(template_name)
+    if template_id:
+        app.logger.info(f"Found Template ID: {template_id}")
+    else:
+        app.logger.info("No template ID found")
+    return template_id
+
+
+def getTemplateName(author: str, device_info: dict) -> str:
+    """
+    Name of the template used for an author & device type
+
+    Each template can only target one device series, so the series is included
+    in the name.
+    Parameterized templates are shared by all authors, so have no author
+    """
+    series = re.sub(r"\W+", "_", device_info.series).strip("_")
+    if not author:
+        return dnac_config["templates"]["template"] + "-" + series
+    return dnac_config["templates"]["template"] + "-" + author + "-" + series
+
+
+def generateTemplatePayload(new_config: dict) -> str:
+    """
+    Create DNA Center template with desired configuration changes
+    """
+    app.logger.info("Generating template...")
+    template_payload = renderTemplatePayload(new_config, PORT_RANGES)
+    app.logger.info("Template Generated!")
+    return template_payload
+
+
+def getTemplateParams(new_config: dict) -> dict:
+    """
+    Return Velocity variables to deploy a config with the shared parameterized
+    template, or None if it's uploaded as its own template
+
+    Names containing separators can't be passed as variables, so configs
+    with these are uploaded as their own template instead
+    """
+    if not PARAMETERIZED_TEMPLATES:
+        return None
+    vlans, ports = getTemplateEntries(new_config, PORT_RANGES)
+    entries = [name for _, name in vlans] + [port for port, _ in ports]
+    if any(":" in entry or ";" in entry for entry in entries):
+        return None
+    return {
+        "vlans": ";".join(f"{vlan_id}:{name}" for vlan_id, name in vlans),
+        "ports": ";".join(f"{port}:{vlan_id}" for port, vlan_id in ports),
+    }
+
+
+def renderTemplatePayload(new_config: dict, port_ranges: bool = False) -> str:
+    """
+    Render VLAN & port config templates for all VLANs in a single pass
+
+    If port_ranges is set, contiguous ports on the same VLAN are collapsed
+    into interface ranges
+    """
+    vlans, ports = getTemplateEntries(new_config, port_ranges)
+    return payload_template.render(vlans=vlans, ports=ports, separator="\n!\n")
+
+
+def getTemplateEntries(new_config: dict, port_ranges: bool = False) -> tuple:
+    """
+    List (VLAN ID, name) of VLANs & (interface, VLAN ID) of ports to configure
+    """
+    vlans = []
+    ports = []
+    # For each new VLAN to create...
+    for entry in new_config:
+        vlan_id = new_config[entry]["vlan_id"]
+        # VLANs which already exist on the device are left out of config diffs
+        if new_config[entry].get("create_vlan", True):
+            vlans.append((vlan_id, new_config[entry]["vlan_name"]))
+        port_list = [
+            port for port in new_config[entry]["ports"].split("\n") if port.strip()
+        ]
+        if port_ranges:
+            for interface_range in getInterfaceRanges(port_list):
+                ports.append((interface_range, vlan_id))
+        else:
+            for port in port_list:
+                ports.append((port, vlan_id))
+    return vlans, ports
+
+
+# IOS-XE allows up to 5 comma separated ranges in a single interface range command
+MAX_RANGES_PER_COMMAND = 5
+
+
+def getInterfaceRanges(port_list: list) -> list:
+    """
+    Collapse list of interface names into IOS-XE interface ranges
+
+    For example, GigabitEthernet1/0/1, GigabitEthernet1/0/2 & GigabitEthernet1/0/3
+    becomes "range GigabitEthernet1/0/1 - 3". Ranges are only formed within the same
+    module, and at most MAX_RANGES_PER_COMMAND ranges are included per command.
+    Interface names that can't be parsed are returned unchanged.
+    """
+    modules = {}
+    interfaces = []
+    for port in port_list:
+        port = port.strip()
+        if not port:
+            continue
+        match = re.match(r"^(.*\D)(\d+)$", port)
+        if not match:
+            interfaces.append(port)
+            continue
+        prefix, number = match.group(1), int(match.group(2))
+        modules.setdefault(prefix, set()).add(number)
+
+    # Find runs of consecutive port numbers within each module
+    ranges = []
+    for prefix, numbers in modules.items():
+        numbers = sorted(numbers)
+        start = previous = numbers[0]
+        for number in numbers[1:] + [None]:
+            if number == previous + 1:
+                previous = number
+                continue
+            if start == previous:
+                ranges.append(f"{prefix}{start}")
+            else:
+                ranges.append(f"{prefix}{start} - {previous}")
+            start = previous = number
+
+    for i in range(0, len(ranges), MAX_RANGES_PER_COMMAND):
+        command = ranges[i : i + MAX_RANGES_PER_COMMAND]
+        if len(command) == 1 and " - " not in command[0]:
+            # Single interface, no need for a range
+            interfaces.append(command[0])
+        else:
+            interfaces.append("range " + " , ".join(command))
+    return interfaces
+
+
+# Reason shown for devices skipped because their running config already matches
+NO_CHANGES = "No changes needed"
+
+
+def getRunningConfig(dnac: api.DNACenterAPI, device: Device) -> str:
+    """
+    Return device running config, from shared store unless the device
+    has changed since it was cached
+    """
+    cached = shared_store.get("running_config", device.id)
+    if cached and cached["lastUpdateTime"] == device.lastUpdateTime:
+        return cached["config"]
+    config = dnac.devices.get_device_config_by_id(network_device_id=device.id)
+    shared_store.set(
+        "running_config",
+        device.id,
+        {"lastUpdateTime": device.lastUpdateTime, "config": config["response"]},
+    )
+    return config["response"]
+
+
+def forgetRunningConfig(devices: dict) -> None:
+    """
+    Discard cached running config of devices about to be provisioned
+    """
+    for device_info in devices.values():
+        shared_store.delete("running_config", device_info.id)
+
+
+def parseRunningConfig(config: str) -> tuple:
+    """
+    Parse VLANs & interface VLAN membership from a running config
+
+    Returns (dict of VLAN ID to name, dict of interface name to state),
+    where interface state holds the switchport mode, access VLAN & shutdown flag
+    """
+    vlans = {}
+    interfaces = {}
+    vlan_ids = []
+    interface = None
+    for line in config.splitlines():
+        if not line.startswith(" "):
+            # Start of a new section
+            vlan_ids, interface = [], None
+            match = re.match(r"^vlan ([\d,\-]+)\s*$", line)
+            if match:
+                for part in match.group(1).split(","):
+                    first, _, last = part.partition("-")
+                    vlan_ids.extend(range(int(first), int(last or first) + 1))
+                for vlan_id in vlan_ids:
+                    vlans[vlan_id] = f"VLAN{vlan_id:04d}"
+                continue
+            match = re.match(r"^interface (\S+)\s*$", line)
+            if match:
+                interface = {"mode": None, "vlan": 1, "shutdown": False}
+                interfaces[match.group(1)] = interface
+            continue
+        line = line.strip()
+        if vlan_ids and line.startswith("name "):
+            for vlan_id in vlan_ids:
+                vlans[vlan_id] = line[len("name ") :]
+        elif interface is not None:
+            if line.startswith("switchport mode "):
+                interface["mode"] = line[len("switchport mode ") :]
+            elif re.match(r"^switchport access vlan \d+$", line):
+                interface["vlan"] = int(line.split()[-1])
+            elif line == "shutdown":
+                interface["shutdown"] = True
+    return vlans, interfaces
+
+
+def describeInterface(interface: dict) -> str:
+    if not interface:
+        return "not in running config"
+    if interface["mode"] != "access":
+        return f"{interface['mode'] or 'dynamic'} mode"
+    state = f"VLAN {interface['vlan']}"
+    if interface["shutdown"]:
+        state += ", shutdown"
+    return state
+
+
+def diffVLANConfig(new_config: dict, running_config: str) -> tuple:
+    """
+    Compare VLAN config, in the format posted by the provisioning page,
+    against a device's running config
+
+    Returns (config with only the VLANs & ports which need to change, changes),
+    where changes lists VLANs to create or rename, ports to change, and the number
+    of ports already configured as requested
+    """
+    vlans, interfaces = parseRunningConfig(running_config)
+    delta = {}
+    changes = {"vlans": [], "ports": [], "unchanged": 0}
+    for entry, vlan in new_config.items():
+        vlan_id = int(vlan["vlan_id"])
+        create_vlan = vlans.get(vlan_id) != vlan["vlan_name"]
+        if create_vlan:
+            changes["vlans"].append(
+                {
+                    "vlan_id": vlan_id,
+                    "vlan_name": vlan["vlan_name"],
+                    "current": vlans.get(vlan_id),
+                }
+            )
+        ports = []
+        for port in vlan["ports"].split("\n"):
+            port = port.strip()
+            if not port:
+                continue
+            interface = interfaces.get(port)
+            if interface == {"mode": "access", "vlan": vlan_id, "shutdown": False}:
+                changes["unchanged"] += 1
+                continue
+            ports.append(port)
+            changes["ports"].append(
+                {
+                    "port": port,
+                    "vlan_id": vlan_id,
+                    "current": describeInterface(interface),
+                }
+            )
+        if create_vlan or ports:
+            delta[entry] = dict(vlan, ports="\n".join(ports), create_vlan=create_vlan)
+    return delta, changes
+
+
+def getConfigChanges(dnac: api.DNACenterAPI, devices: dict, configs: dict) -> dict:
+    """
+    Diff the VLAN config for each device against its running config
+
+    Returns dict of management IP to (config to deploy, changes). If DIFF_CONFIG
+    is disabled or the running config can't be retrieved, the full config
+    is deployed & changes is None
+    """
+    running = {}
+    if DIFF_CONFIG:
+        running = runConcurrently(
+            lambda ip: getRunningConfig(dnac, devices[ip]),
+            list(devices),
+            DETAIL_CONCURRENCY,
+            DETAIL_TIMEOUT,
+        )
+    changes = {}
+    for ip in devices:
+        if running.get(ip) is None:
+            changes[ip] = (configs[ip], None)
+        else:
+            changes[ip] = diffVLANConfig(configs[ip], running[ip])
+    return changes
+
+
+def getDevicePayloads(dnac: api.DNACenterAPI, devices: dict, configs: dict) -> dict:
+    """
+    Render the template payload each device needs, grouping devices which share one
+
+    Returns dict of payload to {"params": Velocity variables to deploy it with the
+    shared parameterized template or None, "devices": {management IP: Device}}.
+    Devices with nothing to change are grouped under an empty payload
+    """
+    payloads = {}
+    for ip, (config, _) in getConfigChanges(dnac, devices, configs).items():
+        payload = generateTemplatePayload(config) if config else ""
+        if payload not in payloads:
+            params = getTemplateParams(config) if config else None
+            payloads[payload] = {"params": params, "devices": {}}
+        payloads[payload]["devices"][ip] = devices[ip]
+    return payloads
+
+
+def provisionPayloads(
+    dnac: api.DNACenterAPI, author: str, payloads: dict, template_author: str = None
+) -> list:
+    """
+    Provision each payload to its devices, returning list of deployment IDs
+
+    payloads is a dict of payload to its params & devices, as from getDevicePayloads.
+    Deployments are recorded under author, and templates are named after
+    template_author (author if not given).
+    Devices with an empty payload are recorded as successful without deploying
+    """
+    template_author = template_author or author
+    deploy_ids = []
+    changed = [payload for payload in payloads if payload]
+    for payload, entry in payloads.items():
+        devices = entry["devices"]
+        if not payload:
+            deploy_ids.append(
+                trackDeployment(
+                    None, dnac, None, devices, "", NO_CHANGES, author, status="success"
+                )
+            )
+            continue
+        payload_template_author = template_author
+        if len(changed) > 1:
+            # Templates are named after the author, so each payload needs its own
+            payload_hash = hashlib.sha256(payload.encode()).hexdigest()
+            payload_template_author = f"{template_author}-{payload_hash[:8]}"
+        deploy_ids.extend(
+            provisionDevices(
+                dnac, author, payload, devices, payload_template_author, entry["params"]
+            )
+        )
+    return deploy_ids
+
+
+def provisionDevices(
+    dnac: api.DNACenterAPI,
+    author: str,
+    template_payload: str,
+    devices: dict,
+    template_author: str = None,
+    params: dict = None,
+) -> list:
+    """
+    Upload & deploy template payload to many devices at once
+
+    Devices are grouped by family & series, since each DNAC template targets
+    specific device types. Each group gets one template & one deployment,
+    and groups are provisioned concurrently. Deployments are recorded under
+    author, and the template is named after template_author (author if not given).
+    With params, the shared parameterized template is deployed with these variables.
+    Returns list of deployment IDs, which are followed by the deployment tracker
+    """
+    groups = {}
+    for device_ip, device_info in devices.items():
+        group = (device_info.family, device_info.series)
+        groups.setdefault(group, {})[device_ip] = device_info
+
+    # Parameterized templates are shared, so only the variables change per deployment
+    if params:
+        upload_payload, upload_author = velocity_payload, None
+    else:
+        upload_payload, upload_author = template_payload, template_author or author
+
+    def provisionGroup(group: tuple) -> str:
+        group_devices = groups[group]
+        device_info = next(iter(group_devices.values()))
+        template_id = None
+        try:
+            template_id, unchanged = uploadTemplate(
+                dnac, upload_payload, device_info, upload_author
+            )
+            # Record when the template was last used, so the reaper leaves it alone
+            job_store.useTemplate(
+                dnac.base_url,
+                template_id,
+                getTemplateName(upload_author, device_info),
+                shared=not upload_author,
+                username=getClientUsername(dnac),
+            )
+            with timeStage("deploy_template"):
+                try:
+                    deploy_id = deployTemplate(dnac, template_id, group_devices, params)
+                except (ApiError, DeployError):
+                    if not unchanged:
+                        raise
+                    # Template in DNAC did not match what we expected,
+                    # so fall back to a full upload & try again
+                    app.logger.info(
+                        "Deploy of unchanged template failed, re-uploading."
+                    )
+                    forgetTemplateHash(dnac, template_id)
+                    template_id, unchanged = uploadTemplate(
+                        dnac, upload_payload, device_info, upload_author
+                    )
+                    deploy_id = deployTemplate(dnac, template_id, group_devices, params)
+        except (ApiError, TaskError, DeployError) as e:
+            app.logger.error("Error provisioning template: ")
+            app.logger.error(e)
+            return trackDeployment(
+                None, dnac, template_id, group_devices, template_payload, str(e), author
+            )
+        # Device config is about to change
+        forgetRunningConfig(group_devices)
+        # Hand off to background tracker to follow deployment status
+        return trackDeployment(
+            deploy_id, dnac, template_id, group_devices, template_payload, author=author
+        )
+
+    # Groups aren't abandoned part way, since a late deploy would never be tracked.
+    # Each step is already bounded by the API & TASK_TIMEOUT timeouts
+    deploy_ids = runConcurrently(provisionGroup, list(groups), DETAIL_CONCURRENCY, None)
+    # Any group which raised an unexpected error is reported as failed
+    for group in groups:
+        if group not in deploy_ids:
+            deploy_ids[group] = trackDeployment(
+                None,
+                dnac,
+                None,
+                groups[group],
+                template_payload,
+                "Template upload failed",
+                author,
+            )
+    return list(deploy_ids.values())
+
+
+# Hash of the last committed content for each template is kept in the shared store,
+# keyed by "<server URL> <template ID>"
+def forgetTemplateHash(dnac: api.DNACenterAPI, template_id: str) -> None:
+    """
+    Discard last committed content hash for a template
+    """
+    shared_store.delete("template_hashes", f"{dnac.base_url} {template_id}")
+
+
+def uploadTemplate(
+    dnac: api.DNACenterAPI, template_payload: str, device_info: dict, author: str
+) -> tuple:
+    """
+    Create / Update DNA Center template
+
+    If the template was last committed with identical content & device types,
+    the update & commit are skipped. With no author, the shared parameterized
+    template for the device type is uploaded.
+    Returns (ID of the committed template, True if upload was skipped)
+    """
+    template_name = getTemplateName(author, device_info)
+
+    # Query project & template IDs
+    project_id = getProjectID(dnac)
+    template_id = getTemplateID(dnac, template_name)
     # Templates must know what device types they are intended for,
     # So we pull that from our device info
     device_types = []
     device_types.append(
         {
-            "productFamily": device_info["family"],
-            "productSeries": device_info["series"],
+            "productFamily": device_info.family,
+            "productSeries": device_info.series,
         }
     )
     # Template params includes all items we will need to provide DNAC
     # in order to create / update a template
     template_params = {
-        "project_id": session["projectID"],
-        "name": dnac_config["templates"]["template"] + "-" + session["author"],
-        "author": session["author"],
+        "project_id": project_id,
+        "name": template_name,
+        "author": author or "api",
         "softwareType": "IOS-XE",
         "deviceTypes": device_types,
         "payload": {"templateContent": template_payload},
         "version": "2",
         "language": "VELOCITY",
     }
-    app.logger.info("Uploading template to DNA Center...")
+    if not author:
+        template_params["templateParams"] = [
+            {"parameterName": name, "dataType": "STRING", "required": False, "order": i}
+            for i, name in enumerate(["vlans", "ports"], start=1)
+        ]
+    content_hash = hashlib.sha256(
+        json.dumps([template_payload, device_types], sort_keys=True).encode()
+    ).hexdigest()
+    # Hashes are kept in the shared store, since another worker process may have
+    # committed different content to the same template
+    hash_key = f"{dnac.base_url} {template_id}"
+    if template_id and shared_store.get("template_hashes", hash_key) == content_hash:
+        app.logger.info(f"Template {template_name} is unchanged, skipping upload.")
+        return template_id, True
+    app.logger.info(f"Uploading template {template_name} to DNA Center...")
     # If template already exists, push an updated version
-    if session["templateID"]:
-        template_params["id"] = session["templateID"]
-        dnac.configuration_templates.update_template(**template_params)
-        # Allow DNAC a moment to update template
-        sleep(3)
-        app.logger.info("Template updated.")
+    if template_id:
+        try:
+            updateTemplate(dnac, template_id, template_params)
+        except ApiError as e:
+            if e.status_code != 404:
+                raise
+            # Template was deleted outside of this app, so cached ID is stale
+            app.logger.info("Template no longer exists, creating new template.")
+            invalidateTemplateIDs(dnac)
+            template_params["project_id"] = getProjectID(dnac)
+            template_id = None
     # Create new if no existing template ID
-    elif not session["templateID"]:
-        dnac.configuration_templates.create_template(**template_params)
-        # Allow DNAC a moment to create new template
-        sleep(3)
-        app.logger.info("Template created.")
-        getTemplateID()
+    if not template_id:
+        try:
+            with timeStage("create_template"):
+                response = dnac.configuration_templates.create_template(
+                    **template_params
+                )
+                # Wait for DNAC to finish creating new template
+                task = waitForTask(dnac, response["response"]["taskId"])
+        except TaskError:
+            # Another worker process may have created the template after project
+            # & template IDs were cached here, so DNAC rejects the duplicate name
+            invalidateTemplateIDs(dnac)
+            template_id = getTemplateID(dnac, template_name)
+            if not template_id:
+                raise
+            template_params["project_id"] = getProjectID(dnac)
+            updateTemplate(dnac, template_id, template_params)
+        else:
+            app.logger.info("Template created.")
+            # Completed task data contains new template ID
+            template_id = task.get("data")
+            if template_id and re.match("^.{8}-.{4}-.{4}-.{4}-.{12}$", template_id):
+                with template_ids_lock:
+                    if dnac.base_url in template_ids:
+                        template_ids[dnac.base_url]["templates"][
+                            template_name
+                        ] = template_id
+            else:
+                invalidateTemplateIDs(dnac)
+                template_id = getTemplateID(dnac, template_name)
     # Commit new template
     app.logger.info("Committing new template version...")
-    dnac.configuration_templates.version_template(
-        comments="Commit via API", templateId=session["templateID"]
-    )
-    app.logger.info("Template committed.")
-    # Allow DNAC a moment...
-    sleep(3)
+    with timeStage("commit_template"):
+        # Content hash identifies which payload / config_templates version is committed
+        response = dnac.configuration_templates.version_template(
+            comments=f"Commit via API ({content_hash[:12]})", templateId=template_id
+        )
+        waitForTask(dnac, response["response"]["taskId"])
+    shared_store.set("template_hashes", f"{dnac.base_url} {template_id}", content_hash)
     app.logger.info("Template ready!")
+    return template_id, False
+
+
+def updateTemplate(
+    dnac: api.DNACenterAPI, template_id: str, template_params: dict
+) -> None:
+    """
+    Push updated content to an existing DNA Center template
+    """
+    with timeStage("update_template"):
+        response = dnac.configuration_templates.update_template(
+            id=template_id, **template_params
+        )
+        # Wait for DNAC to finish updating template
+        waitForTask(dnac, response["response"]["taskId"])
+    app.logger.info("Template updated.")
+
+
+class DeployError(Exception):
+    """
+    Raised when DNAC does not accept a template deployment
+    """
 
 
-def deployTemplate(device_info: dict) -> None:
+def deployTemplate(
+    dnac: api.DNACenterAPI, template_id: str, devices: dict, params: dict = None
+) -> str:
     """
     Push new configuration template to all target devices.
+
+    Parameterized templates are deployed with the given Velocity variables.
+    Returns deployment ID
     """
     app.logger.info("Starting template deployment...")
 
-    # Connect to DNAC
-    dnac = getDNACSession()
-
-    app.logger.info(f"Deploying template to {device_info['name']}.")
+    names = ", ".join(device.name for device in devices.values())
+    app.logger.info(f"Deploying template to {names}.")
     # Set list of target devices to deploy template to
-    target_devices = [
-        {
-            "id": device_info["id"],
-            "type": "MANAGED_DEVICE_UUID",
-        }
-    ]
-    session["deploymentStatus"] = "inprogress"
-    session["deploymentError"] = None
-    # Deploy template
-    try:
-        deploy_template = dnac.configuration_templates.deploy_template(
-            templateId=session["templateID"],
-            targetInfo=target_devices,
+    target_devices = []
+    for device_info in devices.values():
+        target_devices.append(
+            {
+                "id": device_info.id,
+                "type": "MANAGED_DEVICE_UUID",
+            }
         )
-    except ApiError as e:
-        app.logger.error("Error deploying template: ")
-        app.logger.error(e)
-        session["deploymentStatus"] = "fail"
-        session["deploymentError"] = str(e)
-        return
+        if params:
+            target_devices[-1]["params"] = params
+    # Deploy template
+    deploy_template = dnac.configuration_templates.deploy_template(
+        templateId=template_id,
+        targetInfo=target_devices,
+    )
     # Grab deployment UUID
-    session["deploy_id"] = str(deploy_template.deploymentId).split(":")[-1].strip()
+    deploy_id = str(deploy_template.deploymentId).split(":")[-1].strip()
     # If any errors are generated, they are included in the deploymentId field
     # So let's validate that we actually have a valid UUID - otherwise assume error
-    if not re.match("^.{8}-.{4}-.{4}-.{4}-.{12}$", session["deploy_id"]):
-        app.logger.error("Error deploying template: ")
-        app.logger.error(deploy_template)
-        session["deploymentStatus"] = "fail"
-        session["deploymentError"] = deploy_template
+    if not re.match("^.{8}-.{4}-.{4}-.{4}-.{12}$", deploy_id):
+        raise DeployError(str(deploy_template))
+    return deploy_id
+
+
+# In-flight & recently finished deployments tracked by this process, keyed by
+# deployment ID.
+# deployments_changed is notified whenever the tracker updates a deployment.
+# Each deployment is followed by the process which started it (or took it over),
+# and saved to the job store so any worker can report status.
+# The job store isn't read or written while holding deployments_changed.
+# deployments_notified counts notifications, for long-polls between waits
+deployments = {}
+deployments_changed = threading.Condition()
+deployments_notified = 0
+
+
+def notifyDeploymentsChanged() -> None:
+    """
+    Wake long-polls waiting for deployments or API jobs to change
+
+    Must be called while holding deployments_changed
+    """
+    global deployments_notified
+    deployments_notified += 1
+    deployments_changed.notify_all()
+
+
+def saveDeployment(deploy_id: str) -> None:
+    """
+    Save tracked deployment status to the job store
+    """
+    job_store.saveDeployment(deploy_id, deployments[deploy_id])
+
+
+def getDeployment(deploy_id: str) -> dict:
+    """
+    Return a deployment tracked by this process, or saved by another process
+    """
+    if deploy_id in deployments:
+        return deployments[deploy_id]
+    return job_store.getDeployment(deploy_id)
+
+
+def getClientUsername(dnac: api.DNACenterAPI) -> str:
+    """
+    Username a shared DNAC client was created for
+    """
+    with dnac_clients_lock:
+        for (_, username, _), entry in dnac_clients.items():
+            if entry["client"] is dnac:
+                return username
+    return None
+
+
+def getTrackerClient(server_url: str, username: str) -> api.DNACenterAPI:
+    """
+    Find a DNAC client for background work on behalf of username, such as following
+    a deployment or deleting a template they uploaded
+
+    Uses the DNAC_USER service account if configured. Otherwise, only a client already
+    created for the same user is used, while they are logged in.
+    Clients are looked up for each use, so none are kept after the user leaves.
+    Returns None if neither is available
+    """
+    if DNAC_USER and DNAC_PASS:
+        return getDNACClient(server_url, DNAC_USER, DNAC_PASS)
+    if username is None:
+        return None
+    with dnac_clients_lock:
+        for (base_url, client_username, _), entry in dnac_clients.items():
+            if (base_url, client_username) == (server_url, username):
+                if entry["client"]:
+                    return entry["client"]
+    return None
+
+
+def trackDeployment(
+    deploy_id: str,
+    dnac: api.DNACenterAPI,
+    template_id: str,
+    devices: dict,
+    payload: str,
+    error: str = None,
+    author: str = None,
+    status: str = None,
+) -> str:
+    """
+    Register a deployment with the background tracker
+
+    If an error is provided, the deployment is recorded as already failed
+    (with a generated ID), so it is reported alongside successful deployments.
+    Devices which did not need deploying are recorded with status "success",
+    & error set to the reason shown for each device.
+    Returns deployment ID
+    """
+    if not status:
+        status = "fail" if error else "inprogress"
+    if not deploy_id:
+        prefix = "failed" if status == "fail" else "unchanged"
+        deploy_id = f"{prefix}-{secrets.token_hex(8)}"
+    # Track per-device status, keyed by device UUID
+    device_status = {}
+    for device_ip, device_info in devices.items():
+        device_status[device_info.id] = {
+            "name": device_info.name,
+            "ip": device_ip,
+            "status": status,
+            "error": error,
+        }
+    deployment = {
+        "server_url": dnac.base_url,
+        "username": getClientUsername(dnac),
+        "author": author,
+        "template_id": template_id,
+        "payload": payload,
+        "devices": device_status,
+        "status": status,
+        "error": error if status != "success" else None,
+        "started": time(),
+        "checked": 0,
+        "version": 0,
+        "trace_id": trace_id.get(),
+    }
+    job_store.saveDeployment(deploy_id, deployment)
+    with deployments_changed:
+        deployments[deploy_id] = deployment
+        notifyDeploymentsChanged()
+    if status == "inprogress":
+        startBackgroundThread("deployment-tracker", deploymentTrackerLoop)
+    return deploy_id
+
+
+def summarizeDeployments(deploy_ids: list) -> dict:
+    """
+    Roll up status of one or more deployments
+
+    Overall status is in progress until all deployments finish,
+    then fail if any deployment failed. Also returns status of each device
+    """
+    summary = {
+        "status": None,
+        "error": None,
+        "payload": None,
+        "devices": [],
+        "version": [],
+    }
+    tracked = [getDeployment(deploy_id) for deploy_id in deploy_ids or []]
+    tracked = [deployment for deployment in tracked if deployment]
+    if not tracked:
+        return summary
+    statuses = [deployment["status"] for deployment in tracked]
+    if "inprogress" in statuses:
+        summary["status"] = "inprogress"
+    elif "fail" in statuses:
+        summary["status"] = "fail"
+    else:
+        summary["status"] = "success"
+    errors = [deployment["error"] for deployment in tracked if deployment["error"]]
+    summary["error"] = "\n".join(errors) or None
+    # With DIFF_CONFIG, devices may be sent different payloads. Show each one once
+    payloads = [
+        deployment["payload"] for deployment in tracked if deployment["payload"]
+    ]
+    summary["payload"] = "\n!\n".join(dict.fromkeys(payloads)) or NO_CHANGES
+    for deployment in tracked:
+        summary["devices"].extend(deployment["devices"].values())
+        summary["version"].append(deployment["version"])
+    return summary
 
 
-def getTemplateDeployStatus() -> None:
+def deploymentTrackerLoop() -> None:
+    """
+    Background thread to poll DNAC for the status of all in-flight deployments
+
+    Each deployment is only queried once per cycle, no matter how many
+    users are watching it.
+    """
+    while True:
+        sleep(TRACKER_INTERVAL)
+        pending = [
+            deploy_id
+            for deploy_id, deployment in list(deployments.items())
+            if deployment["status"] == "inprogress"
+        ]
+        # Check the deployments that have waited longest first
+        pending.sort(key=lambda deploy_id: deployments[deploy_id]["checked"])
+        runConcurrently(
+            checkDeployment,
+            pending[:TRACKER_BATCH],
+            TRACKER_CONCURRENCY,
+            DETAIL_TIMEOUT,
+        )
+        # Forget finished deployments once they're no longer relevant.
+        # They remain in the job store, for the history page
+        with deployments_changed:
+            for deploy_id, deployment in list(deployments.items()):
+                if time() - deployment["started"] > 2 * TRACKER_TIMEOUT:
+                    del deployments[deploy_id]
+
+
+def checkDeployment(deploy_id: str) -> None:
+    """
+    Query DNAC for deployment status & update tracked deployment
+    """
+    deployment = deployments[deploy_id]
+    deployment["checked"] = time()
+    trace_id.set(deployment["trace_id"])
+    # Look up the client on each check, so a user's client isn't kept after they leave
+    dnac = getTrackerClient(deployment["server_url"], deployment["username"])
+    status = None
+    if dnac:
+        status, error, device_status = getTemplateDeployStatus(dnac, deploy_id)
+    if status is None:
+        if time() - deployment["started"] < TRACKER_TIMEOUT:
+            return
+        status, error = "fail", "Timed out waiting for deployment status"
+        device_status = {
+            device_id: {"status": status, "error": error}
+            for device_id in deployment["devices"]
+        }
+    with deployments_changed:
+        changed = status != deployment["status"] or error != deployment["error"]
+        for device_id, update in device_status.items():
+            if device_id in deployment["devices"]:
+                device = deployment["devices"][device_id]
+                if (device["status"], device["error"]) != (
+                    update["status"],
+                    update["error"],
+                ):
+                    device.update(update)
+                    changed = True
+        if not changed:
+            return
+        deployment["status"] = status
+        deployment["error"] = error
+        deployment["version"] += 1
+        notifyDeploymentsChanged()
+    saveDeployment(deploy_id)
+    # Once finished, the template is deleted by the template reaper
+
+
+# Map DNAC deployment status to status shown in web app
+DEPLOY_STATUS = {"SUCCESS": "success", "FAILURE": "fail"}
+
+
+def getTemplateDeployStatus(dnac: api.DNACenterAPI, deploy_id: str) -> tuple:
     """
     Get DNAC template deployment status
+
+    Returns (status, error, device status), or (None, None, None)
+    if status could not be retrieved
     """
     app.logger.info("Checking template deployment status...")
-    # Connect to DNAC
-    dnac = getDNACSession()
 
     # Ask DNAC for currernt status of template deployment
     try:
         response = dnac.configuration_templates.get_template_deployment_status(
-            deployment_id=session["deploy_id"]
+            deployment_id=deploy_id
         )
     except ApiError as e:
-        # Some times DNAC will give 500 while querying status
+        # Some times DNAC will give 500 while querying status, even after retrying
         app.logger.info("Error checking deployment status:")
         app.logger.info(e)
-        return
+        return None, None, None
 
     app.logger.info(f"Deployment status: {response['status']}")
+    # Collect status of each target device
+    device_status = {}
+    for device in response.get("devices") or []:
+        device_status[device["deviceId"]] = {
+            "status": DEPLOY_STATUS.get(device["status"], "inprogress"),
+            "error": device.get("detailedStatusMessage"),
+        }
     # Check to see if deployment was successful, failed, or still in progress
     if response["status"] == "SUCCESS":
         app.logger.info("Deployment complete!")
-        session["deploymentStatus"] = "success"
-        session["deploymentError"] = None
+        return "success", None, device_status
     elif response["status"] == "FAILURE":
         app.logger.info("Deployment Failed! See below for errors:")
         app.logger.info(response)
-        session["deploymentStatus"] = "fail"
-        session[
-            "deploymentError"
-        ] = f"{response['devices'][0]['detailedStatusMessage']}"
+        errors = [
+            f"{device['deviceId']}: {device.get('detailedStatusMessage')}"
+            for device in response["devices"]
+            if device["status"] == "FAILURE"
+        ]
+        return "fail", "\n".join(errors), device_status
     else:
-        session["deploymentStatus"] = "inprogress"
-        session["deploymentError"] = f"{response}"
+        return "inprogress", f"{response}", device_status
 
 
-def deleteTemplate() -> None:
+def deleteTemplate(dnac: api.DNACenterAPI, template_id: str) -> None:
     """
     Delete DNAC Template
+
+    Templates which no longer exist are treated as deleted
     """
-    template_name = dnac_config["templates"]["template"] + "-" + session["author"]
-    if session["templateID"]:
-        app.logger.info(f"Deleting template {template_name}...")
-        # Connect to DNAC
-        dnac = getDNACSession()
+    if template_id:
+        app.logger.info(f"Deleting template {template_id}...")
+        # Forget cached ID for this template
+        with template_ids_lock:
+            cached = template_ids.get(dnac.base_url)
+            if cached:
+                for name, cached_id in list(cached["templates"].items()):
+                    if cached_id == template_id:
+                        del cached["templates"][name]
+        forgetTemplateHash(dnac, template_id)
         # Delete template by ID
         try:
-            dnac.configuration_templates.deletes_the_template(
-                template_id=session["templateID"]
+            dnac.configuration_templates.deletes_the_template(template_id=template_id)
+        except ApiError as e:
+            if e.status_code != 404:
+                raise
+
+
+def reapTemplates(server: str) -> None:
+    """
+    Delete templates of one DNAC server which are no longer needed
+
+    With the DNAC_USER service account, lists the project to find templates left by
+    previous versions of the app or by processes which stopped. Then deletes a batch
+    of expired templates concurrently. Failed deletes, and templates whose uploader's
+    client isn't available, are retried on the next run
+    """
+    server_url = getServerURL(server)
+    dnac = getTrackerClient(server_url, None)
+    if dnac:
+        # Refresh project listing, to report its size & find unknown templates
+        invalidateTemplateIDs(dnac)
+        templates = getTemplateIDs(dnac)["templates"]
+        PROJECT_TEMPLATES.labels(server).set(len(templates))
+        known = job_store.getTemplateIDs(server_url)
+        prefix = dnac_config["templates"]["template"] + "-"
+        for name, template_id in templates.items():
+            if name.startswith(prefix) and template_id not in known:
+                # First seen now, so deleted after TEMPLATE_RETENTION unless used.
+                # Shared templates are recorded again when next used
+                job_store.useTemplate(server_url, template_id, name)
+    if KEEP_TEMPLATES:
+        return
+
+    expired = job_store.getExpiredTemplates(
+        server_url, time() - TEMPLATE_RETENTION, TEMPLATE_REAP_BATCH
+    )
+    # Each template is deleted with the service account, or its uploader's client
+    clients = {}
+    for template_id, _, username in expired:
+        client = getTrackerClient(server_url, username)
+        if client:
+            clients[template_id] = client
+    if not clients:
+        return
+    app.logger.info(f"Deleting {len(clients)} expired templates from {server}")
+    deleted = runConcurrently(
+        lambda template_id: deleteTemplate(clients[template_id], template_id),
+        list(clients),
+        TRACKER_CONCURRENCY,
+        DETAIL_TIMEOUT,
+    )
+    for template_id in clients:
+        if template_id in deleted:
+            job_store.forgetTemplate(server_url, template_id)
+            TEMPLATES_DELETED.labels(server, "success").inc()
+        else:
+            job_store.failTemplate(server_url, template_id, "Delete failed")
+            TEMPLATES_DELETED.labels(server, "error").inc()
+    if dnac:
+        PROJECT_TEMPLATES.labels(server).set(len(templates) - len(deleted))
+
+
+def templateReaperLoop() -> None:
+    """
+    Background thread to delete expired templates from each DNAC server
+    """
+    while True:
+        sleep(TEMPLATE_REAP_INTERVAL)
+        for server in dnac_config["servers"]:
+            try:
+                reapTemplates(server)
+            except Exception as e:
+                app.logger.error(f"Failed to delete expired templates on {server}: {e}")
+
+
+def getHistoryFilters(args) -> tuple:
+    """
+    Read history filters from query parameters, with dates as YYYY-MM-DD
+
+    Returns (filters, since, until) where since & until are timestamps or None
+    """
+    filters = {key: args.get(key, "").strip() for key in ("device", "author")}
+    times = []
+    for key in ("since", "until"):
+        try:
+            day = datetime.strptime(args.get(key, ""), "%Y-%m-%d")
+        except ValueError:
+            filters[key] = None
+            times.append(None)
+            continue
+        filters[key] = day.strftime("%Y-%m-%d")
+        # Include the whole of the last day
+        if key == "until":
+            day += timedelta(days=1)
+        times.append(day.timestamp())
+    return filters, times[0], times[1]
+
+
+def getServerAliases() -> dict:
+    """
+    Map of server base URL to alias, for displaying saved deployments
+    """
+    return {
+        getServerURL(server): details.get("alias", server)
+        for server, details in dnac_config["servers"].items()
+    }
+
+
+@app.template_filter("timestamp")
+def formatTimestamp(value: float) -> str:
+    if not value:
+        return ""
+    return datetime.fromtimestamp(value).strftime("%b %d %Y, %I:%M:%S%p")
+
+
+@app.template_filter("speed")
+def formatSpeed(kbps: int) -> str:
+    if not kbps:
+        return ""
+    if kbps >= 1000000:
+        return f"{kbps / 1000000:g}G"
+    return f"{kbps / 1000:g}M"
+
+
+def getAPIClient() -> str:
+    """
+    Name of the API client for the request's bearer token, or None if not valid
+    """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    for api_token, client in API_TOKENS.items():
+        if secrets.compare_digest(token.encode(), api_token.encode()):
+            return client
+    return None
+
+
+def parseVLANPlan(request) -> list:
+    """
+    Parse VLAN plan from an API request, sent as JSON or CSV
+
+    JSON plans list devices, each with VLANs & their ports:
+        {"devices": [{"device": "<IP or hostname>", "server": "<name>",
+            "vlans": [{"vlan_id": 10, "vlan_name": "Users", "ports": ["Gi..."]}]}]}
+    CSV plans have a row per VLAN per device, with columns
+    device, vlan_id, vlan_name, ports (space separated) & optionally server.
+    Returns list of rows, one per VLAN per device
+    """
+    if request.mimetype == "text/csv":
+        reader = csv.DictReader(io.StringIO(request.get_data(as_text=True)))
+        missing = {"device", "vlan_id", "vlan_name", "ports"} - set(
+            reader.fieldnames or []
+        )
+        if missing:
+            raise ValueError(
+                f"CSV plan is missing columns: {', '.join(sorted(missing))}"
+            )
+        return [
+            {
+                "server": row.get("server") or None,
+                "device": (row["device"] or "").strip(),
+                "vlan_id": row["vlan_id"],
+                "vlan_name": row["vlan_name"],
+                "ports": (row["ports"] or "").replace(";", " ").split(),
+            }
+            for row in reader
+        ]
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get("devices"), list):
+        raise ValueError('Expected a JSON plan with a "devices" list, or a CSV plan')
+    rows = []
+    for entry in body["devices"]:
+        if not isinstance(entry, dict) or not isinstance(entry.get("vlans"), list):
+            raise ValueError('Each device must have a "vlans" list')
+        for vlan in entry["vlans"]:
+            if not isinstance(vlan, dict):
+                raise ValueError("Each VLAN must be an object")
+            ports = vlan.get("ports") or []
+            if isinstance(ports, str):
+                ports = ports.split()
+            rows.append(
+                {
+                    "server": entry.get("server") or body.get("server"),
+                    "device": str(entry.get("device") or "").strip(),
+                    "vlan_id": vlan.get("vlan_id"),
+                    "vlan_name": vlan.get("vlan_name"),
+                    "ports": [str(port) for port in ports],
+                }
+            )
+    return rows
+
+
+# VLAN names are limited to characters which can't change the meaning of the template
+VLAN_NAME_PATTERN = re.compile(r"^[\w.-]{1,32}$")
+
+
+class InventoryLoading(Exception):
+    """
+    Raised when a VLAN plan can't be checked until the inventory has loaded
+    """
+
+
+def validateVLANPlan(rows: list) -> tuple:
+    """
+    Check a VLAN plan against the cached device inventory
+
+    Devices may be given by management IP or hostname, and must be reachable.
+    VLAN IDs & names must be valid. Ports are checked against each device's
+    cached interfaces, or when the job runs for devices whose interfaces are
+    not cached, since that needs calls to DNAC.
+    Returns (dict of server to {management IP: (Device, VLANs)},
+    list of errors for each invalid device). Raises InventoryLoading if a device
+    is not found while its server's inventory is still loading after
+    FEDERATED_TIMEOUT seconds
+    """
+    errors = []
+
+    def reject(server: str, device: str, error: str) -> None:
+        errors.append({"server": server, "device": device, "error": error})
+
+    device_vlans = {}
+    for row in rows:
+        server = row["server"]
+        if not server and len(dnac_config["servers"]) == 1:
+            server = next(iter(dnac_config["servers"]))
+        device_vlans.setdefault((server, row["device"]), []).append(row)
+
+    # Find each device in inventory of its server
+    plan = {}
+    for (server, device), vlans in device_vlans.items():
+        if server not in dnac_config["servers"]:
+            reject(server, device, "Unknown or missing server")
+            continue
+        dnac = getDNACClient(getServerURL(server), DNAC_USER, DNAC_PASS)
+        devices = getInventory(server, dnac)["devices"]
+        ip = findInventoryDevice(devices, device)
+        if not ip and isInventoryLoading(server):
+            # Only part of the inventory is loaded so far
+            if not waitForInventory(server, FEDERATED_TIMEOUT):
+                raise InventoryLoading(f"Inventory of {server} is still loading")
+            devices = inventory[server]["devices"]
+            ip = findInventoryDevice(devices, device)
+        if not ip:
+            reject(server, device, "Device not found")
+            continue
+        if devices[ip].reachability != "Reachable":
+            reject(server, device, "Device unreachable")
+            continue
+        try:
+            for vlan in vlans:
+                parseVLAN(vlan)
+        except ValueError as e:
+            reject(server, device, str(e))
+            continue
+        interfaces = getCachedInterfaces(devices[ip])
+        if interfaces is not None:
+            _, error = getDeviceVLANConfig(
+                vlans, filterInterfaces(devices[ip], interfaces)
+            )
+            if error:
+                reject(server, device, error)
+                continue
+        plan.setdefault(server, {})[ip] = (devices[ip], vlans)
+    return plan, errors
+
+
+def findInventoryDevice(devices: dict, device: str) -> str:
+    """
+    Management IP of a device given by management IP or hostname, or None if not found
+    """
+    if device in devices:
+        return device
+    return next((ip for ip, info in devices.items() if info.name == device), None)
+
+
+def planDevices(dnac: api.DNACenterAPI, devices: dict) -> tuple:
+    """
+    Check each device's VLANs against its interfaces & render the payloads needed
+
+    devices is a dict of management IP to (Device, VLANs).
+    Returns (dict of template payload to its params & devices, as from
+    getDevicePayloads, dict of management IP to error for each invalid device)
+    """
+    interfaces = getInterfaces(
+        dnac, {ip: device_info for ip, (device_info, _) in devices.items()}
+    )
+    valid = {}
+    configs = {}
+    errors = {}
+    for ip, (device_info, vlans) in devices.items():
+        config, error = getDeviceVLANConfig(vlans, interfaces.get(ip, {}))
+        if error:
+            errors[ip] = error
+            continue
+        valid[ip] = device_info
+        configs[ip] = config
+    return getDevicePayloads(dnac, valid, configs), errors
+
+
+def parseVLAN(vlan: dict) -> tuple:
+    """
+    Return (VLAN ID, VLAN name) of a VLAN in a plan, raising ValueError if invalid
+    """
+    try:
+        vlan_id = int(vlan["vlan_id"])
+    except (TypeError, ValueError):
+        vlan_id = 0
+    if not 1 <= vlan_id <= 4094:
+        raise ValueError(f"Invalid VLAN ID {vlan['vlan_id']}")
+    vlan_name = str(vlan["vlan_name"] or "")
+    if not VLAN_NAME_PATTERN.match(vlan_name):
+        raise ValueError(f"Invalid VLAN name '{vlan_name}' for VLAN {vlan_id}")
+    return vlan_id, vlan_name
+
+
+def getDeviceVLANConfig(vlans: list, interfaces: dict) -> tuple:
+    """
+    Build VLAN config for one device, in the format posted by the provisioning page
+
+    Port ranges are expanded into the device's interfaces.
+    Returns (config, None), or (None, error) if the device's VLANs are not valid
+    """
+    config = {}
+    assigned = {}
+    interface_index = indexInterfaces(interfaces)
+    for index, vlan in enumerate(vlans):
+        try:
+            vlan_id, vlan_name = parseVLAN(vlan)
+            ports = expandPorts(vlan["ports"], interfaces, interface_index)
+        except ValueError as e:
+            return None, str(e)
+        for port in ports:
+            if assigned.setdefault(port, vlan_id) != vlan_id:
+                return None, f"Port {port} is in VLAN {assigned[port]} & {vlan_id}"
+        config[str(index)] = {
+            "vlan_id": str(vlan_id),
+            "vlan_name": vlan_name,
+            "ports": "\n".join(dict.fromkeys(ports)),
+        }
+    return config, None
+
+
+def getFormVLANConfigs(dnac: api.DNACenterAPI, devices: dict, form: dict) -> tuple:
+    """
+    Build VLAN config for each device from the config posted by the provisioning page,
+    expanding port ranges into each device's interfaces
+
+    Each VLAN posted has dragged ports (newline separated) & port ranges
+    (comma or space separated). Returns ({management IP: config}, list of errors)
+    """
+    vlans = [
+        {
+            "vlan_id": vlan.get("vlan_id"),
+            "vlan_name": vlan.get("vlan_name"),
+            "ports": (vlan.get("ports") or "").split()
+            + (vlan.get("ranges") or "").replace(",", " ").split(),
+        }
+        for vlan in form.values()
+    ]
+    configs = {}
+    errors = []
+    for ip, device_interfaces in getInterfaces(dnac, devices).items():
+        config, error = getDeviceVLANConfig(vlans, device_interfaces)
+        if error:
+            errors.append(f"{devices[ip].name} ({ip}): {error}")
+        else:
+            configs[ip] = config
+    return configs, errors
+
+
+# API jobs waiting to be provisioned, as (job ID, plan). Jobs are queued in the process
+# which accepted them, and saved to the job store so any worker can report status.
+# active_jobs holds IDs of jobs queued or running in this process
+job_queue = queue.Queue()
+active_jobs = set()
+
+
+def queueJob(client: str, plan: dict) -> str:
+    """
+    Record a new API job & queue it for provisioning, returning the job ID
+    """
+    job_id = secrets.token_hex(8)
+    job = {
+        "id": job_id,
+        "client": client,
+        "status": "queued",
+        "error": None,
+        "created": time(),
+        # Each server's devices are planned into payloads when the job runs
+        "groups": [
+            {
+                "server": server,
+                "payload": None,
+                "devices": [
+                    {"name": device_info.name, "ip": ip, "vlans": vlans}
+                    for ip, (device_info, vlans) in devices.items()
+                ],
+                "deploy_ids": [],
+            }
+            for server, devices in plan.items()
+        ],
+    }
+    # Mark the job active before it's saved, so it's never taken for an orphan
+    active_jobs.add(job_id)
+    try:
+        job_store.saveJob(job)
+    except Exception:
+        active_jobs.discard(job_id)
+        raise
+    job_queue.put(
+        (job_id, {(server, None): devices for server, devices in plan.items()})
+    )
+    app.logger.info(f"API job {job_id} queued by {client}")
+    for worker in range(API_JOB_CONCURRENCY):
+        startBackgroundThread(f"api-jobs-{worker}", jobWorkerLoop)
+    return job_id
+
+
+def jobWorkerLoop() -> None:
+    """
+    Background thread to provision queued API jobs
+
+    API jobs are background DNAC calls, so they don't hold up users of the web app
+    """
+    while True:
+        job_id, plan = job_queue.get()
+        token = trace_id.set(job_id)
+        try:
+            runJob(job_id, plan)
+        finally:
+            active_jobs.discard(job_id)
+            trace_id.reset(token)
+
+
+def runJob(job_id: str, plan: dict) -> None:
+    """
+    Provision each (server, template payload) group of an API job
+
+    Devices not yet planned are first checked against their interfaces & running
+    config, and split into a group per payload. Devices whose ports aren't valid
+    are recorded as failed deployments
+    """
+    job = job_store.getJob(job_id)
+    updateJob(job, status="running")
+    try:
+        groups = []
+        for group in job["groups"]:
+            if group["payload"] is not None or group["deploy_ids"]:
+                groups.append(group)
+                continue
+            server = group["server"]
+            devices = plan.pop((server, None))
+            dnac = getDNACClient(getServerURL(server), DNAC_USER, DNAC_PASS)
+            payloads, errors = planDevices(dnac, devices)
+            for payload, entry in payloads.items():
+                plan[(server, payload)] = entry["devices"]
+                groups.append(
+                    {
+                        "server": server,
+                        "payload": payload,
+                        "params": entry["params"],
+                        "devices": [
+                            {"name": device_info.name, "ip": ip}
+                            for ip, device_info in entry["devices"].items()
+                        ],
+                        "deploy_ids": [],
+                    }
+                )
+            if errors:
+                groups.append(
+                    {
+                        "server": server,
+                        "payload": None,
+                        "devices": [
+                            {"name": devices[ip][0].name, "ip": ip} for ip in errors
+                        ],
+                        "deploy_ids": [
+                            trackDeployment(
+                                None,
+                                dnac,
+                                None,
+                                {ip: devices[ip][0]},
+                                "",
+                                error,
+                                job["client"],
+                            )
+                            for ip, error in errors.items()
+                        ],
+                    }
+                )
+        updateJob(job, groups=groups)
+
+        for group in job["groups"]:
+            # Groups already provisioned before a restart are followed by the tracker
+            if group["deploy_ids"]:
+                continue
+            server, payload = group["server"], group["payload"]
+            # Templates are named after the author, so each distinct plan gets its own
+            payload_hash = hashlib.sha256(payload.encode()).hexdigest()
+            template_author = f"{job['client']}-{payload_hash[:8]}"
+            dnac = getDNACClient(getServerURL(server), DNAC_USER, DNAC_PASS)
+            payloads = {
+                payload: {
+                    "params": group.get("params"),
+                    "devices": plan[(server, payload)],
+                }
+            }
+            group["deploy_ids"] = provisionPayloads(
+                dnac, job["client"], payloads, template_author
+            )
+            updateJob(job)
+    except Exception as e:
+        app.logger.error(f"API job {job_id} failed: {e}")
+        updateJob(job, status="fail", error=str(e))
+        return
+    updateJob(job, status="submitted")
+
+
+def updateJob(job: dict, **changes) -> None:
+    """
+    Save changes to an API job & notify anyone streaming its results
+    """
+    job.update(changes)
+    job_store.saveJob(job)
+    with deployments_changed:
+        notifyDeploymentsChanged()
+
+
+def getJobResults(job: dict) -> dict:
+    """
+    Return status of an API job & each of its devices
+
+    Once provisioning has been submitted, status is that of the job's deployments
+    """
+    status = job["status"]
+    devices = []
+    deploy_ids = []
+    for group in job["groups"]:
+        if not group["deploy_ids"]:
+            devices.extend(
+                {
+                    "server": group["server"],
+                    "name": device["name"],
+                    "ip": device["ip"],
+                    "status": status,
+                    "error": None,
+                }
+                for device in group["devices"]
+            )
+            continue
+        deploy_ids.extend(group["deploy_ids"])
+        for deploy_id in group["deploy_ids"]:
+            deployment = getDeployment(deploy_id) or {"devices": {}}
+            devices.extend(
+                {"server": group["server"], **device}
+                for device in deployment["devices"].values()
+            )
+    error = job["error"]
+    if status == "submitted":
+        summary = summarizeDeployments(deploy_ids)
+        if summary["status"]:
+            status, error = summary["status"], summary["error"]
+        else:
+            status, error = "fail", "Deployment status is no longer available"
+    return {"job_id": job["id"], "status": status, "error": error, "devices": devices}
+
+
+def requeueJob(job_id: str) -> None:
+    """
+    Queue an API job taken over from another process, for any groups not yet provisioned
+
+    Devices are looked up again in inventory, since only their IPs are saved
+    """
+    job = job_store.getJob(job_id)
+    # Mark the job active while its devices are looked up, so it's not resumed twice
+    active_jobs.add(job_id)
+    try:
+        plan = {}
+        for group in job["groups"]:
+            if group["deploy_ids"]:
+                continue
+            dnac = getDNACClient(getServerURL(group["server"]), DNAC_USER, DNAC_PASS)
+            getInventory(group["server"], dnac)
+            waitForInventory(group["server"])
+            devices = inventory[group["server"]]["devices"]
+            plan[(group["server"], group["payload"])] = {
+                device["ip"]: (
+                    devices[device["ip"]]
+                    if group["payload"] is not None
+                    else (devices[device["ip"]], device["vlans"])
+                )
+                for device in group["devices"]
+                if device["ip"] in devices
+            }
+    except Exception as e:
+        app.logger.error(f"Failed to resume API job {job_id}: {e}")
+        updateJob(job, status="fail", error=f"Failed to resume job: {e}")
+        active_jobs.discard(job_id)
+        return
+    app.logger.info(f"Resuming API job {job_id}")
+    job_queue.put((job_id, plan))
+    for worker in range(API_JOB_CONCURRENCY):
+        startBackgroundThread(f"api-jobs-{worker}", jobWorkerLoop)
+
+
+def resumeOrphans() -> None:
+    """
+    Take over deployments & API jobs left unfinished by a process which has stopped
+    """
+    job_store.heartbeat()
+    resumed = 0
+    for deploy_id in job_store.claimOrphans("deployments", ("inprogress",)):
+        if deploy_id in deployments:
+            continue
+        deployment = job_store.getDeployment(deploy_id)
+        deployment["checked"] = 0
+        with deployments_changed:
+            deployments[deploy_id] = deployment
+        app.logger.info(f"Resuming deployment {deploy_id}")
+        resumed += 1
+    if resumed:
+        startBackgroundThread("deployment-tracker", deploymentTrackerLoop)
+    for job_id in job_store.claimOrphans("jobs", ("queued", "running")):
+        if job_id not in active_jobs:
+            requeueJob(job_id)
+
+
+def jobStoreLoop() -> None:
+    """
+    Background thread to keep this process's heartbeat in the job store,
+    and take over any work left by processes which have stopped
+    """
+    while True:
+        try:
+            resumeOrphans()
+        except Exception as e:
+            app.logger.error(f"Failed to check job store: {e}")
+        sleep(JOB_ORPHAN_TIMEOUT / 4)
+
+
+def warmupServer(server: str) -> None:
+    """
+    Authenticate to a DNAC server, look up its template project & load its
+    switch inventory, so the first user after startup doesn't wait for these
+    """
+    start = time()
+    try:
+        dnac = getDNACClient(getServerURL(server), DNAC_USER, DNAC_PASS)
+        getProjectID(dnac)
+        getInventory(server, dnac)
+        while isInventoryLoading(server):
+            sleep(0.5)
+    except Exception as e:
+        app.logger.warning(f"Warmup failed for {server}: {e}")
+        return
+    app.logger.info(f"Warmup of {server} took {time() - start:.2f}s")
+    recordBootTiming("warmup", max(boot_timings.get("warmup", 0), time() - BOOT_START))
+
+
+def startBackgroundWork() -> None:
+    """
+    Start the background threads of a web app process: job store heartbeat &
+    takeover of orphaned work, the template reaper, and warmup of each server
+
+    Called by gunicorn in each worker process (see gunicorn.conf.py), and when
+    running app.py. Importing the app doesn't start them, so scripts & tests
+    can use it without claiming deployments or API jobs
+    """
+    startBackgroundThread("job-store", jobStoreLoop)
+    startBackgroundThread("template-reaper", templateReaperLoop)
+    if WARMUP and DNAC_USER and DNAC_PASS:
+        for server in dnac_config["servers"]:
+            startBackgroundThread(
+                f"warmup-{server}", lambda server=server: warmupServer(server)
             )
-        except:
-            pass
-        session["templateID"] = None
+
+
+recordBootTiming("startup", time() - BOOT_START)
 
 
 if __name__ == "__main__":
+    # The debug reloader serves requests from a child process, so only start work there
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        startBackgroundWork()
     # Run web app
     app.run(host="0.0.0.0", debug=True)
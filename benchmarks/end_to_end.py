@@ -0,0 +1,328 @@
+""" Copyright (c) 2024 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+# End to end benchmark of the web app against a fake Catalyst Center.
+#
+# Starts benchmarks/fake_dnac.py, then drives the Flask routes for each simulated
+# user: login -> search -> select devices -> provisioning page -> provision ->
+# wait for deployment to complete. Reports per-stage latency & throughput for
+# each concurrency level, and saves results as JSON so runs can be compared.
+#
+# Run from the repository root:
+#   python3 benchmarks/end_to_end.py --concurrency 1 4 16
+#   python3 benchmarks/end_to_end.py --compare benchmarks/results/<previous>.json
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from time import perf_counter, sleep
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = ["login", "search", "select", "provision_page", "provision", "deployment"]
+VLAN_PLAN = {
+    "0": {
+        "vlan_id": "10",
+        "vlan_name": "Users",
+        "ports": "GigabitEthernet1/0/1\nGigabitEthernet1/0/2",
+    },
+    "1": {"vlan_id": "20", "vlan_name": "Voice", "ports": "GigabitEthernet1/0/3"},
+}
+
+
+def getFreePort() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def startFakeDNAC(args: argparse.Namespace, port: int) -> subprocess.Popen:
+    """
+    Start fake Catalyst Center in a separate process, so it doesn't compete with the app
+    """
+    fake = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(ROOT, "benchmarks", "fake_dnac.py"),
+            f"--port={port}",
+            f"--devices={args.devices}",
+            f"--latency={args.latency}",
+            f"--error-rate={args.error_rate}",
+            f"--rate-limit-rate={args.rate_limit_rate}",
+            f"--deploy-seconds={args.deploy_seconds}",
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return fake
+        except OSError:
+            sleep(0.1)
+    fake.terminate()
+    raise RuntimeError("Fake Catalyst Center did not start")
+
+
+def runFlow(app, user: int, args: argparse.Namespace) -> dict:
+    """
+    Run one user's provisioning workflow, returning seconds spent on each stage
+    completed, and the outcome of the flow
+    """
+    timings = {}
+    try:
+        timings["outcome"] = provisionFlow(app, user, args, timings)
+    except Exception as e:
+        timings["outcome"] = f"error: {e}"
+    return timings
+
+
+def provisionFlow(app, user: int, args: argparse.Namespace, timings: dict) -> str:
+    """
+    Run login -> search -> select -> provision, recording seconds per stage in timings
+
+    Returns final deployment status
+    """
+    client = app.test_client()
+
+    def stage(name: str, func, expected: int):
+        start = perf_counter()
+        response = func()
+        if response.status_code != expected:
+            raise RuntimeError(f"{name} returned {response.status_code}")
+        timings[name] = perf_counter() - start
+        return response
+
+    stage(
+        "login",
+        lambda: client.post(
+            "/login",
+            data={"server": "fake", "username": f"user{user}", "password": "password"},
+        ),
+        302,
+    )
+    stage(
+        "search",
+        lambda: client.post("/select-device", data={"device-filter": "sw-"}),
+        200,
+    )
+    # Each user provisions a different set of devices
+    first = (user * args.devices_per_user) % max(
+        1, args.devices - args.devices_per_user
+    )
+    targets = [
+        f"10.{i // 65536}.{(i // 256) % 256}.{i % 256}"
+        for i in range(first, first + args.devices_per_user)
+        if i % 50 != 49
+    ]
+    stage(
+        "select",
+        lambda: client.post("/select-device", data={"target-device": targets}),
+        302,
+    )
+    stage("provision_page", lambda: client.get("/vlan-provision"), 200)
+    stage("provision", lambda: client.post("/vlan-provision", json=VLAN_PLAN), 302)
+
+    # Long-poll status updates until the deployment finishes
+    start = perf_counter()
+    update = {"status": "inprogress", "version": ""}
+    while update["status"] == "inprogress":
+        update = client.get(
+            "/status/updates", query_string={"version": update["version"]}
+        ).get_json()
+    status = update["status"]
+    timings["deployment"] = perf_counter() - start
+    return status
+
+
+def runLevel(app, concurrency: int, flows: int, first_user: int, args) -> dict:
+    """
+    Run flows with the given number of concurrent users, returning results for the level
+    """
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(
+            executor.map(
+                lambda user: runFlow(app, user, args),
+                range(first_user, first_user + flows),
+            )
+        )
+    seconds = perf_counter() - start
+    stages = {}
+    for name in STAGES:
+        samples = sorted(result[name] for result in results if name in result)
+        if not samples:
+            continue
+        stages[name] = {
+            "p50": samples[int(0.5 * (len(samples) - 1))],
+            "p95": samples[int(0.95 * (len(samples) - 1))],
+        }
+    return {
+        "concurrency": concurrency,
+        "flows": flows,
+        "succeeded": sum(1 for result in results if result["outcome"] == "success"),
+        "errors": sorted(
+            {result["outcome"] for result in results if result["outcome"] != "success"}
+        ),
+        "seconds": seconds,
+        "flows_per_second": flows / seconds,
+        "stages": stages,
+    }
+
+
+def printResults(results: dict, previous: dict = None) -> None:
+    """
+    Print results table, with change from previous results if provided
+    """
+    previous_levels = {
+        level["concurrency"]: level for level in (previous or {}).get("levels", [])
+    }
+    print(f"Cold search (inventory load): {results['cold_search']:.2f}s")
+    header = f"{'users':>5} {'stage':>15} {'p50 s':>8} {'p95 s':>8}"
+    if previous:
+        header += f" {'p50 change':>11}"
+    print(header)
+    for level in results["levels"]:
+        before = previous_levels.get(level["concurrency"])
+        for name, stage in level["stages"].items():
+            line = (
+                f"{level['concurrency']:>5} {name:>15} "
+                f"{stage['p50']:>8.3f} {stage['p95']:>8.3f}"
+            )
+            if before and name in before["stages"]:
+                line += (
+                    f" {percentChange(before['stages'][name]['p50'], stage['p50']):>11}"
+                )
+            print(line)
+        line = (
+            f"{level['concurrency']:>5} {'throughput':>15} "
+            f"{level['flows_per_second']:>8.3f} flows/s, "
+            f"{level['succeeded']}/{level['flows']} succeeded"
+        )
+        if before:
+            change = percentChange(
+                before["flows_per_second"], level["flows_per_second"]
+            )
+            line += f" ({change})"
+        print(line)
+        for error in level["errors"]:
+            print(f"{'':>5} {'outcome':>15} {error}")
+
+
+def percentChange(before: float, after: float) -> str:
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def getVersion() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        return "unknown"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End to end benchmark of the web app")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument(
+        "--flows", type=int, default=2, help="Flows per concurrent user"
+    )
+    parser.add_argument("--devices", type=int, default=1000, help="Inventory size")
+    parser.add_argument("--devices-per-user", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0)
+    parser.add_argument("--deploy-seconds", type=float, default=3)
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results"))
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    args = parser.parse_args()
+
+    port = getFreePort()
+    fake = startFakeDNAC(args, port)
+    config_dir = tempfile.TemporaryDirectory()
+    servers_file = os.path.join(config_dir.name, "dna-servers.yaml")
+    with open(servers_file, "w") as config:
+        json.dump(
+            {
+                "servers": {
+                    "fake": {"alias": "Fake", "address": f"http://127.0.0.1:{port}"}
+                },
+                "templates": {"project": "Benchmark", "template": "benchmark"},
+            },
+            config,
+        )
+    # App settings must be in place before it is imported
+    os.environ["DNA_SERVERS_FILE"] = servers_file
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("TRACKER_INTERVAL", "0.5")
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    import app as webapp  # noqa: E402
+
+    try:
+        # The first search loads the device inventory
+        start = perf_counter()
+        client = webapp.app.test_client()
+        client.post(
+            "/login",
+            data={"server": "fake", "username": "warmup", "password": "password"},
+        )
+        client.post("/select-device", data={"device-filter": "sw-"})
+        while webapp.isInventoryLoading("fake"):
+            sleep(0.1)
+        results = {
+            "version": getVersion(),
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "parameters": {
+                key: value
+                for key, value in vars(args).items()
+                if key not in ("output", "compare")
+            },
+            "cold_search": perf_counter() - start,
+            "levels": [],
+        }
+        first_user = 0
+        for concurrency in args.concurrency:
+            flows = concurrency * args.flows
+            results["levels"].append(
+                runLevel(webapp.app, concurrency, flows, first_user, args)
+            )
+            first_user += flows
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as previous_file:
+            previous = json.load(previous_file)
+    printResults(results, previous)
+
+    os.makedirs(args.output, exist_ok=True)
+    output_file = os.path.join(
+        args.output, f"{datetime.now():%Y%m%d-%H%M%S}-{results['version']}.json"
+    )
+    with open(output_file, "w") as output:
+        json.dump(results, output, indent=2)
+    print(f"Results saved to {output_file}")
@@ -0,0 +1,370 @@
+""" Copyright (c) 2024 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+# Fake Catalyst Center, implementing the API endpoints used by the web app.
+# Serves plain HTTP, with configurable latency, error rates & inventory size.
+#
+# Run from the repository root:
+#   python3 benchmarks/fake_dnac.py --port 9443 --devices 1000 --latency 0.1
+#
+# Then add it to dna-servers.yaml, with an http:// address:
+#   servers:
+#     fake:
+#       alias: Fake Catalyst Center
+#       address: http://127.0.0.1:9443
+#
+# Any username & password is accepted. Request counts are available at /_stats
+
+import argparse
+import json
+import random
+import re
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep, time
+from urllib.parse import parse_qs, urlparse
+
+API = "/dna/intent/api/v1"
+SERIES = [
+    ("C9300-48P", "Cisco Catalyst 9300 Series Switches"),
+    ("C9300-48P", "Cisco Catalyst 9300 Series Switches"),
+    ("C9200-24P", "Cisco Catalyst 9200 Series Switches"),
+]
+RUNNING_CONFIG = (
+    "vlan 10\n name Users\n!\n"
+    "interface GigabitEthernet1/0/1\n switchport mode access\n"
+    " switchport access vlan 10\n!\n"
+)
+
+
+class FakeDNAC:
+    """
+    State of the fake Catalyst Center: inventory, templates, tasks & deployments
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.devices = [self.buildDevice(i) for i in range(args.devices)]
+        self.templates = {}
+        self.tasks = {}
+        self.deployments = {}
+        self.project_id = str(uuid.uuid4())
+
+    def buildDevice(self, i: int) -> dict:
+        platform, series = SERIES[i % len(SERIES)]
+        device_id = str(uuid.UUID(int=i + 1))
+        return {
+            "id": device_id,
+            "instanceUuid": device_id,
+            "hostname": f"sw-{i:05d}",
+            "managementIpAddress": f"10.{i // 65536}.{(i // 256) % 256}.{i % 256}",
+            "platformId": platform,
+            "softwareVersion": "17.9.4",
+            "reachabilityStatus": "Unreachable" if i % 50 == 49 else "Reachable",
+            "family": "Switches and Hubs",
+            "series": series,
+            "lastUpdateTime": 1700000000000 + i,
+        }
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def startTask(self, data: str = "", error: str = None) -> dict:
+        """
+        Start a task which completes after --task-seconds
+        """
+        task_id = str(uuid.uuid4())
+        self.tasks[task_id] = {"started": time(), "data": data, "error": error}
+        return {"response": {"taskId": task_id, "url": f"/api/v1/task/{task_id}"}}
+
+    def getTask(self, task_id: str) -> dict:
+        task = self.tasks.get(task_id)
+        if not task:
+            return None
+        done = time() - task["started"] >= self.args.task_seconds
+        response = {"taskId": task_id, "isError": False, "progress": "in progress"}
+        if done:
+            response["endTime"] = int(time() * 1000)
+            response["progress"] = task["data"]
+            response["data"] = task["data"]
+            if task["error"]:
+                response["isError"] = True
+                response["failureReason"] = task["error"]
+        return response
+
+    def getDeploymentStatus(self, deploy_id: str) -> dict:
+        deployment = self.deployments.get(deploy_id)
+        if not deployment:
+            return None
+        elapsed = time() - deployment["started"]
+        status = "SUCCESS" if elapsed >= self.args.deploy_seconds else "IN_PROGRESS"
+        return {
+            "deploymentId": deploy_id,
+            "status": status,
+            "devices": [
+                {
+                    "deviceId": target["id"],
+                    "status": status,
+                    "detailedStatusMessage": (
+                        "Provisioning success" if status == "SUCCESS" else ""
+                    ),
+                }
+                for target in deployment["targets"]
+            ],
+        }
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Route fake Catalyst Center API requests
+    """
+
+    protocol_version = "HTTP/1.1"
+    dnac = None
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, code: int, body, headers: dict = None) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_request(self, method: str) -> None:
+        dnac = self.dnac
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+        url = urlparse(self.path)
+        path = url.path
+        query = {key: value[0] for key, value in parse_qs(url.query).items()}
+        dnac.count(f"{method} {re.sub(r'[0-9a-f-]{36}', '{id}', path)}")
+
+        if path == "/_stats":
+            return self.send(200, dnac.stats)
+        if dnac.args.latency:
+            sleep(random.uniform(0.5, 1.5) * dnac.args.latency)
+        if path == "/dna/system/api/v1/auth/token":
+            return self.send(200, {"Token": uuid.uuid4().hex})
+        if random.random() < dnac.args.rate_limit_rate:
+            return self.send(
+                429, {"message": "Too many requests"}, {"Retry-After": "1"}
+            )
+        if random.random() < dnac.args.error_rate:
+            return self.send(500, {"message": "Internal server error"})
+
+        if method == "GET" and path == f"{API}/network-device":
+            devices = dnac.devices
+            if "hostname" in query:
+                devices = [
+                    d for d in devices if re.match(query["hostname"], d["hostname"])
+                ]
+            offset = int(query.get("offset", 1))
+            limit = min(int(query.get("limit", 500)), 500)
+            return self.send(
+                200, {"response": devices[offset - 1 : offset - 1 + limit]}
+            )
+        if method == "GET" and path == f"{API}/device-detail":
+            return self.send(
+                200,
+                {
+                    "response": {
+                        "nwDeviceId": query.get("searchBy"),
+                        "location": "Global/Site/Building",
+                    }
+                },
+            )
+        match = re.match(f"{API}/interface/network-device/([^/]+)$", path)
+        if method == "GET" and match:
+            interfaces = [
+                {
+                    "portName": f"GigabitEthernet{member}/0/{port}",
+                    "id": str(uuid.uuid4()),
+                    "speed": "1000000",
+                    "vlanId": "1",
+                }
+                for member in range(1, dnac.args.stack_members + 1)
+                for port in range(1, 49)
+            ]
+            interfaces.extend(
+                {
+                    "portName": f"TenGigabitEthernet{member}/1/{port}",
+                    "id": str(uuid.uuid4()),
+                    "speed": "10000000",
+                    "vlanId": "1",
+                }
+                for member in range(1, dnac.args.stack_members + 1)
+                for port in range(1, 3)
+            )
+            interfaces.append(
+                {
+                    "portName": "GigabitEthernet0/0",
+                    "id": str(uuid.uuid4()),
+                    "speed": "1000000",
+                }
+            )
+            return self.send(200, {"response": interfaces})
+        match = re.match(f"{API}/network-device/([^/]+)/config$", path)
+        if method == "GET" and match:
+            return self.send(200, {"response": RUNNING_CONFIG})
+
+        if method == "GET" and path == f"{API}/template-programmer/project":
+            templates = [
+                {"name": template["name"], "id": template_id}
+                for template_id, template in list(dnac.templates.items())
+            ]
+            return self.send(
+                200,
+                [
+                    {
+                        "id": dnac.project_id,
+                        "name": query.get("name"),
+                        "templates": templates,
+                    }
+                ],
+            )
+        match = re.match(f"{API}/template-programmer/project/([^/]+)/template$", path)
+        if method == "POST" and match:
+            names = [template["name"] for template in list(dnac.templates.values())]
+            if body.get("name") in names:
+                return self.send(
+                    202, dnac.startTask(error="Template name already exists")
+                )
+            template_id = str(uuid.uuid4())
+            dnac.templates[template_id] = body
+            return self.send(202, dnac.startTask(template_id))
+        if method == "PUT" and path == f"{API}/template-programmer/template":
+            if body.get("id") not in dnac.templates:
+                return self.send(404, {"message": "Template not found"})
+            dnac.templates[body["id"]] = body
+            return self.send(202, dnac.startTask(body["id"]))
+        if method == "POST" and path == f"{API}/template-programmer/template/version":
+            return self.send(202, dnac.startTask(body.get("templateId", "")))
+        if method == "POST" and path == f"{API}/template-programmer/template/deploy":
+            if body.get("templateId") not in dnac.templates:
+                return self.send(
+                    202, {"deploymentId": "Template not found", "status": "FAILURE"}
+                )
+            deploy_id = str(uuid.uuid4())
+            dnac.deployments[deploy_id] = {
+                "started": time(),
+                "targets": body.get("targetInfo") or [],
+            }
+            return self.send(
+                202,
+                {
+                    "deploymentId": (
+                        f"Deployment of template {body['templateId']} : {deploy_id}"
+                    ),
+                    "status": "IN_PROGRESS",
+                },
+            )
+        match = re.match(
+            f"{API}/template-programmer/template/deploy/status/([^/]+)$", path
+        )
+        if method == "GET" and match:
+            status = dnac.getDeploymentStatus(match.group(1))
+            if not status:
+                return self.send(404, {"message": "Deployment not found"})
+            return self.send(200, status)
+        match = re.match(f"{API}/template-programmer/template/([^/]+)$", path)
+        if method == "DELETE" and match:
+            if not dnac.templates.pop(match.group(1), None):
+                return self.send(404, {"message": "Template not found"})
+            return self.send(200, dnac.startTask())
+        match = re.match(f"{API}/task/([^/]+)$", path)
+        if method == "GET" and match:
+            task = dnac.getTask(match.group(1))
+            if not task:
+                return self.send(404, {"message": "Task not found"})
+            return self.send(200, {"response": task})
+        return self.send(404, {"message": f"Unknown endpoint {method} {path}"})
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_PUT(self):
+        self.handle_request("PUT")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+
+def parseArgs(argv: list = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Fake Catalyst Center")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9443)
+    parser.add_argument("--devices", type=int, default=1000, help="Inventory size")
+    parser.add_argument(
+        "--stack-members", type=int, default=2, help="48 port members per switch"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.1, help="Mean seconds per API request"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0,
+        help="Fraction of requests failing with 500",
+    )
+    parser.add_argument(
+        "--rate-limit-rate",
+        type=float,
+        default=0,
+        help="Fraction of requests rejected with 429",
+    )
+    parser.add_argument(
+        "--task-seconds",
+        type=float,
+        default=0.5,
+        help="Time for template tasks to complete",
+    )
+    parser.add_argument(
+        "--deploy-seconds",
+        type=float,
+        default=3,
+        help="Time for deployments to complete",
+    )
+    return parser.parse_args(argv)
+
+
+def serve(args: argparse.Namespace) -> ThreadingHTTPServer:
+    """
+    Create fake Catalyst Center server, call serve_forever() to start handling requests
+    """
+    # Each server has its own handler class, so several may be served by one process
+    handler = type("Handler", (Handler,), {"dnac": FakeDNAC(args)})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    args = parseArgs()
+    print(
+        f"Fake Catalyst Center with {args.devices} devices "
+        f"on http://{args.host}:{args.port}"
+    )
+    serve(args).serve_forever()
@@ -0,0 +1,165 @@
+""" Copyright (c) 2024 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+# Load test the web app with concurrent users, comparing throughput
+# as the number of gunicorn worker processes increases.
+#
+# Each simulated user logs in, searches for devices, selects the first few
+# results & opens the VLAN provisioning page. With --provision, each user
+# also deploys a VLAN - only use this against a lab or simulated Catalyst Center.
+#
+# Run from the repository root, with dna-servers.yaml & .env configured:
+#   python3 benchmarks/load_test.py --server <name> --username <user> --password <pass>
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from statistics import median
+from time import perf_counter, sleep
+
+import requests
+
+VLAN_PLAN = {
+    "0": {"vlan_id": "10", "vlan_name": "Users", "ports": "GigabitEthernet1/0/1"}
+}
+
+
+def startServer(
+    workers: int, threads: int, port: int, state_db: str
+) -> subprocess.Popen:
+    """
+    Start gunicorn with the given number of workers, and wait for it to accept requests
+    """
+    env = dict(
+        os.environ,
+        WEB_WORKERS=str(workers),
+        WEB_THREADS=str(threads),
+        WEB_BIND=f"127.0.0.1:{port}",
+        STATE_DB=state_db,
+        SECRET_KEY=os.getenv("SECRET_KEY", "load-test"),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app:app"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            requests.get(f"http://127.0.0.1:{port}/login", timeout=5)
+            return server
+        except requests.RequestException:
+            sleep(0.1)
+    server.terminate()
+    raise RuntimeError("gunicorn did not start")
+
+
+def runUser(base_url: str, args: argparse.Namespace, user: int = 0) -> dict:
+    """
+    Run one user's workflow, returning seconds spent on each step
+    """
+    timings = {}
+    web = requests.Session()
+
+    def step(name: str, method: str, path: str, **kwargs) -> requests.Response:
+        start = perf_counter()
+        response = web.request(method, base_url + path, **kwargs)
+        timings[name] = perf_counter() - start
+        response.raise_for_status()
+        return response
+
+    step(
+        "login",
+        "POST",
+        "/login",
+        data={
+            "server": args.server,
+            "username": args.username.format(user=user),
+            "password": args.password,
+        },
+    )
+    page = step("search", "POST", "/select-device", data={"device-filter": args.filter})
+    targets = re.findall(r'name="target-device" value="([^"]+)">', page.text)
+    if not targets:
+        raise RuntimeError(f"No devices found matching '{args.filter}'")
+    step(
+        "select",
+        "POST",
+        "/select-device",
+        data={"target-device": targets[: args.devices]},
+    )
+    if args.provision:
+        step("provision", "POST", "/vlan-provision", json=VLAN_PLAN)
+        step("status", "GET", "/status")
+    return timings
+
+
+def runLoad(base_url: str, args: argparse.Namespace) -> tuple:
+    """
+    Run all users concurrently, returning (workflow timings, total seconds)
+    """
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as executor:
+        results = list(
+            executor.map(lambda user: runUser(base_url, args, user), range(args.users))
+        )
+    return results, perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the web app")
+    parser.add_argument(
+        "--server", required=True, help="Server name in dna-servers.yaml"
+    )
+    parser.add_argument(
+        "--username",
+        required=True,
+        help="May include {user}, replaced by the number of each simulated user",
+    )
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--filter", default="", help="Device search string")
+    parser.add_argument("--devices", type=int, default=4, help="Devices per user")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent users")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, default=1, help="Threads per worker")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--provision", action="store_true", help="Deploy a VLAN")
+    args = parser.parse_args()
+
+    print(
+        f"{'workers':>8} {'users':>6} {'seconds':>8} {'users/s':>8} "
+        f"{'p50 s':>7} {'max s':>7}"
+    )
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as state_dir:
+            server = startServer(
+                workers, args.threads, args.port, os.path.join(state_dir, "state.db")
+            )
+            try:
+                base_url = f"http://127.0.0.1:{args.port}"
+                # Warm up the shared inventory, so each run measures the same work
+                runUser(base_url, args)
+                results, seconds = runLoad(base_url, args)
+            finally:
+                server.terminate()
+                server.wait()
+        totals = sorted(sum(timings.values()) for timings in results)
+        print(
+            f"{workers:>8} {args.users:>6} {seconds:>8.2f} "
+            f"{args.users / seconds:>8.2f} {median(totals):>7.2f} {totals[-1]:>7.2f}"
+        )
@@ -0,0 +1,153 @@
+""" Copyright (c) 2024 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+# Benchmark the VLAN provisioning page for a 400 port switch stack
+# (8 members with 48 access ports & 2 uplinks each).
+#
+# Compares rendering all interfaces in a single list with grouping them by
+# stack member & module, and assigning every port to a VLAN by listing each
+# interface vs with port ranges. Also checks both assign the same ports.
+#
+# Run from the repository root:
+#   python3 benchmarks/render_interfaces.py
+
+import json
+import os
+import sys
+from statistics import median
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DNA_SERVERS_FILE", "example_dna-servers.yaml")
+os.environ.setdefault("WARMUP", "false")
+
+import app  # noqa: E402
+
+RUNS = 20
+MEMBERS = 8
+TARGETS = {
+    "10.0.0.1": {
+        "name": "stack-01",
+        "platform": "C9300-48P",
+        "location": "Global/Site/Building",
+    }
+}
+
+
+def buildInterfaces() -> dict:
+    """
+    Build interface model of a 400 port stack, as returned by getInterfaces()
+    """
+    interfaces = {}
+    for member in range(1, MEMBERS + 1):
+        for port in range(1, 49):
+            interfaces[f"GigabitEthernet{member}/0/{port}"] = {
+                "id": f"{member}-0-{port}",
+                "speed": 1000000,
+                "vlan": "1",
+            }
+        for port in range(1, 3):
+            interfaces[f"TenGigabitEthernet{member}/1/{port}"] = {
+                "id": f"{member}-1-{port}",
+                "speed": 10000000,
+                "vlan": "1",
+            }
+    return interfaces
+
+
+def timeRun(func) -> tuple:
+    """
+    Run func RUNS times, returning (result, median seconds)
+    """
+    timings = []
+    for _ in range(RUNS):
+        start = perf_counter()
+        result = func()
+        timings.append(perf_counter() - start)
+    return result, median(timings)
+
+
+def renderPage(groups: list) -> str:
+    with app.app.test_request_context("/vlan-provision"):
+        return app.render_template(
+            "vlan-provision.html",
+            targets=TARGETS,
+            dnac=app.dnac_config,
+            interface_groups=groups,
+        )
+
+
+def countVisible(groups: list) -> int:
+    """
+    Interfaces shown when the page loads - only single groups are expanded
+    """
+    return sum(len(group["interfaces"]) for group in groups) if len(groups) == 1 else 0
+
+
+if __name__ == "__main__":
+    interfaces = buildInterfaces()
+    print(f"{len(interfaces)} interfaces, {MEMBERS} stack members")
+
+    print(f"{'layout':>8} {'render ms':>10} {'html KB':>8} {'nodes':>6} {'visible':>8}")
+    layouts = {
+        "list": lambda: [
+            {"label": "All", "ranges": [], "interfaces": list(interfaces.items())}
+        ],
+        "grouped": lambda: app.groupInterfaces(interfaces),
+    }
+    for layout, build in layouts.items():
+        html, seconds = timeRun(lambda: renderPage(build()))
+        groups = build()
+        print(
+            f"{layout:>8} {seconds * 1000:>10.3f} {len(html) / 1024:>8.1f} "
+            f"{html.count('draggable=') + html.count('<details'):>6} "
+            f"{countVisible(groups):>8}"
+        )
+
+    # Assign every port to one VLAN, as posted by the provisioning page
+    plans = {
+        "ports": {
+            "0": {"vlan_id": "10", "vlan_name": "Users", "ports": "\n".join(interfaces)}
+        },
+        "ranges": {
+            "0": {
+                "vlan_id": "10",
+                "vlan_name": "Users",
+                "ports": "",
+                "ranges": f"1-{MEMBERS}/0/1-48, Te1-{MEMBERS}/1/1-2",
+            }
+        },
+    }
+    print(f"{'assign':>8} {'expand ms':>10} {'body B':>8} {'ports':>6}")
+    assigned = {}
+    for mode, plan in plans.items():
+        vlans = [
+            {
+                "vlan_id": vlan["vlan_id"],
+                "vlan_name": vlan["vlan_name"],
+                "ports": vlan["ports"].split()
+                + vlan.get("ranges", "").replace(",", " ").split(),
+            }
+            for vlan in plan.values()
+        ]
+        (config, error), seconds = timeRun(
+            lambda: app.getDeviceVLANConfig(vlans, interfaces)
+        )
+        assert not error, error
+        assigned[mode] = set(config["0"]["ports"].split("\n"))
+        print(
+            f"{mode:>8} {seconds * 1000:>10.3f} {len(json.dumps(plan)):>8} "
+            f"{len(assigned[mode]):>6}"
+        )
+    assert assigned["ports"] == assigned["ranges"], "Port ranges assign different ports"
@@ -0,0 +1,104 @@
+""" Copyright (c) 2024 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+# Benchmark template payload rendering, per-port vs interface ranges.
+# Also checks that both modes configure exactly the same ports & VLANs.
+#
+# Run from the repository root:
+#   python3 benchmarks/render_payload.py
+
+import os
+import re
+import sys
+from statistics import median
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DNA_SERVERS_FILE", "example_dna-servers.yaml")
+
+import app  # noqa: E402
+
+RUNS = 50
+
+
+def buildPlan(port_count: int) -> dict:
+    """
+    Build VLAN plan assigning port_count ports, 48 per stack member,
+    split across two VLANs in contiguous blocks
+    """
+    ports = [
+        f"GigabitEthernet{(i // 48) + 1}/0/{(i % 48) + 1}" for i in range(port_count)
+    ]
+    half = max(1, port_count // 2)
+    plan = {
+        "0": {"vlan_id": "10", "vlan_name": "Users", "ports": "\n".join(ports[:half])}
+    }
+    if ports[half:]:
+        plan["1"] = {
+            "vlan_id": "20",
+            "vlan_name": "Voice",
+            "ports": "\n".join(ports[half:]),
+        }
+    return plan
+
+
+def expandPayload(payload: str) -> set:
+    """
+    Return set of (interface, vlan) assignments configured by a payload
+    """
+    assignments = set()
+    for stanza in payload.split("\n!\n"):
+        lines = stanza.splitlines()
+        if not lines[0].startswith("interface "):
+            continue
+        vlan = re.search(r"switchport access vlan (\d+)", stanza).group(1)
+        name = lines[0][len("interface ") :]
+        if not name.startswith("range "):
+            assignments.add((name, vlan))
+            continue
+        for interface_range in name[len("range ") :].split(" , "):
+            first, _, last = interface_range.partition(" - ")
+            prefix, start = re.match(r"^(.*\D)(\d+)$", first).groups()
+            for number in range(int(start), int(last or start) + 1):
+                assignments.add((f"{prefix}{number}", vlan))
+    return assignments
+
+
+def timeRender(plan: dict, port_ranges: bool) -> tuple:
+    """
+    Render plan RUNS times, returning (payload, median seconds)
+    """
+    timings = []
+    for _ in range(RUNS):
+        start = perf_counter()
+        payload = app.renderTemplatePayload(plan, port_ranges)
+        timings.append(perf_counter() - start)
+    return payload, median(timings)
+
+
+if __name__ == "__main__":
+    print(f"{'ports':>6} {'mode':>6} {'bytes':>8} {'lines':>6} {'render ms':>10}")
+    for port_count in (1, 48, 384):
+        plan = buildPlan(port_count)
+        per_port, per_port_time = timeRender(plan, False)
+        ranges, ranges_time = timeRender(plan, True)
+        assert expandPayload(per_port) == expandPayload(ranges), "Payloads differ"
+        for mode, payload, seconds in (
+            ("port", per_port, per_port_time),
+            ("range", ranges, ranges_time),
+        ):
+            print(
+                f"{port_count:>6} {mode:>6} {len(payload):>8} "
+                f"{len(payload.splitlines()):>6} {seconds * 1000:>10.3f}"
+            )
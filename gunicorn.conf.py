@@ -0,0 +1,57 @@
+""" Copyright (c) 2024 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+# Gunicorn settings for running the web app in production:
+#   gunicorn app:app
+
+import os
+import tempfile
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = os.getenv("WEB_BIND", "0.0.0.0:5000")
+# Each worker process handles requests on a pool of threads, so a slow
+# provisioning request doesn't block other users. Status updates are long-polled,
+# so each poll only holds a thread for up to LONG_POLL_TIMEOUT seconds
+worker_class = "gthread"
+workers = int(os.getenv("WEB_WORKERS", "2"))
+threads = int(os.getenv("WEB_THREADS", "8"))
+# Provisioning a large number of devices may take a while
+timeout = 300
+accesslog = "-"
+
+# Worker processes share device inventory, template hashes & deployment status
+# through a SQLite database. Workers inherit this environment from the master process
+if workers > 1:
+    os.environ.setdefault("STATE_DB", "state.db")
+    # Each worker writes metrics to this directory, so /metrics reports on all workers
+    os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="prometheus-")
+    )
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    # Background threads are started in each worker, once it has loaded the app
+    from app import startBackgroundWork
+
+    startBackgroundWork()
@@ -42,11 +42,8 @@ function onDropItem(event) {
 /*
    VLAN FORM SUBMISSION
 */
-var vlanform = document.getElementById("vlan-form");
-vlanform.addEventListener("submit", (e) => {
-    // Manual form submit so we can loop over table rows
-    e.preventDefault();
-
+function getFormData() {
+    // Collect VLANs & ports from table rows, or return null if not valid
     var vlan_table = document.getElementById("table-body");
     var form_data = {};
 
@@ -60,18 +57,33 @@ vlanform.addEventListener("submit", (e) => {
         // Validate VLAN name
         if (/^[a-zA-Z0-9\-\_]+$/.test(row_data["vlan_name"]) == false) {
             alert("VLAN name can only contain alphanumeric characters, dashes, or underscores.")
-            return
+            return null
         }
         var ports = row.querySelector("div[id='tagged-ports']");
         row_data["ports"] = ports.innerText;
+        // Port ranges are expanded into interfaces by the server
+        var ranges = row.querySelector("input[id='port-ranges']");
+        row_data["ranges"] = ranges.value;
         // Check for empty port list & return error
-        if (row_data["ports"].length == 0) {
+        if (row_data["ports"].trim().length == 0 && row_data["ranges"].trim().length == 0) {
             alert("Cannot apply VLAN with no ports assigned.")
-            return
+            return null
         }
         // Append to form data dict
         form_data[i] = row_data;
     }
+    return form_data;
+}
+
+var vlanform = document.getElementById("vlan-form");
+vlanform.addEventListener("submit", (e) => {
+    // Manual form submit so we can loop over table rows
+    e.preventDefault();
+
+    var form_data = getFormData();
+    if (!form_data) {
+        return
+    }
 
     // Disable submit button & pop loading wheel
     button = document.getElementById("submit");
@@ -92,6 +104,13 @@ vlanform.addEventListener("submit", (e) => {
     // Send request to Flask & redirect to /status on completion
     const request = new XMLHttpRequest();
     request.onload = function () {
+        if (request.status == 400) {
+            // Invalid VLANs or port ranges, nothing was deployed
+            alert(JSON.parse(request.responseText)["errors"].join("\n"));
+            submit_section.removeChild(loader_div);
+            button.disabled = false;
+            return
+        }
         window.location.replace("/status");
 
     }
@@ -101,6 +120,61 @@ vlanform.addEventListener("submit", (e) => {
 });
 
 
+/*
+   VLAN FORM - PREVIEW CHANGES
+*/
+function preview_changes() {
+    var form_data = getFormData();
+    if (!form_data) {
+        return
+    }
+    var preview = document.getElementById("preview");
+    preview.innerText = "Comparing with running config...";
+
+    const request = new XMLHttpRequest();
+    request.onload = function () {
+        if (request.status == 400) {
+            preview.innerText = JSON.parse(request.responseText)["errors"].join("\n");
+            return
+        }
+        if (request.status != 200) {
+            preview.innerText = "Could not preview changes.";
+            return
+        }
+        preview.innerText = "";
+        JSON.parse(request.responseText)["devices"].forEach((device) => {
+            var heading = document.createElement("b");
+            heading.innerText = device.name + " (" + device.ip + ")";
+            preview.appendChild(heading);
+            var lines = [];
+            if (device.changes == null) {
+                lines.push("Running config unavailable, all VLANs & ports will be deployed.");
+            } else {
+                device.changes.vlans.forEach((vlan) => {
+                    lines.push("+ VLAN " + vlan.vlan_id + " " + vlan.vlan_name +
+                        (vlan.current ? " (currently " + vlan.current + ")" : ""));
+                });
+                device.changes.ports.forEach((port) => {
+                    lines.push("~ " + port.port + ": " + port.current + " -> VLAN " + port.vlan_id);
+                });
+                if (device.changes.unchanged) {
+                    lines.push(device.changes.unchanged + " port(s) already configured");
+                }
+                if (!device.payload) {
+                    lines.push("No changes needed, device will be skipped.");
+                }
+            }
+            var details = document.createElement("pre");
+            details.innerText = lines.join("\n");
+            preview.appendChild(details);
+        });
+    }
+    request.open("POST", "/vlan-provision/preview", true);
+    request.setRequestHeader('Content-Type', 'application/json; charset=UTF-8');
+    request.send(JSON.stringify(form_data));
+}
+
+
 /*
    VLAN FORM - ADD/REMOVE ROWS
 */
@@ -166,8 +240,18 @@ function add_vlan() {
     vlan_ports_div.setAttribute("id", "tagged-ports");
     vlan_ports_div.setAttribute("name", "tagged-ports");
 
+    var vlan_ranges_div = document.createElement("div");
+    vlan_ranges_div.setAttribute("class", "form-group__text")
+    var vlan_ranges_input = document.createElement("input");
+    vlan_ranges_input.setAttribute("type", "text");
+    vlan_ranges_input.setAttribute("id", "port-ranges");
+    vlan_ranges_input.setAttribute("name", "port-ranges");
+    vlan_ranges_input.setAttribute("placeholder", "Port ranges, e.g. 3/0/1-48");
+
     row.appendChild(vlan_ports_cell);
     vlan_ports_cell.appendChild(vlan_ports_div);
+    vlan_ports_cell.appendChild(vlan_ranges_div);
+    vlan_ranges_div.appendChild(vlan_ranges_input);
 
     // Create row remove button
     var remove_cell = document.createElement("td");
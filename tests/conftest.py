@@ -0,0 +1,89 @@
+""" Copyright (c) 2024 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+# Tests run the web app against fake Catalyst Centers from benchmarks/fake_dnac.py,
+# served in this process. App settings are read when it is imported, so the fakes
+# are started & configured before any test imports the app.
+#
+# Run from the repository root:
+#   python3 -m pytest tests
+
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import fake_dnac  # noqa: E402
+
+# Mean seconds per API request to the "fake" server
+LATENCY = 0.2
+# Fake servers by name in dna-servers.yaml, with fake_dnac.py options
+FAKE_SERVERS = {
+    "fake": ["--devices=100", f"--latency={LATENCY}"],
+    "large": ["--devices=10000", "--latency=0"],
+}
+
+
+def startFakeServer(options: list) -> str:
+    """
+    Serve a fake Catalyst Center on a free port, returning its address
+    """
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = fake_dnac.serve(fake_dnac.parseArgs([f"--port={port}", *options]))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{port}"
+
+
+config_dir = tempfile.mkdtemp(prefix="dnac-tests-")
+servers_file = os.path.join(config_dir, "dna-servers.yaml")
+with open(servers_file, "w") as config:
+    json.dump(
+        {
+            "servers": {
+                name: {"alias": name.title(), "address": startFakeServer(options)}
+                for name, options in FAKE_SERVERS.items()
+            },
+            "templates": {"project": "Tests", "template": "tests"},
+        },
+        config,
+    )
+os.environ.update(
+    DNA_SERVERS_FILE=servers_file,
+    JOB_DB=os.path.join(config_dir, "deployments.db"),
+    SECRET_KEY="tests",
+    LOG_LEVEL="WARNING",
+    WARMUP="false",
+    DETAIL_CONCURRENCY="50",
+    # Tests measure the app's own concurrency, so don't rate limit calls to the fakes
+    DNAC_RATE_LIMIT="10000",
+    DNAC_RATE_BURST="10000",
+)
+os.chdir(ROOT)
+
+
+@pytest.fixture(scope="session")
+def webapp():
+    import app
+
+    return app
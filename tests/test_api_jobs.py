@@ -0,0 +1,207 @@
+""" Copyright (c) 2024 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+# API jobs are checked against the cached inventory & interfaces when posted.
+# Interfaces not cached & running config are only retrieved from Catalyst Center
+# by the job worker
+
+import threading
+from time import perf_counter, sleep
+
+import pytest
+
+HEADERS = {"Authorization": "Bearer token"}
+# Allowance for request handling, in seconds
+OVERHEAD = 0.5
+
+
+@pytest.fixture
+def api(webapp, monkeypatch):
+    monkeypatch.setattr(webapp, "API_TOKENS", {"token": "api-client"})
+    monkeypatch.setattr(webapp, "DNAC_USER", "service")
+    monkeypatch.setattr(webapp, "DNAC_PASS", "password")
+    return webapp.app.test_client()
+
+
+def postPlan(api, devices: list):
+    return api.post(
+        "/api/v1/deployments",
+        json={
+            "server": "fake",
+            "devices": [
+                {
+                    "device": device,
+                    "vlans": [{"vlan_id": 10, "vlan_name": "Users", **vlan}],
+                }
+                for device, vlan in devices
+            ],
+        },
+        headers=HEADERS,
+    )
+
+
+def waitForJob(api, job_id: str) -> dict:
+    for _ in range(100):
+        job = api.get(f"/api/v1/deployments/{job_id}", headers=HEADERS).get_json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        sleep(0.1)
+    raise AssertionError(f"Job {job_id} is still {job['status']}")
+
+
+def getDevice(webapp, name: str):
+    dnac = webapp.getDNACClient(webapp.getServerURL("fake"), "service", "password")
+    webapp.getInventory("fake", dnac)
+    webapp.waitForInventory("fake")
+    devices = webapp.inventory["fake"]["devices"].values()
+    return dnac, next(device for device in devices if device.name == name)
+
+
+def test_invalid_devices_rejected(api):
+    response = postPlan(
+        api, [("sw-missing", {"ports": []}), ("sw-00001", {"vlan_id": 5000})]
+    )
+    assert response.status_code == 422
+    errors = {
+        device["device"]: device["error"] for device in response.get_json()["devices"]
+    }
+    assert errors == {
+        "sw-missing": "Device not found",
+        "sw-00001": "Invalid VLAN ID 5000",
+    }
+
+
+def test_ports_checked_by_job_worker(api, webapp, monkeypatch):
+    lookups = []
+    getInterfaces = webapp.getInterfaces
+
+    def recordLookup(dnac, devices):
+        lookups.append(threading.current_thread().name)
+        return getInterfaces(dnac, devices)
+
+    monkeypatch.setattr(webapp, "getInterfaces", recordLookup)
+    for name in ("sw-00002", "sw-00003"):
+        _, device = getDevice(webapp, name)
+        webapp.shared_store.delete("device_interfaces", device.id)
+    response = postPlan(
+        api,
+        [
+            ("sw-00002", {"ports": ["GigabitEthernet1/0/2"]}),
+            ("sw-00003", {"ports": ["GigabitEthernet9/0/1"]}),
+        ],
+    )
+    assert response.status_code == 202
+    job = waitForJob(api, response.get_json()["job_id"])
+
+    assert lookups and all(name.startswith("api-jobs") for name in lookups)
+    devices = {device["name"]: device for device in job["devices"]}
+    assert devices["sw-00003"]["status"] == "fail"
+    assert "GigabitEthernet9/0/1" in devices["sw-00003"]["error"]
+    assert devices["sw-00002"]["status"] != "fail"
+
+
+def test_cached_ports_checked_when_posted(api, webapp):
+    dnac, device = getDevice(webapp, "sw-00005")
+    webapp.refreshInterfaces(dnac, device)
+    response = postPlan(api, [("sw-00005", {"ports": ["GigabitEthernet9/0/1"]})])
+    assert response.status_code == 422
+    [error] = response.get_json()["devices"]
+    assert error["device"] == "sw-00005"
+    assert "GigabitEthernet9/0/1" in error["error"]
+
+    response = postPlan(api, [("sw-00005", {"ports": ["GigabitEthernet1/0/5"]})])
+    assert response.status_code == 202
+    waitForJob(api, response.get_json()["job_id"])
+
+
+def test_device_found_while_inventory_loads(api, webapp, monkeypatch):
+    # Reload the inventory from scratch, one small page at a time
+    webapp.inventory.pop("fake", None)
+    webapp.shared_store.delete("inventory", "fake")
+    monkeypatch.setattr(webapp, "INVENTORY_PAGE_SIZE", 10)
+    response = postPlan(api, [("sw-00098", {"ports": ["GigabitEthernet1/0/3"]})])
+    assert response.status_code == 202, response.get_json()
+    assert not webapp.isInventoryLoading("fake")
+    waitForJob(api, response.get_json()["job_id"])
+
+
+def test_retry_while_inventory_loads(api, webapp, monkeypatch):
+    webapp.inventory.pop("fake", None)
+    webapp.shared_store.delete("inventory", "fake")
+    monkeypatch.setattr(webapp, "INVENTORY_PAGE_SIZE", 10)
+    monkeypatch.setattr(webapp, "FEDERATED_TIMEOUT", 0.1)
+    response = postPlan(api, [("sw-00098", {"ports": ["GigabitEthernet1/0/3"]})])
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    webapp.waitForInventory("fake")
+
+
+def test_job_not_active_if_not_saved(webapp, monkeypatch):
+    def failSave(job):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(webapp.job_store, "saveJob", failSave)
+    active_jobs = set(webapp.active_jobs)
+    with pytest.raises(OSError):
+        webapp.queueJob("api-client", {})
+    assert webapp.active_jobs == active_jobs
+
+
+def test_results_long_poll(api, webapp, monkeypatch):
+    monkeypatch.setattr(webapp, "LONG_POLL_TIMEOUT", 0.5)
+    response = postPlan(api, [("sw-00004", {"ports": ["GigabitEthernet1/0/4"]})])
+    job_id = response.get_json()["job_id"]
+    results = api.get(f"/api/v1/deployments/{job_id}/results", headers=HEADERS)
+    version = results.get_json()["version"]
+
+    # Each poll returns once results change, or after LONG_POLL_TIMEOUT
+    for _ in range(100):
+        if results.get_json()["status"] in ("success", "fail"):
+            break
+        start = perf_counter()
+        results = api.get(
+            f"/api/v1/deployments/{job_id}/results",
+            query_string={"version": version},
+            headers=HEADERS,
+        )
+        assert perf_counter() - start < webapp.LONG_POLL_TIMEOUT + OVERHEAD
+        version = results.get_json()["version"]
+    assert results.get_json()["devices"][0]["name"] == "sw-00004"
+
+
+def test_long_poll_reads_outside_condition(webapp, monkeypatch):
+    monkeypatch.setattr(webapp, "LONG_POLL_TIMEOUT", 5)
+    monkeypatch.setattr(webapp, "TRACKER_INTERVAL", 5)
+    versions = iter(["1", "2"])
+    locked = []
+
+    def notify():
+        # Stands in for the tracker, which can't update while the condition is held
+        if not webapp.deployments_changed.acquire(blocking=False):
+            locked.append(True)
+            return
+        webapp.notifyDeploymentsChanged()
+        webapp.deployments_changed.release()
+
+    def getUpdate():
+        tracker = threading.Thread(target=notify)
+        tracker.start()
+        tracker.join()
+        return {"version": next(versions)}
+
+    # The change notified while reading the first update isn't missed
+    start = perf_counter()
+    assert webapp.waitForChange(getUpdate, "1") == {"version": "2"}
+    assert perf_counter() - start < OVERHEAD
+    assert not locked
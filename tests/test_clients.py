@@ -0,0 +1,93 @@
+""" Copyright (c) 2024 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+# Shared DNAC clients hold user credentials, so they're only kept while needed
+
+import pytest
+
+
+def getUsernames(webapp) -> set:
+    with webapp.dnac_clients_lock:
+        return {username for _, username, _ in webapp.dnac_clients}
+
+
+def login(webapp, username: str):
+    client = webapp.app.test_client()
+    response = client.post(
+        "/login", data={"server": "fake", "username": username, "password": "password"}
+    )
+    assert response.status_code == 302
+    return client
+
+
+def test_logout_forgets_client(webapp):
+    client = login(webapp, "single-user")
+    assert "single-user" in getUsernames(webapp)
+    client.get("/logout")
+    assert "single-user" not in getUsernames(webapp)
+
+
+def test_multiauth_login_client_not_shared(webapp, monkeypatch):
+    monkeypatch.setattr(webapp, "APP_MODE", "MULTIAUTH")
+    monkeypatch.setattr(webapp, "DNAC_USER", "service")
+    monkeypatch.setattr(webapp, "DNAC_PASS", "password")
+    client = login(webapp, "multi-user")
+    assert "multi-user" not in getUsernames(webapp)
+    client.get("/logout")
+
+
+def test_idle_clients_removed(webapp):
+    url = webapp.getServerURL("fake")
+    webapp.getDNACClient(url, "idle-user", "password")
+    with webapp.dnac_clients_lock:
+        entry = webapp.dnac_clients[webapp.getClientKey(url, "idle-user", "password")]
+        entry["used"] -= webapp.TOKEN_LIFETIME + 1
+    webapp.getDNACClient(url, "active-user", "password")
+    assert "idle-user" not in getUsernames(webapp)
+    assert "active-user" in getUsernames(webapp)
+
+
+def test_reaper_uses_template_author(webapp, monkeypatch):
+    monkeypatch.setattr(webapp, "DNAC_USER", None)
+    monkeypatch.setattr(webapp, "DNAC_PASS", None)
+    url = webapp.getServerURL("fake")
+    author = webapp.getDNACClient(url, "author", "password")
+    webapp.getDNACClient(url, "other-user", "password")
+    assert webapp.getTrackerClient(url, "author") is author
+    assert webapp.getTrackerClient(url, "logged-out-user") is None
+    assert webapp.getTrackerClient(url, None) is None
+
+
+def test_background_work_forgets_logged_out_client(webapp, monkeypatch):
+    monkeypatch.setattr(webapp, "DNAC_USER", None)
+    monkeypatch.setattr(webapp, "DNAC_PASS", None)
+    client = login(webapp, "leaving-user")
+    client.post("/select-device", data={"device-filter": "sw-"})
+    assert webapp.inventory["fake"]["username"] == "leaving-user"
+    client.get("/logout")
+
+    # Nothing keeps the departed user's client for the inventory refresh
+    assert "client" not in webapp.inventory["fake"]
+    assert webapp.getTrackerClient(webapp.getServerURL("fake"), "leaving-user") is None
+    with pytest.raises(RuntimeError):
+        webapp.refreshInventory("fake")
+
+
+def test_service_account_preferred(webapp, monkeypatch):
+    monkeypatch.setattr(webapp, "DNAC_USER", "service")
+    monkeypatch.setattr(webapp, "DNAC_PASS", "password")
+    url = webapp.getServerURL("fake")
+    webapp.getDNACClient(url, "some-user", "password")
+    dnac = webapp.getTrackerClient(url, "some-user")
+    assert webapp.getClientUsername(dnac) == "service"
@@ -0,0 +1,49 @@
+""" Copyright (c) 2024 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+# Device search against a fake Catalyst Center with 10,000 switches: the inventory
+# is loaded in pages, and every device can be reached by scrolling search results
+
+import re
+from time import sleep
+
+DEVICES = 10000
+
+
+def test_every_device_reachable_through_results(webapp):
+    client = webapp.app.test_client()
+    response = client.post(
+        "/login", data={"server": "large", "username": "tests", "password": "password"}
+    )
+    assert response.status_code == 302
+    response = client.post("/select-device", data={"device-filter": "sw-"})
+    assert response.status_code == 200
+    for _ in range(600):
+        if not webapp.isInventoryLoading("large"):
+            break
+        sleep(0.1)
+    assert not webapp.isInventoryLoading("large")
+
+    found = []
+    offset = 0
+    while True:
+        page = client.get(f"/select-device/results?offset={offset}").get_json()
+        found.extend(re.findall(r'name="target-device" value="([^"]+)"', page["rows"]))
+        if page["offset"] == offset:
+            break
+        offset = page["offset"]
+
+    assert page["total"] == DEVICES
+    assert len(found) == DEVICES
+    assert len(set(found)) == DEVICES
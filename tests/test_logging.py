@@ -0,0 +1,22 @@
+""" Copyright (c) 2024 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+# Trace IDs of provisioning runs are only logged by the request that started the run
+
+
+def test_trace_id_cleared_after_request(webapp):
+    with webapp.app.test_request_context("/vlan-provision", method="POST"):
+        webapp.g.trace_token = webapp.trace_id.set("run-1")
+        assert webapp.trace_id.get() == "run-1"
+    assert webapp.trace_id.get() is None
@@ -0,0 +1,56 @@
+""" Copyright (c) 2024 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+# Interface range payloads configure exactly the same ports & VLANs as per-port
+# payloads, and per-port payloads are unchanged from rendering each VLAN & port
+# template separately
+
+import pytest
+from render_payload import buildPlan, expandPayload
+
+
+def renderSeparately(webapp, plan: dict) -> str:
+    """
+    Render a payload one template at a time, as the app did before rendering
+    it in a single pass: all VLANs, then all ports, separated by "!"
+    """
+    vlan_template = webapp.conf_templates.get_template("vlan.jinja2")
+    port_template = webapp.conf_templates.get_template("port.jinja2")
+    vlan_config = []
+    port_config = []
+    for entry in plan.values():
+        vlan_config.append(
+            vlan_template.render(vlan_id=entry["vlan_id"], vlan_name=entry["vlan_name"])
+        )
+        for port in entry["ports"].split("\n"):
+            port_config.append(
+                port_template.render(interface_name=port, vlan_id=entry["vlan_id"])
+            )
+    return "\n!\n".join(vlan_config + port_config)
+
+
+@pytest.mark.parametrize("port_count", [1, 48, 384])
+def test_ranges_configure_same_ports(webapp, port_count):
+    plan = buildPlan(port_count)
+    per_port = webapp.renderTemplatePayload(plan, False)
+    ranges = webapp.renderTemplatePayload(plan, True)
+
+    assert len(expandPayload(per_port)) == port_count
+    assert expandPayload(ranges) == expandPayload(per_port)
+
+
+@pytest.mark.parametrize("port_count", [1, 48, 384])
+def test_per_port_payload_unchanged(webapp, port_count):
+    plan = buildPlan(port_count)
+    assert webapp.renderTemplatePayload(plan, False) == renderSeparately(webapp, plan)
@@ -0,0 +1,57 @@
+""" Copyright (c) 2024 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+# Port ranges are expanded into the interfaces of a 4 member stack,
+# with 48 access ports & 2 network module ports on each member
+
+import pytest
+
+INTERFACES = {
+    name: {"id": name, "speed": 1000000, "vlan": "1"}
+    for member in range(1, 5)
+    for name in [f"GigabitEthernet{member}/0/{port}" for port in range(1, 49)]
+    + [f"GigabitEthernet{member}/1/{port}" for port in range(1, 3)]
+    + [f"TenGigabitEthernet{member}/1/{port}" for port in range(1, 3)]
+}
+
+
+def test_ranges_expand_to_interfaces(webapp):
+    assert len(webapp.expandPorts(["1-4/0/1-48"], INTERFACES)) == 192
+    assert webapp.expandPorts(["Te2/1/1-2", "Gi3/0/5"], INTERFACES) == [
+        "TenGigabitEthernet2/1/1",
+        "TenGigabitEthernet2/1/2",
+        "GigabitEthernet3/0/5",
+    ]
+
+
+@pytest.mark.parametrize(
+    "ports, error",
+    [
+        (["1/0/48-1"], "ends before it starts"),
+        (["4-1/0/1"], "ends before it starts"),
+        (["1/0/1-49"], "1 missing"),
+        (["1/1/1"], "may be any of"),
+        (["Port-channel1"], "Unknown or unavailable ports"),
+    ],
+)
+def test_invalid_ranges_rejected(webapp, ports, error):
+    with pytest.raises(ValueError, match=error):
+        webapp.expandPorts(ports, INTERFACES)
+
+
+def test_reversed_range_rejects_vlan(webapp):
+    vlans = [{"vlan_id": 10, "vlan_name": "Users", "ports": ["1/0/48-1"]}]
+    config, error = webapp.getDeviceVLANConfig(vlans, INTERFACES)
+    assert config is None
+    assert "ends before it starts" in error
@@ -0,0 +1,68 @@
+""" Copyright (c) 2024 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+# Provisioning different payloads at once uploads a template for each payload,
+# while deployments are still recorded under their author
+
+
+def buildDevice(webapp, name: str):
+    return webapp.Device(
+        id=name,
+        name=name,
+        platform="C9300-48P",
+        version="17.9.4",
+        reachability="Reachable",
+        family="Switches and Hubs",
+        series="Cisco Catalyst 9300 Series Switches",
+        lastUpdateTime=0,
+        lastupdate="",
+    )
+
+
+def test_payload_templates_keep_author(webapp, monkeypatch):
+    monkeypatch.setattr(webapp, "PARAMETERIZED_TEMPLATES", False)
+    dnac = webapp.getDNACClient(webapp.getServerURL("fake"), "tests", "password")
+    payloads = {
+        "vlan 10\n name Users": {
+            "params": None,
+            "devices": {"10.9.0.1": buildDevice(webapp, "author-sw-1")},
+        },
+        "vlan 20\n name Voice": {
+            "params": None,
+            "devices": {"10.9.0.2": buildDevice(webapp, "author-sw-2")},
+        },
+    }
+    webapp.provisionPayloads(dnac, "payload-author", payloads)
+
+    history = webapp.job_store.getHistory(author="payload-author")
+    assert {row["name"] for row in history} == {"author-sw-1", "author-sw-2"}
+    templates = webapp.job_store.db().execute(
+        "SELECT name FROM templates WHERE name LIKE ?", ("%-payload-author-%",)
+    )
+    assert len(templates.fetchall()) == 2
+
+
+def test_payload_params_returned_with_payload(webapp, monkeypatch):
+    monkeypatch.setattr(webapp, "PARAMETERIZED_TEMPLATES", True)
+    monkeypatch.setattr(webapp, "DIFF_CONFIG", False)
+    dnac = webapp.getDNACClient(webapp.getServerURL("fake"), "tests", "password")
+    devices = {"10.9.0.3": buildDevice(webapp, "params-sw-1")}
+    config = {
+        "0": {"vlan_id": "10", "vlan_name": "Users", "ports": "GigabitEthernet1/0/1"}
+    }
+    payloads = webapp.getDevicePayloads(dnac, devices, {"10.9.0.3": config})
+
+    (entry,) = payloads.values()
+    assert entry["devices"] == devices
+    assert entry["params"] == {"vlans": "10:Users", "ports": "GigabitEthernet1/0/1:10"}
@@ -0,0 +1,69 @@
+""" Copyright (c) 2024 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+# Concurrent device detail lookups: with calls taking LATENCY seconds,
+# looking up N devices with concurrency c should take about ceil(N / c) * LATENCY
+
+from math import ceil
+from time import perf_counter, sleep
+
+import pytest
+
+from conftest import LATENCY
+
+# Allowance for thread start up & request handling, in seconds
+OVERHEAD = 0.5
+
+
+@pytest.mark.parametrize("items, concurrency", [(40, 40), (40, 10), (20, 4)])
+def test_wall_clock_scales_with_batches(webapp, items, concurrency):
+    dnac = webapp.getDNACClient(webapp.getServerURL("fake"), "tests", "password")
+    dnac.devices.get_device_detail(identifier="uuid", search_by="warmup")
+
+    def getLocation(item: int) -> str:
+        detail = dnac.devices.get_device_detail(identifier="uuid", search_by=str(item))
+        return detail["response"]["location"]
+
+    start = perf_counter()
+    results = webapp.runConcurrently(getLocation, list(range(items)), concurrency, 5)
+    elapsed = perf_counter() - start
+
+    batches = ceil(items / concurrency)
+    assert len(results) == items
+    # Fake latency varies between 0.5 & 1.5 times LATENCY per call
+    assert 0.5 * LATENCY * batches <= elapsed <= 1.5 * LATENCY * batches + OVERHEAD
+
+
+def test_slow_call_only_delays_itself(webapp):
+    def lookup(item: int) -> int:
+        sleep(3 if item == 0 else 0.05)
+        return item
+
+    start = perf_counter()
+    results = webapp.runConcurrently(lookup, list(range(100)), 10, 1)
+    elapsed = perf_counter() - start
+
+    # 10 batches of 0.05s, plus the slow call's 1s timeout
+    assert elapsed < 1 + 10 * 0.05 + OVERHEAD
+    assert 0 not in results
+    assert len(results) == 99
+
+
+def test_no_timeout_waits_for_every_call(webapp):
+    def lookup(item: int) -> int:
+        sleep(1.5 if item == 0 else 0.05)
+        return item
+
+    results = webapp.runConcurrently(lookup, list(range(20)), 10, None)
+    assert sorted(results) == list(range(20))
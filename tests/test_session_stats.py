@@ -0,0 +1,27 @@
+""" Copyright (c) 2024 Cisco and/or its affiliates.
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+           https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+# Session sizes are reported by /cache-stats, measured for a sample of saved sessions
+
+
+def test_session_size_sampled(webapp):
+    client = webapp.app.test_client()
+    client.post(
+        "/login", data={"server": "fake", "username": "stats", "password": "password"}
+    )
+    measured = len(webapp.session_bytes)
+    for _ in range(webapp.SESSION_SIZE_SAMPLE * 2):
+        client.get("/cache-stats")
+    assert len(webapp.session_bytes) - measured == 2
+    assert client.get("/cache-stats").get_json()["session"]["bytes_p50"] > 0